@@ -1,25 +1,62 @@
 import streamlit as st
 import re
+import os
+import sys
+import argparse
 import io
+import csv
 import zipfile
 from pathlib import Path
 from datetime import datetime
 import hashlib
+import bisect
+import codecs
+import mmap
+import zlib
+import sqlite3
+import heapq
+import cProfile
+import pstats
+from contextlib import contextmanager
+try:
+    from re import _parser as sre_parse  # Python 3.11+
+except ImportError:
+    import sre_parse
+try:
+    import re2  # google-re2 (ไม่บังคับ) ใช้กับ rule ที่เสี่ยง backtracking
+except ImportError:
+    re2 = None
+try:
+    import yaml  # PyYAML (ไม่บังคับ) ใช้อ่าน rule pack แบบ YAML
+except ImportError:
+    yaml = None
 import requests
 from urllib.parse import urlparse, urljoin, quote
 import time
-from bs4 import BeautifulSoup
+import threading
+from concurrent.futures import (
+    ThreadPoolExecutor, ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+)
+from html.parser import HTMLParser
+from xml.etree import ElementTree
+try:
+    from lxml import etree as lxml_etree  # lxml (ไม่บังคับ) parser HTML ภาษา C สำหรับดึงลิงก์
+except ImportError:
+    lxml_etree = None
 import json
 import pandas as pd
-from collections import defaultdict
+import numpy as np
+from collections import defaultdict, deque
 import urllib3
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
-st.set_page_config(
-    page_title="PHP Site Scanner",
-    page_icon="🌐",
-    layout="wide"
-)
+# ตั้งค่าหน้าเว็บเฉพาะเมื่อรันผ่าน streamlit (โหมด command line ไม่มี runtime)
+if st.runtime.exists():
+    st.set_page_config(
+        page_title="PHP Site Scanner",
+        page_icon="🌐",
+        layout="wide"
+    )
 
 # ========== Malicious Patterns Database (เหมือนเดิม) ==========
 DANGEROUS_FUNCTIONS = {
@@ -86,10 +123,285 @@ COMMON_BACKDOOR_NAMES = [
     '1.php', '404.php', 'xx.php', 'a.php', 'test.php'
 ]
 
+# severity ของ finding จาก SUSPICIOUS_PATTERNS ตาม category (category อื่นเป็น 'medium')
+PATTERN_SEVERITIES = {'backdoor': 'high', 'webshell': 'high'}
+
+COMMON_PATHS = [
+    '/wp-admin/', '/wp-content/', '/wp-includes/',
+    '/admin/', '/administrator/', '/manager/',
+    '/includes/', '/inc/', '/lib/', '/libs/',
+    '/plugins/', '/modules/', '/themes/',
+    '/uploads/', '/upload/', '/files/',
+    '/api/', '/ajax/', '/cron/',
+    '/index.php', '/admin.php', '/login.php',
+    '/config.php', '/settings.php'
+]
+
+# ========== Timing & Profiling ==========
+
+class PhaseTimer:
+    """จับเวลาของงานหนึ่งชิ้น (หน้าเว็บหรือไฟล์) แยกตาม phase และต้นทุนต่อ rule
+    
+    phase ของการดึงไฟล์: rate_limit, request (DNS + TCP/TLS + รอ header), transfer (อ่าน body)
+    phase ของการสแกน: prefilter, tokenize, functions, patterns, entropy
+    rules เก็บ [วินาที, จำนวน match] ต่อ rule
+    """
+    __slots__ = ('phases', 'rules')
+    
+    def __init__(self):
+        self.phases = {}
+        self.rules = {}
+    
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(name, time.perf_counter() - started)
+    
+    def add_phase(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+    
+    def add_rule(self, rule, seconds, matches=0):
+        cost = self.rules.setdefault(rule, [0.0, 0])
+        cost[0] += seconds
+        cost[1] += matches
+    
+    def merge(self, other):
+        for name, seconds in other.phases.items():
+            self.add_phase(name, seconds)
+        for rule, (seconds, matches) in other.rules.items():
+            self.add_rule(rule, seconds, matches)
+    
+    @property
+    def total(self):
+        return sum(self.phases.values())
+    
+    def as_dict(self):
+        return {
+            'phases': {name: round(seconds, 6) for name, seconds in self.phases.items()},
+            'rules': {rule: [round(seconds, 6), matches] for rule, (seconds, matches) in self.rules.items()}
+        }
+
+class ScanProfiler:
+    """รวมผล cProfile จากหลาย worker thread (cProfile จับได้เฉพาะ thread ที่เปิดไว้)
+    
+    ตั้งแต่ Python 3.12 cProfile ใช้ sys.monitoring ซึ่งมีได้ทีละตัวทั้ง process การเปิด
+    profiler ตัวที่สองพร้อมกันจะโยน ValueError ส่วนที่ถูก profile จึงรันทีละ thread (_active)
+    """
+    def __init__(self):
+        self._profiles = []
+        self._lock = threading.Lock()
+        self._active = threading.Lock()
+    
+    @contextmanager
+    def profile(self):
+        with self._active:
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+                with self._lock:
+                    self._profiles.append(profiler)
+    
+    def stats(self):
+        with self._lock:
+            return pstats.Stats(*self._profiles) if self._profiles else None
+    
+    def dump(self, path):
+        """เขียนไฟล์ .prof (เปิดด้วย pstats หรือ snakeviz) คืน path หรือ None ถ้าไม่มีข้อมูล"""
+        stats = self.stats()
+        if stats is None:
+            return None
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        stats.dump_stats(str(path))
+        return path
+    
+    def top(self, limit=25, sort='cumulative'):
+        """ข้อความสรุปฟังก์ชันที่ใช้เวลามากที่สุด"""
+        stats = self.stats()
+        if stats is None:
+            return ''
+        stream = io.StringIO()
+        stats.stream = stream
+        stats.sort_stats(sort).print_stats(limit)
+        return stream.getvalue()
+
+# ========== Link Extraction ==========
+
+# tag -> attribute ที่ชี้ไปยัง URL อื่น
+LINK_ATTRIBUTES = {
+    'a': 'href', 'area': 'href', 'iframe': 'src', 'frame': 'src',
+    'form': 'action', 'script': 'src', 'link': 'href',
+}
+PAGE_TAGS = frozenset({'a', 'area', 'iframe', 'frame'})   # ลิงก์ไปยังหน้าที่ crawl ต่อได้
+HTML_CONTENT_TYPES = ('text/html', 'application/xhtml+xml')
+LINK_READ_SIZE = 64 * 1024   # bytes ต่อการอ่าน body ของหน้าเว็บ
+LINK_EXTRACTOR_VERSION = 2   # เพิ่มเมื่อชุดลิงก์ที่ดึงได้เปลี่ยน ลิงก์เดิมใน HttpCache ('links') จึงไม่ถูกใช้ซ้ำ
+
+class _HtmlLinkParser(HTMLParser):
+    """html.parser ที่ส่ง start tag ต่อให้ LinkExtractor (ใช้เมื่อไม่มี lxml)"""
+    def __init__(self, target):
+        super().__init__(convert_charrefs=True)
+        self.target = target
+    
+    def handle_starttag(self, tag, attrs):
+        self.target.start(tag, dict(attrs))
+
+class LinkExtractor:
+    """ดึง URL จาก HTML ที่ feed เข้ามาทีละส่วน โดยไม่สร้าง DOM tree
+    
+    ใช้ lxml (target parser) ถ้าติดตั้งไว้ ไม่งั้นใช้ html.parser เก็บเฉพาะค่า attribute
+    ตาม LINK_ATTRIBUTES เป็น (tag, value) และ <base href> แรกของหน้า
+    """
+    def __init__(self):
+        self.base = None
+        self.links = []
+        if lxml_etree is not None:
+            self._parser = lxml_etree.HTMLParser(target=self, no_network=True)
+        else:
+            self._parser = _HtmlLinkParser(self)
+    
+    def feed(self, text):
+        if text:
+            self._parser.feed(text)
+    
+    def close(self):
+        """จบการ parse คืน list ของ (tag, value)"""
+        try:
+            self._parser.close()
+        except Exception:
+            # lxml โยน error กับเอกสารว่าง/เสียหนัก ลิงก์ที่เก็บได้แล้วยังใช้ได้
+            pass
+        return self.links
+    
+    # ---- target interface ของ lxml (html.parser เรียก start ผ่าน _HtmlLinkParser) ----
+    
+    def start(self, tag, attrib):
+        if tag == 'base' and self.base is None and attrib.get('href'):
+            self.base = attrib['href'].strip()
+            return
+        attribute = LINK_ATTRIBUTES.get(tag)
+        value = attrib.get(attribute) if attribute else None
+        if value and value.strip():
+            self.links.append((tag, value.strip()))
+    
+    def end(self, tag):
+        pass
+    
+    def data(self, data):
+        pass
+
+def is_html_response(response):
+    """response เป็น HTML หรือไม่ (ไม่มี Content-Type ถือว่าเป็น HTML)"""
+    media_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+    return not media_type or media_type in HTML_CONTENT_TYPES
+
+# ========== Sitemap Discovery ==========
+
+SITEMAP_FALLBACK_PATHS = ['/sitemap.xml', '/sitemap_index.xml', '/sitemap1.xml', '/wp-sitemap.xml']
+SITEMAP_MAX_DEPTH = 3                      # ชั้นของ sitemap index ซ้อนกันที่ตามต่อ
+SITEMAP_MAX_FILES = 500                    # sitemap สูงสุดที่ดึงต่อเว็บไซต์ (กัน index ที่วนหรือใหญ่ผิดปกติ)
+SITEMAP_MAX_BYTES = 50 * 1024 * 1024       # ขนาดสูงสุดของ sitemap หลังคลาย gzip (ตามข้อกำหนด sitemaps.org)
+ROBOTS_MAX_BYTES = 512 * 1024              # bytes สูงสุดที่อ่านจาก robots.txt
+GZIP_MAGIC = b'\x1f\x8b'
+SITEMAP_PARSER_VERSION = 1   # เพิ่มเมื่อผลของ fetch_sitemap เปลี่ยน ผลเดิมใน HttpCache ('sitemap') จึงไม่ถูกใช้ซ้ำ
+
+def parse_robots_sitemaps(text):
+    """URL จากบรรทัด Sitemap: ใน robots.txt ตามลำดับ ไม่ซ้ำ"""
+    sitemaps = {}
+    for line in text.splitlines():
+        field, _, value = line.split('#', 1)[0].partition(':')
+        if field.strip().lower() == 'sitemap' and value.strip():
+            sitemaps.setdefault(value.strip(), None)
+    return list(sitemaps)
+
+class SitemapParser:
+    """parse sitemap หรือ sitemap index ที่ feed เข้ามาทีละส่วน ด้วย XMLPullParser
+    
+    คลาย gzip ระหว่างอ่าน (ดูจาก magic bytes ทั้ง .xml.gz และ response ที่ไม่ได้ส่ง Content-Encoding)
+    ทิ้ง element <url>/<sitemap> ทันทีที่อ่าน <loc> แล้ว หน่วยความจำจึงไม่โตตามจำนวน URL
+    """
+    def __init__(self):
+        self.is_index = False
+        self.size = 0
+        self._parser = ElementTree.XMLPullParser(events=('start', 'end'))
+        self._root = None
+        self._decompressor = None
+        self._head = b''
+    
+    def feed(self, chunk):
+        """คืน list ของ (kind, loc) ที่ parse ได้จากส่วนนี้ kind คือ 'url' หรือ 'sitemap'"""
+        if self._head is not None:
+            # รอให้ได้ 2 bytes แรกก่อนจึงรู้ว่าเป็น gzip หรือไม่
+            chunk = self._head + chunk
+            if len(chunk) < len(GZIP_MAGIC):
+                self._head = chunk
+                return []
+            self._head = None
+            if chunk.startswith(GZIP_MAGIC):
+                self._decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+        if self._decompressor is None:
+            return self._feed_xml(chunk)
+        # คลายทีละไม่เกิน LINK_READ_SIZE: gzip ที่บีบอัดได้มากไม่ทำให้ได้ข้อมูลก้อนใหญ่ในครั้งเดียว
+        entries = []
+        while chunk:
+            entries.extend(self._feed_xml(self._decompressor.decompress(chunk, LINK_READ_SIZE)))
+            chunk = self._decompressor.unconsumed_tail
+        return entries
+    
+    def close(self):
+        if self._head:
+            self._parser.feed(self._head)
+        self._parser.close()
+        return self._read_events()
+    
+    def _feed_xml(self, data):
+        self.size += len(data)
+        if self.size > SITEMAP_MAX_BYTES:
+            raise ValueError(f"sitemap larger than {SITEMAP_MAX_BYTES} bytes")
+        self._parser.feed(data)
+        return self._read_events()
+    
+    def _read_events(self):
+        entries = []
+        for event, element in self._parser.read_events():
+            tag = element.tag.rpartition('}')[2]
+            if event == 'start':
+                if self._root is None:
+                    self._root = element
+                    self.is_index = tag == 'sitemapindex'
+                continue
+            if tag in ('url', 'sitemap'):
+                loc = element.findtext('{*}loc')
+                if loc and loc.strip():
+                    entries.append((tag, loc.strip()))
+                # element ที่อ่านแล้วไม่ต้องเก็บไว้ใน tree
+                self._root.clear()
+        return entries
+
 # ========== Site Crawler ==========
 
+def parse_wordlist(text):
+    """แปลง wordlist (หนึ่ง path ต่อบรรทัด, # = comment) เป็น list ของ path ที่ไม่ซ้ำ"""
+    paths = []
+    seen = set()
+    for line in text.splitlines():
+        path = line.strip()
+        if not path or path.startswith('#'):
+            continue
+        if not path.startswith('/'):
+            path = '/' + path
+        if path not in seen:
+            seen.add(path)
+            paths.append(path)
+    return paths
+
 class WebsiteCrawler:
-    def __init__(self, base_url, max_depth=3, max_pages=100, timeout=10):
+    def __init__(self, base_url, max_depth=3, max_pages=100, timeout=10, http_cache=None):
         self.base_url = base_url.rstrip('/')
         self.domain = urlparse(base_url).netloc
         self.max_depth = max_depth
@@ -97,10 +409,10 @@ class WebsiteCrawler:
         self.timeout = timeout
         self.visited_urls = set()
         self.php_files = []
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        })
+        self.session = create_session()
+        self.http_cache = http_cache
+        self.timer = PhaseTimer()
+        self._lock = threading.Lock()
     
     def is_same_domain(self, url):
         """ตรวจสอบว่า URL อยู่ใน domain เดียวกัน"""
@@ -122,26 +434,72 @@ class WebsiteCrawler:
         return url
     
     def get_links_from_page(self, url):
-        """ดึงลิงก์ทั้งหมดจากหน้าเว็บ"""
+        """ดึงลิงก์ทั้งหมดจากหน้าเว็บ (ใช้ลิงก์เดิมถ้า server ตอบ 304 Not Modified)
+        
+        หน้าที่ไม่ใช่ HTML ไม่ถูกอ่าน body เลย ส่วนหน้า HTML ถูก parse ทีละส่วนขณะดาวน์โหลด
+        เวลารอ response (request) อ่าน body (transfer) และ parse (parse) ถูกสะสมไว้ใน self.timer
+        """
+        timer = PhaseTimer()
         try:
-            response = self.session.get(url, timeout=self.timeout, verify=False)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
-            links = []
-            
-            # หา links จาก <a> tags
-            for link in soup.find_all('a', href=True):
-                href = link['href']
-                absolute_url = urljoin(url, href)
-                normalized_url = self.normalize_url(absolute_url)
+            entry = self.http_cache.get(url, 'links') if self.http_cache else None
+            # ลิงก์ที่ดึงด้วย extractor รุ่นอื่น (เช่น list ของ <a> จาก bs4) ไม่ใช้ซ้ำ
+            if not payload_matches(entry, LINK_EXTRACTOR_VERSION):
+                entry = None
+            with timer.phase('request'):
+                response = self.session.get(url, timeout=self.timeout, verify=False,
+                                            headers=conditional_headers(entry), stream=True)
+            with response:
+                if response.status_code == 304 and entry:
+                    self.http_cache.record_not_modified()
+                    return entry['payload']['links']
+                response.raise_for_status()
+                if not is_html_response(response):
+                    return []
                 
-                if self.is_same_domain(normalized_url):
-                    links.append(normalized_url)
+                extractor = LinkExtractor()
+                decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')(errors='replace')
+                chunks = response.iter_content(chunk_size=LINK_READ_SIZE)
+                while True:
+                    with timer.phase('transfer'):
+                        chunk = next(chunks, None)
+                    if chunk is None:
+                        break
+                    with timer.phase('parse'):
+                        extractor.feed(decoder.decode(chunk))
+                with timer.phase('parse'):
+                    extractor.feed(decoder.decode(b'', final=True))
+                    links = self.resolve_links(url, extractor.base, extractor.close())
             
+            if self.http_cache:
+                self.http_cache.put(url, 'links', response,
+                                    {'version': LINK_EXTRACTOR_VERSION, 'links': links})
             return links
         except Exception as e:
             return []
+        finally:
+            with self._lock:
+                self.timer.merge(timer)
+    
+    def resolve_links(self, page_url, base, raw_links):
+        """แปลง (tag, value) จาก LinkExtractor เป็น URL ใน domain เดียวกันที่ไม่ซ้ำ
+        
+        ลิงก์ไปยังหน้า (PAGE_TAGS) ถูกเก็บทั้งหมด ส่วน form action, script src และ link href
+        เก็บเฉพาะที่ชี้ไปยังไฟล์ PHP เพราะ asset อื่น (js, css) ไม่มีลิงก์ให้ตามต่อ
+        """
+        base_url = urljoin(page_url, base) if base else page_url
+        links = {}
+        # เมนูและ footer ทำให้ลิงก์เดิมซ้ำหลายครั้ง จึงตัดค่าซ้ำก่อน urljoin
+        for tag, value in dict.fromkeys(raw_links):
+            try:
+                normalized_url = self.normalize_url(urljoin(base_url, value))
+            except ValueError:
+                # URL เสีย (เช่น IPv6 ที่ไม่ปิดวงเล็บ) ข้ามเฉพาะลิงก์นั้น
+                continue
+            if not self.is_same_domain(normalized_url):
+                continue
+            if tag in PAGE_TAGS or self.is_php_file(normalized_url):
+                links.setdefault(normalized_url, None)
+        return list(links)
     
     def crawl(self, url=None, depth=0, progress_callback=None):
         """Crawl เว็บไซต์"""
@@ -176,253 +534,3719 @@ class WebsiteCrawler:
             else:
                 break
     
-    def try_common_paths(self):
-        """ลองเข้า path ที่พบบ่อย"""
-        common_paths = [
-            '/wp-admin/', '/wp-content/', '/wp-includes/',
-            '/admin/', '/administrator/', '/manager/',
-            '/includes/', '/inc/', '/lib/', '/libs/',
-            '/plugins/', '/modules/', '/themes/',
-            '/uploads/', '/upload/', '/files/',
-            '/api/', '/ajax/', '/cron/',
-            '/index.php', '/admin.php', '/login.php',
-            '/config.php', '/settings.php'
-        ]
+    def _claim(self, url, depth):
+        """จอง URL สำหรับเข้าเยี่ยม (thread-safe) คืน URL ที่ normalize แล้ว หรือ None ถ้าข้าม"""
+        url = self.normalize_url(url)
+        with self._lock:
+            if (depth > self.max_depth or 
+                url in self.visited_urls or 
+                len(self.visited_urls) >= self.max_pages or
+                not self.is_same_domain(url)):
+                return None
+            
+            self.visited_urls.add(url)
+            if self.is_php_file(url):
+                self.php_files.append(url)
+        return url
+    
+    def crawl_state(self, frontier=(), in_flight=()):
+        """สถานะ crawl สำหรับ checkpoint
+        
+        หน้าที่กำลังดึงอยู่ (in_flight) ถูกใส่กลับเข้า frontier และเอาออกจาก visited/php_files
+        เพื่อให้ถูกดึงใหม่เมื่อ resume
+        """
+        in_flight = list(in_flight)
+        requeued = {url for url, depth in in_flight}
+        with self._lock:
+            return {
+                'frontier': in_flight + list(frontier),
+                'visited': [url for url in self.visited_urls if url not in requeued],
+                'php_files': [url for url in self.php_files if url not in requeued]
+            }
+    
+    def restore_state(self, state):
+        """โหลดสถานะจาก checkpoint คืน frontier ที่ต้อง crawl ต่อ"""
+        with self._lock:
+            self.visited_urls = set(state['visited'])
+            self.php_files = list(state['php_files'])
+        return deque(state['frontier'])
+    
+    def crawl_bfs(self, progress_callback=None, max_workers=4, state=None, checkpoint=None,
+                  checkpoint_interval=10.0):
+        """Crawl แบบ breadth-first ด้วยคิว frontier และหลาย worker
+        
+        worker ทุกตัวใช้ connection pool ของ self.session ร่วมกัน ส่วนการจอง URL และ
+        progress_callback ทำใน thread ที่เรียก (ปลอดภัยสำหรับ Streamlit)
+        
+        state คือสถานะจาก checkpoint ที่จะ crawl ต่อ ส่วน checkpoint(state) ถูกเรียก
+        ทุก checkpoint_interval วินาทีเพื่อบันทึกสถานะ
+        """
+        mount_connection_pool(self.session, max_workers)
+        frontier = self.restore_state(state) if state else deque([(self.base_url, 0)])
+        pending = {}
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        last_checkpoint = time.monotonic()
+        
+        try:
+            while frontier or pending:
+                # เติมงานให้ worker จาก frontier ตามลำดับ FIFO (BFS)
+                while frontier and len(pending) < max_workers * 2:
+                    url, depth = frontier.popleft()
+                    url = self._claim(url, depth)
+                    if url is None:
+                        continue
+                    
+                    if progress_callback:
+                        progress_callback(url, len(self.visited_urls), len(self.php_files))
+                    
+                    # หน้าที่ความลึกสูงสุดไม่ต้องดึง เพราะลิงก์ลูกจะเกิน max_depth อยู่แล้ว
+                    if depth < self.max_depth:
+                        pending[executor.submit(self.get_links_from_page, url)] = (url, depth)
+                
+                if len(self.visited_urls) >= self.max_pages:
+                    break
+                if not pending:
+                    continue
+                
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    url, depth = pending.pop(future)
+                    for link in future.result():
+                        frontier.append((link, depth + 1))
+                
+                if checkpoint and time.monotonic() - last_checkpoint >= checkpoint_interval:
+                    checkpoint(self.crawl_state(frontier, pending.values()))
+                    last_checkpoint = time.monotonic()
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    def _probe_path(self, path):
+        """HEAD request ไปยัง path คืน (url, status code) หรือ (url, None) ถ้าเชื่อมต่อไม่ได้"""
+        url = self.base_url + path
+        try:
+            response = self.session.head(url, timeout=5, verify=False, allow_redirects=True)
+            return url, response.status_code
+        except Exception:
+            return url, None
+    
+    def try_common_paths(self, paths=None, max_workers=8, max_failures=5):
+        """ลองเข้า path ที่พบบ่อย (หรือจาก wordlist) ด้วย HEAD request พร้อมกันหลาย worker
+        
+        ถ้า max_failures request แรกเชื่อมต่อไม่ได้เลยโดยที่ host ยังไม่เคยตอบ
+        จะถือว่า host ไม่ตอบสนองและยกเลิก path ที่เหลือทันที
+        """
+        if paths is None:
+            paths = COMMON_PATHS
+        
+        mount_connection_pool(self.session, max_workers)
+        statuses = {}
+        failures = 0
+        responded = False
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        
+        try:
+            futures = {executor.submit(self._probe_path, path): i for i, path in enumerate(paths)}
+            for future in as_completed(futures):
+                url, status_code = future.result()
+                if status_code is None:
+                    failures += 1
+                    if not responded and failures >= max_failures:
+                        break
+                else:
+                    responded = True
+                    statuses[futures[future]] = (url, status_code)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
         
         found_urls = []
         
-        for path in common_paths:
-            url = self.base_url + path
-            try:
-                response = self.session.head(url, timeout=5, verify=False, allow_redirects=True)
-                if response.status_code == 200:
-                    normalized_url = self.normalize_url(url)
-                    if normalized_url not in self.visited_urls:
-                        found_urls.append(normalized_url)
-                        if self.is_php_file(normalized_url):
-                            self.php_files.append(normalized_url)
-            except:
-                pass
+        # เรียงตามลำดับใน wordlist แม้ request จะเสร็จไม่เรียงกัน
+        for i in sorted(statuses):
+            url, status_code = statuses[i]
+            if status_code == 200:
+                normalized_url = self.normalize_url(url)
+                if normalized_url not in self.visited_urls:
+                    found_urls.append(normalized_url)
+                    if self.is_php_file(normalized_url):
+                        self.php_files.append(normalized_url)
         
         return found_urls
     
-    def try_sitemap(self):
-        """ลองดึงข้อมูลจาก sitemap.xml"""
-        sitemap_urls = [
-            '/sitemap.xml',
-            '/sitemap_index.xml',
-            '/sitemap1.xml',
-            '/wp-sitemap.xml'
-        ]
-        
-        php_urls = []
+    def robots_sitemaps(self):
+        """URL ของ sitemap จากบรรทัด Sitemap: ใน robots.txt (เฉพาะ domain เดียวกัน)"""
+        try:
+            with self.session.get(self.base_url + '/robots.txt', timeout=self.timeout, verify=False,
+                                  stream=True) as response:
+                response.raise_for_status()
+                data = response.raw.read(ROBOTS_MAX_BYTES, decode_content=True)
+        except Exception:
+            return []
+        text = data.decode(response.encoding or 'utf-8', errors='replace')
+        return [url for url in parse_robots_sitemaps(text) if self.is_same_domain(url)]
+    
+    def fetch_sitemap(self, url):
+        """ดึงและ parse sitemap หนึ่งไฟล์แบบ stream คืน (URL ไฟล์ PHP, sitemap ลูก)
         
-        for sitemap_path in sitemap_urls:
-            try:
-                url = self.base_url + sitemap_path
-                response = self.session.get(url, timeout=self.timeout, verify=False)
+        เก็บเฉพาะ URL ที่เป็นไฟล์ PHP ใน domain เดียวกัน sitemap 50,000 URL จึงใช้หน่วยความจำคงที่
+        ใช้ผลเดิมจาก http_cache ถ้า server ตอบ 304 Not Modified
+        """
+        timer = PhaseTimer()
+        php_urls = {}
+        children = {}
+        try:
+            entry = self.http_cache.get(url, 'sitemap') if self.http_cache else None
+            if not payload_matches(entry, SITEMAP_PARSER_VERSION):
+                entry = None
+            with timer.phase('request'):
+                response = self.session.get(url, timeout=self.timeout, verify=False,
+                                            headers=conditional_headers(entry), stream=True)
+            with response:
+                if response.status_code == 304 and entry:
+                    self.http_cache.record_not_modified()
+                    return entry['payload']['result']
                 response.raise_for_status()
                 
-                # Parse sitemap
-                urls = re.findall(r'<loc>(.*?)</loc>', response.text)
-                
-                for found_url in urls:
-                    if self.is_same_domain(found_url):
-                        normalized_url = self.normalize_url(found_url)
-                        if normalized_url not in self.visited_urls:
-                            self.visited_urls.add(normalized_url)
+                parser = SitemapParser()
+                chunks = response.iter_content(chunk_size=LINK_READ_SIZE)
+                while True:
+                    with timer.phase('transfer'):
+                        chunk = next(chunks, None)
+                    with timer.phase('parse'):
+                        entries = parser.feed(chunk) if chunk is not None else parser.close()
+                        for kind, loc in entries:
+                            if kind == 'sitemap':
+                                children.setdefault(loc, None)
+                                continue
+                            if not self.is_same_domain(loc):
+                                continue
+                            normalized_url = self.normalize_url(loc)
                             if self.is_php_file(normalized_url):
-                                php_urls.append(normalized_url)
-                
-                break  # ถ้าเจอ sitemap แล้วไม่ต้องลองอันอื่น
+                                php_urls.setdefault(normalized_url, None)
+                    if chunk is None:
+                        break
+                result = [list(php_urls), list(children)]
+            
+            if self.http_cache:
+                self.http_cache.put(url, 'sitemap', response,
+                                    {'version': SITEMAP_PARSER_VERSION, 'result': result})
+            return result
+        except Exception:
+            # sitemap ที่ขาดกลางคันหรือ XML เสีย: ใช้ URL ที่อ่านได้ก่อนจุดที่เสีย (ไม่เก็บลง cache)
+            return [list(php_urls), list(children)]
+        finally:
+            with self._lock:
+                self.timer.merge(timer)
+    
+    def try_sitemap(self, max_workers=4):
+        """หาไฟล์ PHP จาก sitemap ที่ประกาศใน robots.txt (หรือ path มาตรฐานถ้าไม่มี)
+        
+        sitemap index ถูกตามต่อทีละชั้นแบบ breadth-first ด้วยหลาย worker
+        ไม่เกิน SITEMAP_MAX_DEPTH ชั้นและ SITEMAP_MAX_FILES ไฟล์
+        """
+        roots = self.robots_sitemaps() or [self.base_url + path for path in SITEMAP_FALLBACK_PATHS]
+        
+        mount_connection_pool(self.session, max_workers)
+        frontier = deque((url, 0) for url in roots)
+        seen = set(roots)
+        pending = {}
+        php_urls = []
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        
+        try:
+            while frontier or pending:
+                while frontier and len(pending) < max_workers * 2:
+                    url, depth = frontier.popleft()
+                    pending[executor.submit(self.fetch_sitemap, url)] = depth
                 
-            except:
-                continue
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    depth = pending.pop(future)
+                    found_urls, children = future.result()
+                    for found_url in found_urls:
+                        if found_url not in self.visited_urls:
+                            self.visited_urls.add(found_url)
+                            php_urls.append(found_url)
+                    if depth >= SITEMAP_MAX_DEPTH:
+                        continue
+                    for child in children:
+                        if (child not in seen and len(seen) < SITEMAP_MAX_FILES
+                                and self.is_same_domain(child)):
+                            seen.add(child)
+                            frontier.append((child, depth + 1))
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
         
         return php_urls
 
+CRAWL_METHODS = ["Auto Crawl", "Sitemap Only", "Common Paths", "Full Scan (All Methods)"]
+
+def discover_php_files(crawler, method, parallel_crawl=True, max_workers=4, wordlist_paths=None,
+                       progress_callback=None, notify=None, crawl_state=None, checkpoint=None):
+    """หาไฟล์ PHP ตาม method ที่เลือก คืน list ของ URL ที่ไม่ซ้ำ
+    
+    notify(level, message) ใช้แสดงสถานะแต่ละขั้น (level คือ 'info' หรือ 'success')
+    crawl_state / checkpoint ส่งต่อให้ crawl_bfs (การ crawl ต่อจาก checkpoint ใช้ BFS เสมอ)
+    """
+    notify = notify or (lambda level, message: None)
+    php_files_found = set()
+    
+    if method in ["Auto Crawl", "Full Scan (All Methods)"]:
+        notify('info', "🕷️ Auto crawling website...")
+        if parallel_crawl or crawl_state:
+            crawler.crawl_bfs(progress_callback=progress_callback, max_workers=max_workers,
+                              state=crawl_state, checkpoint=checkpoint)
+        else:
+            crawler.crawl(progress_callback=progress_callback)
+        php_files_found.update(crawler.php_files)
+    
+    if method in ["Sitemap Only", "Full Scan (All Methods)"]:
+        notify('info', "🗺️ Checking sitemap...")
+        sitemap_files = crawler.try_sitemap(max_workers=max_workers)
+        php_files_found.update(sitemap_files)
+        notify('success', f"✅ Found {len(sitemap_files)} PHP files from sitemap")
+    
+    if method in ["Common Paths", "Full Scan (All Methods)"]:
+        if wordlist_paths is not None:
+            notify('info', f"📁 Checking {len(wordlist_paths)} paths from wordlist...")
+        else:
+            notify('info', "📁 Checking common paths...")
+        common_files = crawler.try_common_paths(paths=wordlist_paths, max_workers=max_workers)
+        php_files_found.update(common_files)
+        notify('success', f"✅ Found {len(common_files)} files from common paths")
+    
+    return list(php_files_found)
+
+# ========== Findings ==========
+
+MAX_SNIPPET_LENGTH = 200   # ตัวอักษรสูงสุดของ code snippet ต่อบรรทัดใน finding
+
+class Finding:
+    """finding หนึ่งรายการแบบประหยัดหน่วยความจำ (__slots__)
+    
+    เก็บ offset ของ match ในเนื้อหาที่สแกนกับ snippet ที่ตัดสั้นแล้ว แทนการคัดลอกทั้งบรรทัด
+    description สร้างเมื่อถูกอ่าน และยังอ่านแบบ dict ได้ (finding['line'], .get, 'category' in finding)
+    label คือชื่อฟังก์ชันหรือ category ส่วน rule คือ id ของ rule ที่ใช้ตัดผลซ้ำ (rule, line)
+    """
+    __slots__ = ('type', 'severity', 'line', 'code', 'label', 'rule', 'start', 'end', '_description')
+    
+    def __init__(self, type, severity, line, code, label, rule, start=None, end=None, description=None):
+        self.type = type
+        self.severity = severity
+        self.line = line
+        self.code = code
+        self.label = label
+        self.rule = rule
+        self.start = start
+        self.end = end
+        self._description = description
+    
+    @property
+    def label_key(self):
+        return 'function' if self.type == 'dangerous_function' else 'category'
+    
+    @property
+    def description(self):
+        if self._description is not None:
+            return self._description
+        if self.type == 'dangerous_function':
+            return f'Dangerous function: {self.label}()'
+        if self.type == 'suspicious_filename':
+            return f'Suspicious filename: {self.code}'
+        return f'Suspicious {self.label} pattern detected'
+    
+    def keys(self):
+        return ['type', 'severity', 'line', 'code', self.label_key, 'description', 'rule', 'start', 'end']
+    
+    def __getitem__(self, key):
+        if key == self.label_key:
+            return self.label
+        if key in ('type', 'severity', 'line', 'code', 'description', 'rule', 'start', 'end'):
+            return getattr(self, key)
+        raise KeyError(key)
+    
+    def __contains__(self, key):
+        return key in self.keys()
+    
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+    
+    def items(self):
+        return self.to_dict().items()
+    
+    def to_dict(self):
+        return {key: self[key] for key in self.keys()}
+    
+    @classmethod
+    def from_dict(cls, data):
+        label_key = 'function' if data['type'] == 'dangerous_function' else 'category'
+        return cls(data['type'], data['severity'], data['line'], data['code'],
+                   data.get(label_key), data.get('rule'), data.get('start'), data.get('end'),
+                   data.get('description'))
+    
+    def __eq__(self, other):
+        if not isinstance(other, Finding):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in Finding.__slots__)
+    
+    __hash__ = None
+    
+    def __repr__(self):
+        return f"Finding({self.to_dict()!r})"
+
+def findings_from_dicts(items):
+    """แปลง finding ที่โหลดจาก JSON กลับเป็น Finding"""
+    return [Finding.from_dict(item) for item in items]
+
+def json_default(obj):
+    """ใช้กับ json.dumps(default=...) ให้ serialize Finding ได้"""
+    # ไม่ใช้ isinstance: ผลสแกนใน st.session_state เป็น Finding ของคลาสจากรอบก่อน
+    # เพราะ streamlit รันสคริปต์ใหม่ทุกครั้งที่ rerun จึงเทียบรูปร่าง (__slots__ และ to_dict) แทน
+    if getattr(type(obj), '__slots__', None) == Finding.__slots__ and callable(getattr(obj, 'to_dict', None)):
+        return obj.to_dict()
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+# ========== Backtracking Guard ==========
+
+SEARCH_WINDOW_SIZE = 4096     # ตัวอักษรสูงสุดที่ regex ที่เสี่ยง backtracking (ไม่มี RE2) มองเห็นต่อครั้ง
+SEARCH_WINDOW_OVERLAP = 512   # ช่วงทับซ้อนของ window: match ที่สั้นกว่านี้ไม่หลุดที่รอยต่อ
+RULE_TIME_BUDGET = 2.0        # วินาทีพื้นฐานต่อ rule ต่อการสแกนหนึ่งครั้ง เกินแล้วหยุด rule นั้นและรายงาน timeout
+RULE_TIME_PER_MB = 0.5        # วินาทีที่เพิ่มต่อเนื้อหา 1 MiB งานเชิงเส้นบนไฟล์ใหญ่จึงไม่ถูกนับเป็น timeout
+
+class RuleTimeout(Exception):
+    """rule ใช้เวลาเกิน RULE_TIME_BUDGET position คือตำแหน่งที่หยุดสแกน"""
+    def __init__(self, position):
+        super().__init__(position)
+        self.position = position
+
+def is_backtracking_prone(pattern):
+    """ตรวจว่ามี repeat ไม่จำกัดของ . หรือ [^...] ที่ยังมี pattern ตามหลัง
+    
+    rule แบบนี้ (เช่น a.*b.*c) ต้องเดินถึงท้ายบรรทัดจากทุกจุดเริ่มเมื่อ match ไม่สำเร็จ
+    จึงใช้เวลาแบบ quadratic หรือแย่กว่าบนบรรทัดยาว
+    """
+    def is_wide(item):
+        if len(item) != 1:
+            return False
+        op, av = item[0]
+        return (op in (sre_parse.ANY, sre_parse.NOT_LITERAL)
+                or (op == sre_parse.IN and av and av[0][0] == sre_parse.NEGATE))
+    
+    def walk(items, tail):
+        items = list(items)
+        for i, (op, av) in enumerate(items):
+            is_tail = tail and i == len(items) - 1
+            if op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT):
+                low, high, item = av
+                if high == sre_parse.MAXREPEAT and is_wide(item) and not is_tail:
+                    return True
+                if walk(item, is_tail and high == 1):
+                    return True
+            elif op == sre_parse.SUBPATTERN and walk(av[-1], is_tail):
+                return True
+            elif op == sre_parse.BRANCH and any(walk(branch, is_tail) for branch in av[1]):
+                return True
+            elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT) and walk(av[1], True):
+                return True
+        return False
+    
+    try:
+        return walk(sre_parse.parse(pattern), True)
+    except Exception:
+        return False
+
+class LinearMatch:
+    __slots__ = ('_start', '_end')
+    
+    def __init__(self, start, end):
+        self._start = start
+        self._end = end
+    
+    def start(self):
+        return self._start
+    
+    def end(self):
+        return self._end
+    
+    def span(self):
+        return self._start, self._end
+
+class LinearRegex:
+    """regex ของ RE2 (เวลาเชิงเส้น) ที่ใช้แทน re.Pattern ในการค้นแบบมี pos / endpos
+    
+    binding ของ RE2 แปลง str ทั้งก้อนเป็น UTF-8 ทุกครั้งที่เรียก จึงค้นบน slice ของช่วงนั้นแทน
+    (เผื่อตัวอักษรก่อน pos หนึ่งตัวสำหรับ \b)
+    """
+    __slots__ = ('regex', 'pattern')
+    
+    def __init__(self, regex, pattern):
+        self.regex = regex
+        self.pattern = pattern
+    
+    def finditer(self, content, pos=0, endpos=None):
+        endpos = len(content) if endpos is None else min(endpos, len(content))
+        base = max(pos - 1, 0)
+        for match in self.regex.finditer(content[base:endpos], pos - base):
+            yield LinearMatch(base + match.start(), base + match.end())
+    
+    def search(self, content, pos=0, endpos=None):
+        return next(self.finditer(content, pos, endpos), None)
+
+def compile_linear(source, flags, binary):
+    """compile ด้วย RE2 คืน LinearRegex หรือ None ถ้าไม่มี RE2 หรือ RE2 ไม่รองรับ pattern นี้"""
+    if re2 is None:
+        return None
+    options = re2.Options()
+    options.log_errors = False
+    options.case_sensitive = not flags & re.IGNORECASE
+    if binary:
+        # หนึ่ง byte ต่อหนึ่งตัวอักษรเหมือน re กับ bytes
+        options.encoding = re2.Options.Encoding.LATIN1
+    try:
+        return LinearRegex(re2.compile(source, options), source)
+    except re2.error:
+        return None
+
+def needs_search_windows(regex, prone):
+    """ค้นทีละ window เฉพาะ rule ที่เสี่ยง backtracking และไม่มี RE2 (เวลาเชิงเส้นอยู่แล้ว)
+    
+    window ขยายถึงท้ายบรรทัดได้ไม่เกิน SEARCH_WINDOW_OVERLAP บรรทัดที่ยาวกว่านั้นยังถูกตัดกลางบรรทัด
+    ซึ่งอาจทำให้ match ที่ยาวกว่า SEARCH_WINDOW_OVERLAP ที่คร่อมรอยต่อหลุดได้
+    rule อื่นจึงค้นทั้งช่วงเหมือนเดิม
+    """
+    return bool(prone) and not isinstance(regex, LinearRegex)
+
+def iter_search_windows(start, end, size=SEARCH_WINDOW_SIZE, overlap=SEARCH_WINDOW_OVERLAP,
+                        windowed=True, index=None, line_limit=None):
+    """แบ่งช่วง [start, end) เป็น window ที่ทับซ้อนกัน คืน (pos, endpos, owned_end)
+    
+    match ที่เริ่มใน [pos, owned_end) เป็นของ window นั้น จึงไม่ซ้ำกันระหว่าง window
+    ถ้ามี index (LineIndex) endpos ถูกขยายถึงท้ายบรรทัดถ้าอยู่ห่างไม่เกิน line_limit (ค่าเริ่มต้นคือ overlap)
+    window ของ rule ที่เสี่ยง backtracking จึงยาวไม่เกิน size + overlap เสมอ และ deadline
+    ถูกตรวจก่อนทุก window ที่มีขนาดจำกัด บรรทัดที่ยาวกว่านั้นถูกตัดกลางบรรทัด
+    windowed=False คืนทั้งช่วงเป็น window เดียว
+    """
+    if not windowed:
+        yield start, end, end
+        return
+    if line_limit is None:
+        line_limit = overlap
+    pos = start
+    while True:
+        endpos = min(end, pos + size)
+        owned_end = end if endpos == end else endpos - overlap
+        if index is not None and endpos < end:
+            limit = min(end, endpos + line_limit)
+            line_end = index.content.find(index.newline, endpos, limit)
+            # ไม่พบ newline ก่อน end: บรรทัดนี้จบที่ปลายช่วงพอดี (span จบที่ขอบบรรทัดเสมอ)
+            if line_end != -1 or limit == end:
+                endpos = limit if line_end == -1 else line_end
+        yield pos, endpos, owned_end
+        if owned_end == end:
+            return
+        pos = owned_end
+
+def rule_deadline(content):
+    """เวลาที่ rule หนึ่งต้องสแกน content ให้เสร็จ (ตาม RULE_TIME_BUDGET และ RULE_TIME_PER_MB)"""
+    return time.perf_counter() + RULE_TIME_BUDGET + RULE_TIME_PER_MB * len(content) / (1024 * 1024)
+
+def check_deadline(deadline, position):
+    if deadline is not None and time.perf_counter() > deadline:
+        raise RuleTimeout(position)
+
+def rule_timeout_finding(rule, index, position, owned=None, line_offset=0, offset=0):
+    """finding ของ rule ที่หยุดเพราะเกินเวลา (None ถ้าส่วนที่เหลือไม่ใช่ของ window นี้)"""
+    if owned is not None:
+        if position >= owned[1]:
+            return None
+        position = max(position, owned[0])
+    line_no = index.line_number(position)
+    return Finding(
+        'rule_timeout', 'medium', line_no + line_offset, index.snippet(line_no, position),
+        'timeout', f'timeout/{rule}', position + offset, position + offset,
+        f'Rule {rule} exceeded its time budget here (possible ReDoS payload); '
+        f'the rest of the content was not checked by this rule'
+    )
+
+def has_rule_timeout(findings):
+    """ผลที่มี timeout ขึ้นกับภาระเครื่องขณะสแกน จึงไม่ถูกเก็บใน cache"""
+    return any(finding['type'] == 'rule_timeout' for finding in findings)
+
+# ========== PHP Tokenizer ==========
+
+TOKEN_HTML = 'html'         # inline HTML นอก <?php ... ?> และข้อมูลหลัง __halt_compiler
+TOKEN_CODE = 'code'
+TOKEN_COMMENT = 'comment'
+TOKEN_STRING = 'string'     # '...', "...", `...`, heredoc และ nowdoc
+TOKEN_KINDS = (TOKEN_HTML, TOKEN_CODE, TOKEN_COMMENT, TOKEN_STRING)
+CALL_LOOKBEHIND = 40        # ตัวอักษรก่อนชื่อฟังก์ชันที่ใช้ตัดสินว่าเป็นการเรียกฟังก์ชันจริงหรือไม่
+
+# ชนิด token ของแต่ละ mode ของ lexer
+_MODE_KINDS = {
+    'html': TOKEN_HTML, 'halted': TOKEN_HTML, 'code': TOKEN_CODE,
+    'line': TOKEN_COMMENT, 'block': TOKEN_COMMENT,
+    'single': TOKEN_STRING, 'double': TOKEN_STRING, 'backtick': TOKEN_STRING,
+    'heredoc': TOKEN_STRING, 'nowdoc': TOKEN_STRING,
+    # resume กลางบรรทัดของ heredoc/nowdoc (บรรทัดนั้นเป็นบรรทัดปิดไม่ได้) และกลาง {$...} ใน string
+    'heredoc-tail': TOKEN_STRING, 'nowdoc-tail': TOKEN_STRING, 'interp': TOKEN_CODE,
+}
+
+class _LexerPatterns:
+    """regex ของ PhpTokens สำหรับ str หรือ bytes"""
+    def __init__(self, binary):
+        self.binary = binary
+        ident_char = r'\x80-\xff' if binary else r'\x80-\U0010ffff'
+        self.ident = rf'[A-Za-z_{ident_char}][A-Za-z0-9_{ident_char}]*'
+        self.ident_tail = rf'(?![A-Za-z0-9_{ident_char}])'
+        self.open_tag = self.compile(r'<\?(?![xX][mM][lL])')
+        # lookahead ของอักขระแรกให้ re ข้ามตำแหน่งที่ไม่มีทางเป็นตัวแบ่งได้เร็ว (~5 เท่า)
+        self.code_break = self.compile(
+            r'(?=[/#\'"`<?_])(?:'
+            r'(?P<line>//|#(?!\[))|(?P<block>/\*)|(?P<single>\')|(?P<double>")|(?P<backtick>`)'
+            rf'|(?P<heredoc><<<[ \t]*(?P<quote>["\']?)(?P<label>{self.ident})(?P=quote)\r?\n)'
+            r'|(?P<close>\?>)|(?P<halt>(?i:__halt_compiler)' + self.ident_tail + '))'
+        )
+        self.halt_tail = self.compile(r'\s*\(\s*\)\s*;?')
+        self.line_end = self.compile(r'(?=[\n?])(?:\n|\?>)')
+        self.block_end = self.literal('*/')
+        self.close_tag = self.literal('?>')
+        self.quoted = {
+            'single': self.compile(r'[^\'\\]*(?:\\.[^\'\\]*)*\''),
+            'double': self.compile(r'[^"\\]*(?:\\.[^"\\]*)*"'),
+            'backtick': self.compile(r'[^`\\]*(?:\\.[^`\\]*)*`'),
+        }
+        self.interpolation = self.compile(r'(?=[{$])(?:\{\$|\$\{)')
+        self.double_body = self.compile(r'(?:[^"\\{$]+|\\.|\$(?!\{)|\{(?!\$))*')
+        self.brace = self.compile(r'[{}]')
+        self.open_brace = self.literal('{')
+        self.close_brace = self.literal('}')
+        self.double_quote = self.literal('"')
+        self.newline = self.literal('\n')
+        # ใช้ตอนไล่ย้อนจากชื่อฟังก์ชัน (is_call): whitespace ของ PHP เป็น ASCII เท่านั้น
+        # และ byte >= 0x80 เป็นตัวอักษรของชื่อ จึงตัดสินเหมือนกันทั้ง str และ bytes
+        self.ident_char = self.compile(rf'[A-Za-z0-9_{ident_char}]')
+        self.whitespace = self.literal(' \t\n\r\v\f')
+        self.member_access = (self.literal('->'), self.literal('::'), self.literal('$'))
+        self.backslash = self.literal('\\')
+        self.ampersand = self.literal('&')
+        self.declarations = {self.literal(word): word == 'function' for word in ('function', 'new', 'const')}
+        self._heredoc_ends = {}
+    
+    def literal(self, text):
+        return text.encode('latin-1') if self.binary else text
+    
+    def compile(self, source):
+        return re.compile(self.literal(source), re.DOTALL)
+    
+    def heredoc_end(self, label):
+        """regex ของบรรทัดปิด heredoc (PHP 7.3+ ย่อหน้าได้ และตามด้วยอักขระอื่นที่ไม่ใช่ชื่อได้)"""
+        regex = self._heredoc_ends.get(label)
+        if regex is None:
+            source = self.literal(r'^[ \t]*') + re.escape(label) + self.literal(self.ident_tail)
+            regex = self._heredoc_ends[label] = re.compile(source, re.MULTILINE)
+        return regex
+
+_LEXER_PATTERNS = {False: _LexerPatterns(False), True: _LexerPatterns(True)}
+
+class PhpTokens:
+    """token stream แบบหยาบของ PHP: ช่วง (kind, start, end) ที่ต่อกันครอบคลุมทั้งเนื้อหา
+    
+    kind เป็นหนึ่งใน TOKEN_KINDS ส่วน {$...} / ${...} ใน string ที่ interpolate นับเป็น code
+    lex แบบ lazy เท่าที่ถูกถามถึง ไฟล์ที่ไม่มี rule ใดถามจึงไม่เสียเวลา lex
+    state คือสถานะของ lexer ที่ต้นเนื้อหา (จาก state_at ของ window ก่อนหน้า) None = ต้นไฟล์
+    """
+    def __init__(self, content, state=None):
+        self.content = content
+        self.patterns = _LEXER_PATTERNS[not isinstance(content, str)]
+        self.seconds = 0.0
+        self._size = len(content)
+        self._pos = 0
+        self._state = state
+        # token ที่ lex แล้ว: ตำแหน่งเริ่ม/จบ ชนิด สถานะที่ต้นและภายใน token (ใช้ resume)
+        self._starts = []
+        self._ends = []
+        self._kinds = []
+        self._entry_states = []
+        self._inner_states = []
+    
+    def kind_at(self, offset):
+        """ชนิดของ token ที่ครอบ offset"""
+        index = self._token_index(offset)
+        return self._kinds[index] if index is not None else None
+    
+    def is_code(self, offset):
+        return self.kind_at(offset) == TOKEN_CODE
+    
+    def is_call(self, start):
+        """ชื่อฟังก์ชันที่ start เป็นการเรียกฟังก์ชันจริงใน code หรือไม่
+        
+        ไม่นับ method/static call (->, ::), ตัวแปร ($file), ชื่อใน namespace อื่น (Foo\\copy),
+        การประกาศฟังก์ชัน (function copy) และ new / const
+        """
+        if not self.is_code(start):
+            return False
+        content, patterns = self.content, self.patterns
+        limit = max(start - CALL_LOOKBEHIND, 0)
+        pos = self._skip_back(start, limit, patterns.whitespace)
+        if content[max(pos - 2, limit):pos].endswith(patterns.member_access):
+            return False
+        if content[pos - 1:pos] == patterns.backslash:
+            return not (pos - 1 > limit and patterns.ident_char.match(content, pos - 2))
+        by_reference = content[pos - 1:pos] == patterns.ampersand
+        if by_reference:
+            pos = self._skip_back(pos - 1, limit, patterns.whitespace)
+        if pos == start:
+            return True
+        # คำก่อนหน้า: ไล่ย้อนด้วย class เดียวกับชื่อ ไม่เกินความยาวของ keyword ที่ยาวที่สุด + 1
+        word_start = pos
+        while word_start > max(pos - 9, limit) and patterns.ident_char.match(content, word_start - 1):
+            word_start -= 1
+        allows_reference = patterns.declarations.get(content[word_start:pos].lower())
+        if allows_reference is None or (by_reference and not allows_reference):
+            return True
+        return bool(word_start) and patterns.ident_char.match(content, word_start - 1) is not None
+    
+    def _skip_back(self, pos, limit, chars):
+        """ตำแหน่งแรกก่อน pos ที่ไม่ใช่ตัวอักษรใน chars (ไม่ย้อนเกิน limit)"""
+        content = self.content
+        while pos > limit and content[pos - 1:pos] in chars:
+            pos -= 1
+        return pos
+    
+    def tokens(self, start=0, end=None):
+        """คืน (kind, start, end) ของ token ที่ทับช่วง [start, end)"""
+        end = self._size if end is None else min(end, self._size)
+        if start >= end:
+            return
+        self._lex(end - 1)
+        for index in range(max(bisect.bisect_right(self._starts, start) - 1, 0), len(self._kinds)):
+            if self._starts[index] >= end:
+                break
+            yield self._kinds[index], self._starts[index], self._ends[index]
+    
+    def state_at(self, offset):
+        """สถานะของ lexer ที่ offset สำหรับ lex เนื้อหาที่เริ่มจาก offset ต่อ (เช่น window ถัดไป)"""
+        index = self._token_index(offset)
+        if index is None:
+            return self._state
+        if self._starts[index] == offset:
+            return self._line_state(self._entry_states[index], offset)
+        state = self._inner_states[index]
+        mode, label = state
+        if mode == 'interp':
+            # นับ { } จากต้น token เพื่อรู้ความลึกที่ offset (0 = กลับมาอยู่ใน string แล้ว)
+            outer, depth = label
+            code = self.content[self._starts[index]:offset]
+            depth += code.count(self.patterns.open_brace) - code.count(self.patterns.close_brace)
+            outer = self._line_state(outer, offset)
+            return ('interp', (outer, depth)) if depth > 0 else outer
+        # offset อยู่กลางตัวปิด (*/, ?>, ชื่อปิด heredoc) ถือว่าปิดแล้ว ส่วนที่เหลือของตัวปิดไม่มีผลใน mode ถัดไป
+        pair = self.content[offset - 1:offset + 1]
+        if mode == 'block':
+            # ตำแหน่งของ / ในตัวเปิด /* ของ comment นี้ (None = อยู่ก่อนต้นเนื้อหา)
+            entry = self._entry_states[index]
+            if entry[0] != 'block':
+                opened = self._starts[index]
+            elif entry[1] == 'open':
+                opened = self._starts[index] - 1
+            else:
+                opened = None
+            if pair == self.patterns.block_end and offset - 2 != opened:
+                # / ที่เหลือของ */ ต้องไม่ไปรวมกับ * หรือ / ถัดไปเป็นตัวเปิด comment ใหม่
+                return ('code', 'closed')
+            # ระหว่าง / กับ * ของตัวเปิด: * ตัวนี้ใช้เป็นส่วนของ */ ไม่ได้
+            return ('block', 'open' if offset - 1 == opened else None)
+        if mode == 'code' and pair == self.patterns.close_tag:
+            return ('html', None)
+        if mode.startswith(('heredoc', 'nowdoc')):
+            newline = self.content.rfind(self.patterns.newline, 0, offset)
+            closing = self.patterns.heredoc_end(label).match(self.content, newline + 1)
+            if newline >= self._starts[index] and closing and closing.end() == self._ends[index]:
+                return ('code', None) if offset > newline + 1 else (mode.split('-')[0], label)
+        return self._line_state(state, offset)
+    
+    def _line_state(self, state, offset):
+        """state ของ heredoc/nowdoc ที่ offset: ถ้าไม่อยู่ต้นบรรทัดใช้ mode -tail"""
+        mode, label = state
+        mode = mode.split('-')[0]
+        if mode not in ('heredoc', 'nowdoc'):
+            return state
+        at_line_start = offset == 0 or self.content[offset - 1:offset] == self.patterns.newline
+        return (mode if at_line_start else f'{mode}-tail', label)
+    
+    def _token_index(self, offset):
+        if offset >= self._pos:
+            self._lex(offset)
+        if not self._starts or offset < 0 or offset >= self._ends[-1]:
+            return None
+        return bisect.bisect_right(self._starts, offset) - 1
+    
+    def _emit(self, kind, start, end, entry, inner):
+        if end <= start:
+            return
+        # รวมกับ token ก่อนหน้าเฉพาะเมื่อ state ไม่เปลี่ยนตรงรอยต่อ เพื่อให้ state_at ยังถูกต้อง
+        if self._kinds and self._kinds[-1] == kind and self._ends[-1] == start \
+                and self._inner_states[-1] == entry == inner:
+            self._ends[-1] = end
+            return
+        self._starts.append(start)
+        self._ends.append(end)
+        self._kinds.append(kind)
+        self._entry_states.append(entry)
+        self._inner_states.append(inner)
+    
+    def _lex(self, offset):
+        """lex ต่อจนถึง token ที่ครอบ offset"""
+        started = time.perf_counter()
+        if self._state is None:
+            # เนื้อหาที่ไม่มี <?php เลย (ชิ้นส่วนโค้ด หรือ response ที่ไม่ใช่ PHP) ถือเป็น code ทั้งหมด
+            # ให้ผลเหมือนการสแกนข้อความดิบ แทนที่จะมองเป็น HTML แล้วไม่พบอะไรเลย
+            has_open_tag = self.patterns.open_tag.search(self.content) is not None
+            self._state = ('html', None) if has_open_tag else ('code', None)
+        while self._pos <= offset and self._pos < self._size:
+            self._step()
+        self.seconds += time.perf_counter() - started
+    
+    def _step(self):
+        """lex หนึ่งช่วงตาม mode ปัจจุบัน แล้วเลื่อน _pos และเปลี่ยน _state"""
+        content, patterns, pos, size = self.content, self.patterns, self._pos, self._size
+        mode, label = state = self._state
+        code = ('code', None)
+        
+        if mode == 'html':
+            match = patterns.open_tag.search(content, pos)
+            end = match.start() if match else size
+            self._emit(TOKEN_HTML, pos, end, state, state)
+            self._pos, self._state = end, code
+        elif mode == 'halted':
+            self._emit(TOKEN_HTML, pos, size, state, state)
+            self._pos = size
+        elif mode == 'code':
+            match = patterns.code_break.search(content, pos + 1 if label else pos)
+            if match is None:
+                self._emit(TOKEN_CODE, pos, size, code, code)
+                self._pos = size
+                return
+            self._emit(TOKEN_CODE, pos, match.start(), code, code)
+            group = match.lastgroup
+            if group == 'close':
+                self._emit(TOKEN_CODE, match.start(), match.end(), code, code)
+                self._pos, self._state = match.end(), ('html', None)
+            elif group == 'halt':
+                end = patterns.halt_tail.match(content, match.end()).end()
+                self._emit(TOKEN_CODE, match.start(), end, code, code)
+                self._pos, self._state = end, ('halted', None)
+            else:
+                if group == 'heredoc':
+                    label = match.group('label')
+                    inner = ('nowdoc' if match.group('quote') in ("'", b"'") else 'heredoc', label)
+                else:
+                    inner = (group, None)
+                # ตัวเปิด (// /* ' " ` <<<ID) อยู่ใน token เดียวกับเนื้อหา แต่ resume ที่ตัวเปิดต้องเริ่มจาก code
+                self._emit(_MODE_KINDS[inner[0]], match.start(), match.end(), code, inner)
+                self._pos, self._state = match.end(), inner
+        elif mode == 'line':
+            match = patterns.line_end.search(content, pos)
+            end = match.start() if match else size
+            self._emit(TOKEN_COMMENT, pos, end, state, state)
+            self._pos, self._state = end, code
+        elif mode == 'block':
+            end = content.find(patterns.block_end, pos + 1 if label else pos)
+            end = size if end == -1 else end + 2
+            self._emit(TOKEN_COMMENT, pos, end, state, state)
+            self._pos, self._state = end, code
+        elif mode == 'double':
+            match = patterns.quoted['double'].match(content, pos)
+            end = match.end() if match else size
+            if patterns.interpolation.search(content, pos, end):
+                end = self._lex_double(pos)
+            else:
+                self._emit(TOKEN_STRING, pos, end, state, state)
+            self._pos, self._state = end, code
+        elif mode in ('single', 'backtick'):
+            match = patterns.quoted[mode].match(content, pos)
+            end = match.end() if match else size
+            self._emit(TOKEN_STRING, pos, end, state, state)
+            self._pos, self._state = end, code
+        elif mode == 'interp':
+            outer, depth = label
+            end = self._heredoc_end(outer, pos)[0] if outer[0] != 'double' else size
+            pos = self._emit_code_block(pos, outer, end, depth)
+            self._pos, self._state = pos, outer
+        else:
+            body_end, end = self._heredoc_end(state, pos)
+            if mode.startswith('heredoc'):
+                self._emit_interpolated(pos, body_end, state)
+                self._emit(TOKEN_STRING, body_end, end, state, state)
+            else:
+                self._emit(TOKEN_STRING, pos, end, state, state)
+            self._pos, self._state = end, code
+    
+    def _heredoc_end(self, state, pos):
+        """(ต้นบรรทัดปิด, ตำแหน่งหลังชื่อปิด) ของ heredoc/nowdoc ที่ lex ถึง pos"""
+        mode, label = state
+        # -tail: เนื้อหาก่อน pos ในบรรทัดนี้อยู่นอก window จึงเริ่มหาบรรทัดปิดจากบรรทัดถัดไป
+        at_line_start = pos > 0 and self.content[pos - 1:pos] == self.patterns.newline
+        if mode.endswith('-tail') and not at_line_start:
+            newline = self.content.find(self.patterns.newline, pos)
+            pos = self._size if newline == -1 else newline + 1
+        match = self.patterns.heredoc_end(label).search(self.content, pos)
+        return match.span() if match else (self._size, self._size)
+    
+    def _lex_double(self, pos):
+        """string "..." ที่มี {$...} / ${...} (ซึ่งอาจมี " อยู่ข้างใน) คืนตำแหน่งหลัง " ปิด"""
+        content, patterns, size = self.content, self.patterns, self._size
+        state = ('double', None)
+        start = pos
+        while True:
+            pos = patterns.double_body.match(content, pos).end()
+            if pos >= size:
+                self._emit(TOKEN_STRING, start, size, state, state)
+                return size
+            if content[pos:pos + 1] == patterns.double_quote:
+                self._emit(TOKEN_STRING, start, pos + 1, state, state)
+                return pos + 1
+            self._emit(TOKEN_STRING, start, pos, state, state)
+            start = pos = self._emit_code_block(pos, state, size)
+    
+    def _emit_interpolated(self, start, end, state):
+        """เนื้อหา heredoc ช่วง [start, end) แยก {$...} / ${...} ออกเป็น code"""
+        patterns = self.patterns
+        while start < end:
+            match = patterns.interpolation.search(self.content, start, end)
+            if match is None:
+                self._emit(TOKEN_STRING, start, end, state, state)
+                return
+            self._emit(TOKEN_STRING, start, match.start(), state, state)
+            start = self._emit_code_block(match.start(), state, end)
+    
+    def _emit_code_block(self, pos, state, limit, depth=0):
+        """code ใน {$...} หรือ ${...} ที่ pos จนถึง } ที่ปิดคู่กัน (ไม่เกิน limit) คืนตำแหน่งหลัง }
+        
+        depth > 0 คือ resume กลาง block ที่มี { เปิดค้างอยู่ depth ตัว
+        """
+        end, depth_at_start = limit, depth
+        for brace in self.patterns.brace.finditer(self.content, pos, limit):
+            depth += 1 if brace.group() == self.patterns.open_brace else -1
+            if depth == 0:
+                end = brace.end()
+                break
+        # resume ที่ต้น block คือ lex string ต่อ ส่วนกลาง block ดู state_at
+        inner = ('interp', (state, depth_at_start))
+        self._emit(TOKEN_CODE, pos, end, inner if depth_at_start else state, inner)
+        return end
+
 # ========== Scanning Functions (เหมือนเดิม) ==========
 
 def calculate_file_hash(content):
-    return hashlib.md5(content.encode('utf-8', errors='ignore')).hexdigest()
+    if isinstance(content, str):
+        content = content.encode('utf-8', errors='ignore')
+    return hashlib.md5(content).hexdigest()
 
-def scan_dangerous_functions(content, filename):
-    results = []
-    lines = content.split('\n')
+def newline_for(content):
+    """ตัวขึ้นบรรทัดใหม่ที่เป็นชนิดเดียวกับ content (str หรือ bytes/mmap)"""
+    return '\n' if isinstance(content, str) else b'\n'
+
+def decode_line(line):
+    """แปลงบรรทัดจาก bytes เป็น str สำหรับแสดงผล (str คืนค่าเดิม)"""
+    return line if isinstance(line, str) else line.decode('utf-8', errors='replace')
+
+class LineIndex:
+    """แปลง offset ในเนื้อหาเป็นเลขบรรทัด โดย bisect บนตำแหน่ง newline"""
+    def __init__(self, content):
+        self.content = content
+        self.newline = newline_for(content)
+        self._newlines = None
+    
+    @property
+    def newlines(self):
+        """ตำแหน่ง newline ทั้งหมด (สร้างเมื่อใช้ครั้งแรก ไฟล์ที่ไม่มี finding จึงไม่เสียเวลา)"""
+        if self._newlines is None:
+            self._newlines = [m.start() for m in re.finditer(re.escape(self.newline), self.content)]
+        return self._newlines
+    
+    def line_number(self, offset):
+        """เลขบรรทัด (เริ่มที่ 1) ของตำแหน่ง offset"""
+        return bisect.bisect_left(self.newlines, offset) + 1
+    
+    def line_start(self, line_no):
+        """offset ของตัวอักษรแรกในบรรทัด line_no"""
+        return self.newlines[line_no - 2] + 1 if line_no > 1 else 0
+    
+    def line_end(self, line_no):
+        """offset ของ newline ที่จบบรรทัด line_no (หรือความยาวเนื้อหาถ้าเป็นบรรทัดสุดท้าย)"""
+        return self.newlines[line_no - 1] if line_no <= len(self.newlines) else len(self.content)
+    
+    def raw_line(self, line_no):
+        """เนื้อหาของบรรทัด line_no (ไม่รวม newline) เป็นชนิดเดียวกับ content"""
+        return self.content[self.line_start(line_no):self.line_end(line_no)]
+    
+    def line_text(self, line_no):
+        """ข้อความของบรรทัด line_no (ไม่รวม newline)"""
+        return decode_line(self.raw_line(line_no))
+    
+    def snippet(self, line_no, focus=None, limit=MAX_SNIPPET_LENGTH):
+        """ข้อความของบรรทัด (strip แล้ว) ไม่เกิน limit ตัวอักษร
+        
+        บรรทัดยาว (เช่น payload ที่ถูก pack เป็นบรรทัดเดียว) จะตัดเฉพาะช่วงรอบ focus
+        โดยไม่คัดลอกทั้งบรรทัด
+        """
+        start, end = self.line_start(line_no), self.line_end(line_no)
+        if end - start <= limit:
+            return self.line_text(line_no).strip()
+        if focus is None or not start <= focus < end:
+            focus = start
+        low = max(start, min(focus - limit // 4, end - limit))
+        high = low + limit
+        text = decode_line(self.content[low:high]).strip()
+        return ('...' if low > start else '') + text + ('...' if high < end else '')
+
+NEWLINE_COUNT_CHUNK = 1024 * 1024
+
+class MappedLineIndex(LineIndex):
+    """LineIndex สำหรับ bytes/mmap ที่ไม่เก็บตำแหน่ง newline ทั้งไฟล์
+    
+    เลขบรรทัดถูกนับเฉพาะเมื่อมี finding โดยนับ newline ต่อจาก checkpoint ที่ใกล้ที่สุด
+    (บรรทัดที่เคยหาแล้ว) หน่วยความจำจึงขึ้นกับจำนวน finding ไม่ใช่จำนวนบรรทัด
+    """
+    def __init__(self, content):
+        super().__init__(content)
+        # checkpoint: offset ต้นบรรทัด และเลขบรรทัดของมัน เรียงจากน้อยไปมาก
+        self._starts = [0]
+        self._lines = [1]
+    
+    def _count_newlines(self, start, end):
+        count = 0
+        for pos in range(start, end, NEWLINE_COUNT_CHUNK):
+            count += self.content[pos:min(pos + NEWLINE_COUNT_CHUNK, end)].count(b'\n')
+        return count
+    
+    def _remember(self, start, line_no):
+        i = bisect.bisect_left(self._lines, line_no)
+        if i == len(self._lines) or self._lines[i] != line_no:
+            self._lines.insert(i, line_no)
+            self._starts.insert(i, start)
     
-    for severity, functions in DANGEROUS_FUNCTIONS.items():
+    def line_number(self, offset):
+        i = bisect.bisect_right(self._starts, offset) - 1
+        start = self.content.rfind(b'\n', self._starts[i], offset) + 1 or self._starts[i]
+        line_no = self._lines[i] + self._count_newlines(self._starts[i], start)
+        self._remember(start, line_no)
+        return line_no
+    
+    def line_start(self, line_no):
+        i = bisect.bisect_right(self._lines, line_no) - 1
+        start = self._starts[i]
+        for _ in range(line_no - self._lines[i]):
+            start = self.content.find(b'\n', start) + 1
+        self._remember(start, line_no)
+        return start
+    
+    def line_end(self, line_no):
+        end = self.content.find(b'\n', self.line_start(line_no))
+        return end if end != -1 else len(self.content)
+
+def line_index_for(content):
+    """LineIndex ที่เหมาะกับชนิดของ content"""
+    return LineIndex(content) if isinstance(content, str) else MappedLineIndex(content)
+
+def function_pattern(func):
+    """regex ของการเรียกฟังก์ชัน func"""
+    # [^\S\n] = whitespace ที่ไม่ใช่ newline เพื่อให้ match อยู่ในบรรทัดเดียวเหมือนเดิม
+    return rf'{func}[^\S\n]*\('
+
+def compile_rule(pattern, flags=re.IGNORECASE, binary=False, prone=None):
+    """compile pattern เป็น regex สำหรับ str หรือ bytes (binary=True)
+    
+    pattern ที่เสี่ยง backtracking ใช้ RE2 ถ้าติดตั้งไว้และรองรับ pattern นั้น
+    prone คือผลของ is_backtracking_prone ที่คำนวณไว้แล้ว (None = คำนวณใหม่)
+    regex ของ str ใช้ re.ASCII ให้ class อย่าง \\s และ \\w มีความหมายเดียวกับ regex ของ bytes (และ RE2)
+    ไฟล์เดียวกันจึงได้ผลเท่ากันไม่ว่าจะสแกนเป็น str (URL) หรือ bytes (mmap/ZIP)
+    """
+    source = pattern.encode('utf-8') if binary else pattern
+    if is_backtracking_prone(pattern) if prone is None else prone:
+        regex = compile_linear(source, flags, binary)
+        if regex is not None:
+            return regex
+    return re.compile(source, flags if binary else flags | re.ASCII)
+
+FUNCTION_RULE = 'function/*'   # rule id ของ regex รวมของฟังก์ชันอันตรายทั้งหมด
+
+def build_function_matcher(functions_db, binary=False):
+    """รวมทุกฟังก์ชันเป็น regex เดียว (named group ต่อฟังก์ชัน) เพื่อสแกนรอบเดียว"""
+    rules = []
+    alternatives = []
+    for severity, functions in functions_db.items():
         for func in functions:
-            pattern = rf'\b{func}\s*\('
-            for i, line in enumerate(lines, 1):
-                if re.search(pattern, line, re.IGNORECASE):
-                    results.append({
-                        'type': 'dangerous_function',
-                        'severity': severity,
-                        'line': i,
-                        'code': line.strip(),
-                        'function': func,
-                        'description': f'Dangerous function: {func}()'
-                    })
+            alternatives.append(rf'(?P<f{len(rules)}>{function_pattern(func)})')
+            rules.append((severity, func))
+    
+    # lookahead ไม่กินตัวอักษร ทำให้ match ที่ซ้อนกันในบรรทัดเดียวกันยังถูกพบ
+    # ส่วน character class ด้านหน้าช่วยตัดตำแหน่งที่ไม่มีทางตรงออกอย่างเร็ว
+    # ขอบหน้าชื่อใช้ตัวอักษรของ identifier ใน PHP (byte >= 0x80 เป็นส่วนของชื่อได้) แทน \b
+    # ที่ต่างกันระหว่าง str กับ bytes: "ébase64_decode(" ไม่ใช่การเรียก base64_decode ทั้งสองทาง
+    first_chars = ''.join(sorted({re.escape(func[0].lower()) for _, func in rules}))
+    ident_char = r'\x80-\xff' if binary else r'\x80-\U0010ffff'
+    pattern = compile_rule(
+        rf'(?<![A-Za-z0-9_{ident_char}])(?=[{first_chars}])(?=' + '|'.join(alternatives) + ')',
+        binary=binary
+    )
+    return pattern, rules
+
+class PatternRule:
+    """rule หนึ่งตัวของ SUSPICIOUS_PATTERNS หรือ rule pack regex ถูก compile เมื่อใช้ครั้งแรก
+    
+    scope คือชนิด token (TOKEN_KINDS) ที่ match ต้องเริ่มอยู่ข้างใน None = ทุกที่
+    """
+    __slots__ = ('id', 'source', 'prone', 'scope', '_compiled')
+    
+    def __init__(self, rule_id, source, prone=None, scope=None):
+        self.id = rule_id
+        self.source = source
+        self.prone = prone
+        self.scope = tuple(scope) if scope else None
+        self._compiled = {}
+    
+    def regex(self, binary=False):
+        """regex สำหรับ str หรือ bytes (binary=True)"""
+        compiled = self._compiled.get(binary)
+        if compiled is None:
+            compiled = self._compiled[binary] = compile_rule(self.source, binary=binary,
+                                                             prone=self.prone)
+        return compiled
+
+def in_owned_range(offset, owned):
+    """ตรวจว่า match ที่เริ่มที่ offset เป็นของ window นี้หรือไม่ (owned=None คือทั้งหมด)"""
+    return owned is None or owned[0] <= offset < owned[1]
+
+def scan_dangerous_functions(content, filename, index=None, spans=None, owned=None, line_offset=0,
+                             offset=0, rules=None, tokens=None):
+    """หาการเรียกฟังก์ชันอันตราย นับเฉพาะที่เป็นการเรียกจริงใน code token (PhpTokens.is_call)
+    
+    ชื่อฟังก์ชันใน comment, string, HTML หรือ method call อย่าง $obj->copy( จึงไม่เป็น finding
+    """
+    results = []
+    tokens = tokens or PhpTokens(content)
+    rules = rules or RULES
+    pattern, functions = rules.function_matcher(binary=not isinstance(content, str))
+    index = index or line_index_for(content)
+    deadline = rule_deadline(content)
+    
+    # หนึ่ง finding ต่อ (ฟังก์ชัน, บรรทัด) เรียงตามลำดับใน DANGEROUS_FUNCTIONS เหมือนเดิม
+    # เก็บตำแหน่งของ match แรกในบรรทัดไว้เป็น offset ของ finding
+    hits = {}
+    try:
+        for start, end in rules.prefilter.spans_for(FUNCTION_RULE, index, spans):
+            # regex รวมของชื่อฟังก์ชันไม่มี repeat กว้าง (ไม่เสี่ยง backtracking) จึงค้นทั้งช่วง
+            check_deadline(deadline, start)
+            for match in pattern.finditer(content, start, end):
+                if in_owned_range(match.start(), owned) and tokens.is_call(match.start()):
+                    key = (int(match.lastgroup[1:]), index.line_number(match.start()))
+                    hits.setdefault(key, match.span(match.lastgroup))
+    except RuleTimeout as timeout:
+        finding = rule_timeout_finding(FUNCTION_RULE, index, timeout.position, owned, line_offset, offset)
+        if finding is not None:
+            results.append(finding)
+    
+    for (rule_id, line_no), (start, end) in sorted(hits.items()):
+        severity, func = functions[rule_id]
+        results.append(Finding(
+            'dangerous_function', severity, line_no + line_offset,
+            index.snippet(line_no, start), func, f'function/{func}',
+            start + offset, end + offset
+        ))
     return results
 
-def scan_suspicious_patterns(content, filename):
-    results = []
-    lines = content.split('\n')
-    
-    for category, patterns in SUSPICIOUS_PATTERNS.items():
-        for pattern in patterns:
-            for i, line in enumerate(lines, 1):
-                matches = re.finditer(pattern, line, re.IGNORECASE)
-                for match in matches:
-                    results.append({
-                        'type': 'suspicious_pattern',
-                        'severity': 'high' if category in ['backdoor', 'webshell'] else 'medium',
-                        'line': i,
-                        'code': line.strip(),
-                        'category': category,
-                        'description': f'Suspicious {category} pattern detected'
-                    })
-    return results
+def iter_pattern_matches(regex, index, cross_line=False, span=None, deadline=None, windowed=False):
+    """หา match ของ regex ทั้ง buffer (หรือเฉพาะช่วง span) คืนค่าเป็น (start, end)
+    
+    ถ้า cross_line=False ผลจะเหมือนการ match ทีละบรรทัด: match ที่ข้ามบรรทัด
+    จะถูกสแกนใหม่เฉพาะบรรทัดนั้น แล้วค้นต่อจากบรรทัดถัดไป
+    span ต้องเริ่มและจบที่ขอบบรรทัด
+    
+    windowed=True ค้นทีละ window (iter_search_windows) เพื่อไม่ให้ backtracking บนบรรทัดยาว
+    โตเกินขนาด window และตรวจ deadline ระหว่าง window (เกินแล้วโยน RuleTimeout)
+    """
+    content = index.content
+    start, end = span or (0, len(content))
+    resume = start
+    
+    for pos, endpos, owned_end in iter_search_windows(start, end, windowed=windowed, index=index):
+        check_deadline(deadline, pos)
+        # ไม่ค้นซ้ำในช่วงที่ match ก่อนหน้าครอบไว้แล้ว เหมือน finditer ต่อเนื่องทั้งช่วง
+        for match_start, match_end in _window_matches(regex, index, cross_line,
+                                                      max(pos, resume), endpos):
+            if match_start >= owned_end:
+                break
+            resume = match_end
+            yield match_start, match_end
+
+def _window_matches(regex, index, cross_line, pos, endpos):
+    content = index.content
+    # finditer ต่อเนื่อง (ไม่ search ใหม่ทุก match): RE2 ตัด slice เฉพาะตอนเริ่มค้นใหม่
+    while pos <= endpos:
+        restart = None
+        for match in regex.finditer(content, pos, endpos):
+            start, end = match.span()
+            if cross_line or content.find(index.newline, start, end) == -1:
+                yield start, end
+                continue
+            
+            line_end = min(index.line_end(index.line_number(start)), endpos)
+            for line_match in regex.finditer(content, start, line_end):
+                yield line_match.span()
+            restart = line_end + 1
+            break
+        if restart is None:
+            return
+        pos = restart
+
+def scan_suspicious_patterns(content, filename, cross_line=False, index=None, spans=None,
+                             owned=None, line_offset=0, offset=0, timer=None, rules=None,
+                             tokens=None):
+    """หา pattern น่าสงสัย rule ที่มี scope นับเฉพาะ match ที่เริ่มใน token ชนิดนั้น
+    
+    rule ที่ไม่มี scope (built-in ทั้งหมด) ดูเนื้อหาดิบ เพราะ payload มักซ่อนอยู่ใน string
+    """
+    results = []
+    rules = rules or RULES
+    tokens = tokens or PhpTokens(content)
+    index = index or line_index_for(content)
+    binary = not isinstance(content, str)
+    
+    for category, pattern_rules in rules.patterns.items():
+        severity = rules.severity(category)
+        for pattern_rule in pattern_rules:
+            rule = pattern_rule.id
+            started = time.perf_counter()
+            deadline = rule_deadline(content)
+            matches = 0
+            # match ซ้ำของ pattern เดียวกันในบรรทัดเดียวกันนับเป็น finding เดียว
+            seen_lines = set()
+            try:
+                # compile regex เฉพาะเมื่อมีช่วงให้รันจริง (rule ที่ keyword ไม่ปรากฏไม่ต้อง compile)
+                for span in rules.prefilter.spans_for(pattern_rule, index, spans, cross_line):
+                    regex = pattern_rule.regex(binary)
+                    windowed = needs_search_windows(regex, pattern_rule.prone)
+                    for start, end in iter_pattern_matches(regex, index, cross_line, span, deadline,
+                                                           windowed):
+                        if not in_owned_range(start, owned):
+                            continue
+                        if pattern_rule.scope and tokens.kind_at(start) not in pattern_rule.scope:
+                            continue
+                        first_line = index.line_number(start)
+                        if first_line in seen_lines:
+                            continue
+                        seen_lines.add(first_line)
+                        matches += 1
+                        last_line = index.line_number(max(start, end - 1))
+                        code = '\n'.join(
+                            index.snippet(n, start) for n in range(first_line, last_line + 1)
+                        )
+                        results.append(Finding(
+                            'suspicious_pattern', severity, first_line + line_offset, code,
+                            category, rule, start + offset, end + offset
+                        ))
+            except RuleTimeout as timeout:
+                finding = rule_timeout_finding(rule, index, timeout.position, owned, line_offset, offset)
+                if finding is not None:
+                    results.append(finding)
+            if timer is not None:
+                timer.add_rule(rule, time.perf_counter() - started, matches)
+    return results
+
+# ========== Entropy & Obfuscation Metrics ==========
+
+ENTROPY_MIN_LINE_LENGTH = 200      # บรรทัดที่สั้นกว่านี้ (bytes) ไม่นำมาคิดสถิติ
+ENTROPY_BLOCK_SIZE = 1024 * 1024   # bytes ต่อรอบของ numpy เพื่อจำกัดหน่วยความจำชั่วคราว
+HIGH_ENTROPY_THRESHOLD = 5.2       # bits ต่อ byte (ข้อความ base64/ข้อมูลบีบอัดมัก ~6)
+LONG_TOKEN_THRESHOLD = 64          # ความยาวต่อเนื่องของอักขระแบบ base64/hex
+SYMBOL_RATIO_THRESHOLD = 0.5       # สัดส่วนอักขระที่ไม่ใช่ตัวอักษร ตัวเลข หรือช่องว่าง
+SYMBOL_MIN_ENTROPY = 2.0           # bits ต่อ byte ขั้นต่ำของบรรทัดสัญลักษณ์ (เส้นคั่น /****/ หรือ -=-= ต่ำกว่านี้มาก)
+
+def _byte_class(chars):
+    table = np.zeros(256, dtype=bool)
+    table[list(chars.encode('ascii'))] = True
+    return table
+
+_ALNUM = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789'
+TOKEN_BYTES = _byte_class(_ALNUM + '+/=_')
+# byte >= 0x80 เป็นส่วนของตัวอักษร UTF-8 (ไทย จีน ฯลฯ) ไม่นับเป็นสัญลักษณ์
+SYMBOL_BYTES = ~_byte_class(_ALNUM + ' \t\r\n\f\v')
+SYMBOL_BYTES[0x80:] = False
+
+def as_byte_array(content):
+    """มองเนื้อหาเป็น array ของ uint8 (bytes/mmap ไม่ถูกคัดลอก)"""
+    if isinstance(content, str):
+        content = content.encode('utf-8', errors='replace')
+    return np.frombuffer(content, dtype=np.uint8)
+
+def line_bounds(data):
+    """offset เริ่มและจบ (ไม่รวม newline) ของทุกบรรทัด"""
+    newlines = [np.flatnonzero(data[pos:pos + ENTROPY_BLOCK_SIZE] == 10) + pos
+                for pos in range(0, len(data), ENTROPY_BLOCK_SIZE)]
+    newlines = np.concatenate(newlines) if newlines else np.empty(0, dtype=np.int64)
+    starts = np.concatenate(([0], newlines + 1))
+    ends = np.concatenate((newlines, [len(data)]))
+    return starts, ends
+
+def entropy_from_histogram(hist):
+    """Shannon entropy (bits ต่อ byte) ของแต่ละแถวใน histogram"""
+    totals = hist.sum(axis=1, keepdims=True)
+    p = hist / np.maximum(totals, 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        terms = np.where(p > 0, p * np.log2(p), 0.0)
+    return -terms.sum(axis=1)
+
+def line_statistics(data):
+    """สถิติของบรรทัดที่ยาวอย่างน้อย ENTROPY_MIN_LINE_LENGTH คำนวณแบบ vectorized ทีละ block
+    
+    คืน (lines, entropy, symbol_ratio, longest_token) โดย lines คือ index ของบรรทัด (เริ่มที่ 0)
+    บรรทัดที่คร่อมหลาย block จะสะสม histogram และความยาว token ต่อไปยัง block ถัดไป
+    """
+    starts, ends = line_bounds(data)
+    is_candidate = (ends - starts) >= ENTROPY_MIN_LINE_LENGTH
+    lines = np.flatnonzero(is_candidate)
+    count = len(lines)
+    entropy = np.zeros(count)
+    symbol_ratio = np.zeros(count)
+    longest = np.zeros(count, dtype=np.int64)
+    if count == 0:
+        return lines, entropy, symbol_ratio, longest
+    
+    rank = np.cumsum(is_candidate) - 1
+    carry_hist = np.zeros(256, dtype=np.int64)
+    carry_run = 0
+    
+    for block_start in range(starts[lines[0]], ends[lines[-1]], ENTROPY_BLOCK_SIZE):
+        block = data[block_start:min(block_start + ENTROPY_BLOCK_SIZE, len(data))]
+        block_line = np.searchsorted(starts, block_start, side='right') - 1
+        is_newline = block == 10
+        
+        if not is_newline.any():
+            # ทั้ง block อยู่ในบรรทัดเดียว (เช่น payload ที่ถูก pack) ไม่ต้องหาบรรทัดของแต่ละ byte
+            if not is_candidate[block_line]:
+                carry_run = 0
+                continue
+            line_ids = None
+            first = last = rank[block_line]
+            hist = np.bincount(block, minlength=256)[np.newaxis]
+        else:
+            line_ids = block_line + np.cumsum(is_newline, dtype=np.int32) - is_newline
+            keep = is_candidate[line_ids] & ~is_newline
+            if not keep.any():
+                carry_run = 0
+                continue
+            ranks = rank[line_ids[keep]]
+            first, last = ranks[0], ranks[-1]
+            hist = np.bincount((ranks - first) * 256 + block[keep],
+                               minlength=(last - first + 1) * 256).reshape(-1, 256)
+        hist[0] += carry_hist
+        
+        # ความยาวของ run อักขระ token แต่ละช่วง นับต่อจาก run ที่ค้างจาก block ก่อน
+        is_token = TOKEN_BYTES[block]
+        edges = np.diff(np.concatenate(([0], is_token.view(np.int8), [0])))
+        run_starts = np.flatnonzero(edges == 1)
+        run_lengths = np.flatnonzero(edges == -1) - run_starts
+        if len(run_starts) and run_starts[0] == 0:
+            run_lengths[0] += carry_run
+        block_longest = np.zeros(last - first + 1, dtype=np.int64)
+        block_longest[0] = longest[first]
+        if line_ids is None:
+            block_longest[0] = max(block_longest[0], run_lengths.max(initial=0))
+        else:
+            run_lines = line_ids[run_starts]
+            on_candidate = is_candidate[run_lines]
+            np.maximum.at(block_longest, rank[run_lines[on_candidate]] - first,
+                          run_lengths[on_candidate])
+        
+        carry_run = run_lengths[-1] if len(run_starts) and is_token[-1] else 0
+        finished = last - first + 1
+        if ends[lines[last]] > block_start + len(block):
+            # บรรทัดสุดท้ายยังไม่จบ เก็บไว้รวมกับ block ถัดไป
+            carry_hist = hist[-1].copy()
+            finished -= 1
+        else:
+            carry_hist = np.zeros(256, dtype=np.int64)
+        longest[first:last + 1] = block_longest
+        
+        done = slice(first, first + finished)
+        entropy[done] = entropy_from_histogram(hist[:finished])
+        symbol_ratio[done] = hist[:finished] @ SYMBOL_BYTES / np.maximum(hist[:finished].sum(axis=1), 1)
+    
+    return lines, entropy, symbol_ratio, longest
+
+def scan_obfuscation_metrics(content, filename, index=None, owned=None, line_offset=0, offset=0):
+    """ตรวจบรรทัดที่ดูเหมือนถูก encode/obfuscate จาก entropy สัดส่วนสัญลักษณ์ และ token ที่ยาว"""
+    results = []
+    if len(content) < ENTROPY_MIN_LINE_LENGTH:
+        return results
+    index = index or line_index_for(content)
+    
+    data = as_byte_array(content)
+    lines, entropy, symbol_ratio, longest = line_statistics(data)
+    del data
+    
+    for line, line_entropy, ratio, token in zip(lines.tolist(), entropy.tolist(),
+                                                symbol_ratio.tolist(), longest.tolist()):
+        flagged = []
+        if line_entropy >= HIGH_ENTROPY_THRESHOLD and token >= LONG_TOKEN_THRESHOLD:
+            flagged.append(('entropy/encoded_blob',
+                            f'High-entropy encoded data (entropy {line_entropy:.2f}, longest token {token})'))
+        if ratio >= SYMBOL_RATIO_THRESHOLD and line_entropy >= SYMBOL_MIN_ENTROPY:
+            flagged.append(('entropy/symbol_density',
+                            f'Symbol-heavy obfuscated code ({ratio:.0%} symbols, entropy {line_entropy:.2f})'))
+        if not flagged:
+            continue
+        
+        line_no = line + 1
+        start = index.line_start(line_no)
+        if not in_owned_range(start, owned):
+            continue
+        end = index.line_end(line_no)
+        for rule, description in flagged:
+            results.append(Finding(
+                'entropy_anomaly', 'medium', line_no + line_offset, index.snippet(line_no),
+                'obfuscation', rule, start + offset, end + offset, description
+            ))
+    return results
+
+# ========== Keyword Prefilter ==========
+
+MAX_LITERAL_ALTERNATIVES = 64
+MIN_KEYWORD_LENGTH = 3
+PREFILTER_CHUNK_SIZE = 1024 * 1024
+PREFILTER_TEXT_LIMIT = 16 * 1024 * 1024   # bytes สูงสุดของบรรทัดที่พบ keyword ที่คัดลอกไว้กรองราย rule
+
+def _best_literals(candidates):
+    """เลือกชุด literal ที่คัดกรองได้ดีที่สุด (คำที่สั้นที่สุดในชุดยาวที่สุด)"""
+    valid = [c for c in candidates if c and '' not in c]
+    if not valid:
+        return None
+    return max(valid, key=lambda c: (min(len(s) for s in c), -len(c)))
+
+def _sequence_literals(items):
+    """คืน (exact, required) ของลำดับ node ที่ parse แล้ว
+    
+    exact = ชุดข้อความทั้งหมดที่ลำดับนี้ match ได้ (None ถ้าไม่จำกัด)
+    required = ชุด literal ที่ทุก match ต้องมีอย่างน้อยหนึ่งคำ (None ถ้าหาไม่ได้)
+    """
+    run = {''}
+    is_exact = True
+    candidates = []
+    
+    for op, av in items:
+        exact, required = _node_literals(op, av)
+        candidates.append(required)
+        if exact is not None and len(run) * len(exact) <= MAX_LITERAL_ALTERNATIVES:
+            run = {a + b for a in run for b in exact}
+            continue
+        candidates.append(run)
+        is_exact = False
+        run = exact if exact is not None else {''}
+    
+    candidates.append(run)
+    return (run if is_exact else None), _best_literals(candidates)
+
+def _node_literals(op, av):
+    if op == sre_parse.LITERAL:
+        return {chr(av)}, None
+    if op == sre_parse.AT:
+        # assertion ความกว้างศูนย์ (\b, ^) ไม่ตัด literal ที่อยู่ติดกัน
+        return {''}, None
+    if op == sre_parse.SUBPATTERN:
+        return _sequence_literals(av[-1])
+    if op == sre_parse.BRANCH:
+        infos = [_sequence_literals(branch) for branch in av[1]]
+        exact = None
+        if all(e is not None for e, _ in infos):
+            exact = set().union(*(e for e, _ in infos))
+            if len(exact) > MAX_LITERAL_ALTERNATIVES:
+                exact = None
+        per_branch = [_best_literals([e, r]) for e, r in infos]
+        required = set().union(*per_branch) if all(per_branch) else None
+        return exact, required
+    if op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT):
+        low, high, item = av
+        if low == 0:
+            return None, None
+        exact, required = _sequence_literals(item)
+        if low == high == 1:
+            return exact, required
+        return None, _best_literals([exact, required])
+    return None, None
+
+def extract_required_literals(pattern):
+    """หาชุด literal ที่ทุก match ของ pattern ต้องมีอย่างน้อยหนึ่งคำ (None ถ้าหาไม่ได้)"""
+    try:
+        exact, required = _sequence_literals(sre_parse.parse(pattern, re.IGNORECASE))
+    except Exception:
+        return None
+    return _best_literals([exact, required])
+
+def build_trie_pattern(keywords):
+    """สร้าง regex รูป trie จาก keyword ให้ regex engine เดินแบบ automaton หลายคำในรอบเดียว"""
+    trie = {}
+    for word in keywords:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = True
+    
+    def to_regex(node):
+        # keyword ที่จบตรงนี้พอแล้ว คำที่ยาวกว่าไม่ทำให้ผลต่างกัน
+        if '' in node:
+            return ''
+        branches = [re.escape(char) + to_regex(child) for char, child in sorted(node.items())]
+        return branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+    
+    return to_regex(trie)
+
+def rule_literals(patterns):
+    """literal บังคับของ rule ที่ประกอบจาก patterns (match ใดก็ตามต้องมีอย่างน้อยหนึ่งคำ)
+    
+    คืน None ถ้ามี pattern ที่ไม่มี literal ที่เจาะจงพอ (rule นั้นต้องรันทั้งไฟล์เสมอ)
+    """
+    literal_sets = [extract_required_literals(pattern) for pattern in patterns]
+    if all(literals and min(len(s) for s in literals) >= MIN_KEYWORD_LENGTH
+           and not any('\n' in s for s in literals)
+           for literals in literal_sets):
+        return sorted(set().union(*literal_sets))
+    return None
+
+class CandidateSpans(list):
+    """ช่วง (start, end) ของบรรทัดที่พบ keyword พร้อมข้อความตัวเล็กของบรรทัดเหล่านั้น
+    
+    text ใช้ตรวจว่า literal ของ rule หนึ่งอยู่ในเนื้อหาจริงหรือไม่ (None = ตรวจไม่ได้ ถือว่าอาจมี)
+    """
+    __slots__ = ('text', '_present')
+    
+    def __init__(self, spans=(), text=None):
+        super().__init__(spans)
+        self.text = text
+        self._present = {}
+    
+    def may_contain(self, literals):
+        """มี literal ใดใน literals (คู่ str, bytes ตัวเล็ก) ปรากฏในบรรทัดที่พบ keyword หรือไม่"""
+        if self.text is None or literals is None:
+            return bool(self)
+        for literal in literals[0] if isinstance(self.text, str) else literals[1]:
+            # rule จำนวนมากใช้ keyword ซ้ำกัน จึงจำผลต่อ literal ไว้
+            found = self._present.get(literal)
+            if found is None:
+                found = self._present[literal] = literal in self.text
+            if found:
+                return True
+        return False
+
+class KeywordPrefilter:
+    """กรองไฟล์/บรรทัดด้วย literal ก่อนเข้า regex เต็มรูปแบบ
+    
+    rule ที่มี literal บังคับ (ยาวอย่างน้อย MIN_KEYWORD_LENGTH) จะถูกรันเฉพาะบรรทัด
+    ที่พบ keyword และข้ามไปเลยถ้า literal ของ rule นั้นไม่ปรากฏ ส่วน rule ที่ไม่มี
+    literal ที่เจาะจงพอจะถูกรันทั้งไฟล์เสมอ
+    """
+    def __init__(self):
+        self.keywords = set()
+        self.gated = {}
+        self.regex = None
+        self.ascii_regex = None
+        self.binary_regex = None
+        self.binary_overlap = 0
+    
+    def add(self, rule, literals):
+        """ลงทะเบียน rule พร้อม literal บังคับจาก rule_literals (None = ไม่กรอง rule นี้)"""
+        if literals is None:
+            return
+        self.keywords.update(literals)
+        # ตรวจราย rule ได้เฉพาะ literal ASCII (lower() ตรงกับ IGNORECASE ทุกกรณี)
+        if all(literal.isascii() for literal in literals):
+            lowered = tuple({literal.lower() for literal in literals})
+            self.gated[rule] = (lowered, tuple(literal.encode('ascii') for literal in lowered))
+        else:
+            self.gated[rule] = None
+    
+    def trie_sources(self):
+        """pattern ของ trie ทั้งหมดเป็น str (เก็บใน artifact ของ rule pack ได้) None ถ้าไม่มี keyword"""
+        if not self.keywords:
+            return None
+        # bytes: ค้นบน chunk ที่ lower() แล้ว (IGNORECASE กับ bytes ช้ากว่าหลายสิบเท่า)
+        # ใช้ latin-1 แทนแต่ละ byte ด้วยหนึ่งตัวอักษรเพื่อสร้าง trie จาก byte ของ keyword
+        encoded = {keyword.encode('utf-8').lower().decode('latin-1') for keyword in self.keywords}
+        sources = {
+            'text': build_trie_pattern(self.keywords),
+            'binary': build_trie_pattern(encoded),
+            'binary_overlap': max(len(keyword) for keyword in encoded) - 1,
+            'ascii': None,
+        }
+        if all(keyword.isascii() for keyword in self.keywords):
+            # ข้อความ ASCII: lower() ไม่เปลี่ยนความยาว จึงใช้ regex แบบไม่ IGNORECASE ที่เร็วกว่าได้
+            sources['ascii'] = build_trie_pattern({keyword.lower() for keyword in self.keywords})
+        return sources
+    
+    def compile(self, sources=None):
+        """compile trie จาก sources (ผลของ trie_sources ที่เก็บไว้) หรือสร้างใหม่จาก keyword"""
+        sources = sources or self.trie_sources()
+        if sources:
+            self.regex = re.compile(sources['text'], re.IGNORECASE)
+            self.binary_regex = re.compile(sources['binary'].encode('latin-1'))
+            self.binary_overlap = sources['binary_overlap']
+            if sources['ascii'] is not None:
+                self.ascii_regex = re.compile(sources['ascii'])
+        return self
+    
+    def candidate_spans(self, content):
+        """ช่วง (start, end) ของบรรทัดที่มี keyword บรรทัดที่ติดกันรวมเป็นช่วงเดียว (CandidateSpans)"""
+        spans = CandidateSpans()
+        if self.regex is None:
+            return spans
+        
+        newline = newline_for(content)
+        lowered = False
+        if newline == b'\n':
+            hits = self._iter_binary_hits(content)
+        else:
+            regex = self.regex
+            if self.ascii_regex is not None and content.isascii():
+                regex, content, lowered = self.ascii_regex, content.lower(), True
+            hits = (match.span() for match in regex.finditer(content))
+        
+        pos = 0
+        for hit in hits:
+            # keyword ไม่มี newline จึงข้าม hit ในบรรทัดที่อยู่ในช่วงแล้วได้ทันที
+            if hit[0] < pos:
+                continue
+            start = content.rfind(newline, 0, hit[0]) + 1
+            end = content.find(newline, hit[1])
+            if end == -1:
+                end = len(content)
+            if spans and start == spans[-1][1] + 1:
+                spans[-1] = (spans[-1][0], end)
+            else:
+                spans.append((start, end))
+            pos = end + 1
+        
+        if lowered:
+            spans.text = newline.join(content[start:end] for start, end in spans)
+        elif newline == b'\n' and sum(end - start for start, end in spans) <= PREFILTER_TEXT_LIMIT:
+            spans.text = newline.join(content[start:end] for start, end in spans).lower()
+        return spans
+    
+    def _iter_binary_hits(self, content):
+        """ตำแหน่ง (start, end) ของ keyword ทั้งหมดใน bytes/mmap ตามลำดับ
+        
+        lower() ทีละ chunk ครั้งเดียว (ทับซ้อนกันเท่าความยาว keyword) ไม่คัดลอกทั้งไฟล์เข้าหน่วยความจำ
+        """
+        size = len(content)
+        pos = 0
+        while pos < size:
+            end = min(pos + PREFILTER_CHUNK_SIZE, size)
+            chunk = content[pos:min(end + self.binary_overlap, size)].lower()
+            for match in self.binary_regex.finditer(chunk):
+                # match ที่เริ่มหลัง end จะถูกพบอีกครั้งใน chunk ถัดไป
+                if match.start() >= end - pos:
+                    break
+                yield pos + match.start(), pos + match.end()
+            pos = end
+    
+    def spans_for(self, rule, index, spans, cross_line=False):
+        """ช่วงที่ต้องรัน rule: spans=None หมายถึงไม่ใช้ prefilter"""
+        if spans is None or rule not in self.gated:
+            return [(0, len(index.content))]
+        if not spans.may_contain(self.gated[rule]):
+            return []
+        if cross_line:
+            # match ข้ามบรรทัดอาจเริ่มก่อนบรรทัดที่มี keyword จึงกรองได้แค่ระดับไฟล์
+            return [(0, len(index.content))] if spans else []
+        return spans
+
+def check_filename(filename, rules=None):
+    results = []
+    backdoor_names = (rules or RULES).backdoor_names
+    
+    if any(bad_name in filename.lower() for bad_name in backdoor_names):
+        results.append(Finding('suspicious_filename', 'high', 0, filename, 'backdoor', 'filename'))
+    
+    return results
+
+BINARY_PHP_OPEN_TAG = re.compile(rb'\s*<\?php')
+
+def is_php_content(content, filename):
+    if not isinstance(content, str):
+        # bytes/mmap: ตรวจหัวไฟล์ด้วย regex แทน strip() ที่ต้องคัดลอกทั้งไฟล์
+        return (filename.endswith('.php') or filename.endswith('.phtml') or
+                BINARY_PHP_OPEN_TAG.match(content) is not None or b'<?php' in content[:100])
+    return (filename.endswith('.php') or filename.endswith('.phtml') or 
+            content.strip().startswith('<?php') or '<?php' in content[:100])
+
+def scan_content(content, filename, cross_line=False, prefilter=True, owned=None, line_offset=0,
+                 offset=0, timer=None, rules=None, tokens=None):
+    """สแกนเนื้อหา (ทั้งไฟล์หรือ window หนึ่งของไฟล์) ด้วย function และ pattern ทั้งหมด
+    
+    line_offset / offset คือจำนวนบรรทัด / ตัวอักษรก่อนหน้า window นี้ในไฟล์
+    ถ้ามี timer จะบันทึกเวลาแต่ละขั้นและต้นทุนต่อ rule
+    rules คือ RuleSet ที่ใช้ (None = RULES ที่ใช้งานอยู่) ทั้งการสแกนใช้ชุดเดียวกันตลอด
+    tokens คือ PhpTokens ของ content (None = สร้างใหม่) ทุก rule ใช้ token stream เดียวกัน
+    """
+    timer = timer or PhaseTimer()
+    rules = rules or RULES
+    index = line_index_for(content)
+    tokens = tokens or PhpTokens(content)
+    # lexer ทำงานแบบ lazy ระหว่าง rule เวลาที่ใช้ lex จึงถูกหักออกไปนับเป็น phase tokenize
+    lexed = tokens.seconds
+    with timer.phase('prefilter'):
+        spans = rules.prefilter.candidate_spans(content) if prefilter else None
+    
+    # regex ของฟังก์ชันอันตรายรวมเป็น rule เดียว จึงวัดต้นทุนรวมได้เท่านั้น (function/*)
+    started = time.perf_counter()
+    results = scan_dangerous_functions(content, filename, index=index, spans=spans,
+                                       owned=owned, line_offset=line_offset, offset=offset,
+                                       rules=rules, tokens=tokens)
+    elapsed = time.perf_counter() - started - (tokens.seconds - lexed)
+    timer.add_phase('functions', elapsed)
+    timer.add_rule(FUNCTION_RULE, elapsed, len(results))
+    
+    started, lexed_before_patterns = time.perf_counter(), tokens.seconds
+    results.extend(scan_suspicious_patterns(content, filename, cross_line=cross_line,
+                                            index=index, spans=spans, owned=owned,
+                                            line_offset=line_offset, offset=offset, timer=timer,
+                                            rules=rules, tokens=tokens))
+    timer.add_phase('patterns', time.perf_counter() - started - (tokens.seconds - lexed_before_patterns))
+    timer.add_phase('tokenize', tokens.seconds - lexed)
+    
+    started = time.perf_counter()
+    entropy_findings = scan_obfuscation_metrics(content, filename, index=index, owned=owned,
+                                                line_offset=line_offset, offset=offset)
+    elapsed = time.perf_counter() - started
+    timer.add_phase('entropy', elapsed)
+    timer.add_rule('entropy/*', elapsed, len(entropy_findings))
+    results.extend(entropy_findings)
+    return results
+
+def scan_file(content, filename, cross_line=False, timer=None):
+    results = []
+    
+    if not is_php_content(content, filename):
+        return results
+    
+    rules = RULES
+    filename_findings = check_filename(filename, rules)
+    results.extend(filename_findings)
+    
+    # ไฟล์ที่ชื่อน่าสงสัยสแกนเต็มไฟล์เสมอ ไฟล์อื่นสแกนเฉพาะบรรทัดที่ผ่าน prefilter
+    results.extend(scan_content(content, filename, cross_line=cross_line,
+                                prefilter=not filename_findings, timer=timer, rules=rules))
+    results.extend(WEBSHELL_INDEX.findings(content, timer=timer))
+    
+    return results
+
+# ========== Scan Result Cache ==========
+
+CACHE_DIR = Path('.php_scanner_cache')
+SCAN_CACHE_PATH = CACHE_DIR / 'scan_results.sqlite'
+HTTP_CACHE_PATH = CACHE_DIR / 'http_validators.sqlite'
+CHECKPOINT_PATH = CACHE_DIR / 'checkpoints.sqlite'
+
+# เพิ่มค่านี้เมื่อ logic การสแกนเปลี่ยนจนผลเดิมใน cache ใช้ไม่ได้ (ค่าคงที่ของการสแกนอยู่ใน hash แล้ว)
+SCANNER_VERSION = 14
+
+def compute_ruleset_version(artifact):
+    """hash ของชุด rule (artifact ของ RuleSet) และค่าที่มีผลต่อ finding ของเนื้อหาไฟล์"""
+    payload = json.dumps([SCANNER_VERSION, artifact['functions'], artifact['patterns'],
+                          artifact['severities'],
+                          ENTROPY_MIN_LINE_LENGTH, HIGH_ENTROPY_THRESHOLD, LONG_TOKEN_THRESHOLD,
+                          SYMBOL_RATIO_THRESHOLD, SYMBOL_MIN_ENTROPY,
+                          SEARCH_WINDOW_SIZE, SEARCH_WINDOW_OVERLAP, RULE_TIME_BUDGET, RULE_TIME_PER_MB,
+                          CALL_LOOKBEHIND, MAX_SNIPPET_LENGTH,
+                          're2' if re2 is not None else 're'], sort_keys=True)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+def ruleset_key(cross_line=False, binary=False, rules=None, index=None):
+    """คีย์ ruleset ของ cache (โหมด cross-line และการสแกนแบบ bytes ให้ผลต่างกันได้จึงแยกคีย์)
+    
+    เมื่อมีตัวอย่าง webshell คีย์รวม version ของ index ด้วย ผลจากตัวอย่างชุดเก่าจึงไม่ถูกใช้ซ้ำ
+    """
+    key = f"{(rules or RULES).version}:{'multiline' if cross_line else 'line'}"
+    index = index or WEBSHELL_INDEX
+    if index.version:
+        key = f"{key}:{index.version}"
+    return f"{key}:bytes" if binary else key
+
+class SqliteStore:
+    """ฐานข้อมูล SQLite ขนาดเล็กที่ใช้ร่วมกันหลาย thread ได้ (ทุกคำสั่งอยู่ใต้ lock)"""
+    SCHEMA = ''
+    
+    def __init__(self, path):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.executescript(self.SCHEMA)
+            self._conn.commit()
+    
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class ScanCache(SqliteStore):
+    """cache ผลสแกนใน SQLite คีย์คือ hash ของเนื้อหา + เวอร์ชันของ ruleset
+    
+    เก็บเฉพาะ finding จากเนื้อหา (ไม่รวม finding จากชื่อไฟล์) จึงใช้ซ้ำได้แม้ไฟล์ย้ายที่
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS scan_results (
+            content_hash TEXT NOT NULL,
+            ruleset TEXT NOT NULL,
+            findings TEXT NOT NULL,
+            scanned_at TEXT NOT NULL,
+            PRIMARY KEY (content_hash, ruleset)
+        )
+    """
+    
+    def __init__(self, path=SCAN_CACHE_PATH):
+        super().__init__(path)
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, content_hash, ruleset):
+        """คืน findings ที่เคยสแกนไว้ หรือ None ถ้าไม่มี"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT findings FROM scan_results WHERE content_hash = ? AND ruleset = ?',
+                (content_hash, ruleset)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return findings_from_dicts(json.loads(row[0]))
+    
+    def put(self, content_hash, ruleset, findings):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO scan_results VALUES (?, ?, ?, ?)',
+                (content_hash, ruleset, json.dumps(findings, ensure_ascii=False, default=json_default),
+                 datetime.now().isoformat())
+            )
+            self._conn.commit()
+    
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM scan_results')
+            self._conn.commit()
+
+class HttpCache(SqliteStore):
+    """เก็บ ETag / Last-Modified ต่อ URL พร้อมผลที่ได้จาก response นั้น (payload)
+    
+    kind แยกชนิดของ payload เช่น 'links' (ลิงก์ในหน้า) และ 'scan' (ผลสแกนไฟล์)
+    payload ของ 'links' และ 'sitemap' มี version ของตัว parse (ดู payload_matches)
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS http_validators (
+            url TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            etag TEXT,
+            last_modified TEXT,
+            payload TEXT NOT NULL,
+            PRIMARY KEY (url, kind)
+        )
+    """
+    
+    def __init__(self, path=HTTP_CACHE_PATH):
+        super().__init__(path)
+        self.not_modified = 0
+    
+    def get(self, url, kind):
+        """คืน dict ของ etag, last_modified, payload หรือ None ถ้าไม่เคยเก็บ"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT etag, last_modified, payload FROM http_validators WHERE url = ? AND kind = ?',
+                (url, kind)
+            ).fetchone()
+        if row is None:
+            return None
+        return {'etag': row[0], 'last_modified': row[1], 'payload': json.loads(row[2])}
+    
+    def put(self, url, kind, response, payload):
+        """เก็บ validator จาก response (ข้ามถ้า server ไม่ส่ง ETag/Last-Modified)"""
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if not etag and not last_modified:
+            return
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO http_validators VALUES (?, ?, ?, ?, ?)',
+                (url, kind, etag, last_modified,
+                 json.dumps(payload, ensure_ascii=False, default=json_default))
+            )
+            self._conn.commit()
+    
+    def record_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+    
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM http_validators')
+            self._conn.commit()
+
+def payload_matches(entry, version):
+    """entry ของ HttpCache มี payload ที่เก็บด้วย version นี้หรือไม่ (payload รุ่นเก่าไม่มี version)"""
+    return (entry is not None and isinstance(entry['payload'], dict)
+            and entry['payload'].get('version') == version)
+
+def conditional_headers(entry):
+    """header If-None-Match / If-Modified-Since จาก validator ที่เก็บไว้"""
+    headers = {}
+    if entry:
+        if entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+    return headers
+
+class CheckpointStore(SqliteStore):
+    """checkpoint ของการสแกนเว็บไซต์ที่ยังไม่เสร็จ เพื่อสแกนต่อหลัง rerun/crash
+    
+    scan_checkpoints เก็บสถานะ crawl (frontier, visited, php_files) และ phase ล่าสุด
+    ('crawl' = Phase 1 ยังไม่จบ, 'scan' = รายการไฟล์ครบแล้ว) ส่วน scan_results เก็บผล
+    ของแต่ละไฟล์ทันทีที่สแกนเสร็จ
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS scan_checkpoints (
+            scan_key TEXT PRIMARY KEY,
+            phase TEXT NOT NULL,
+            frontier TEXT NOT NULL,
+            visited TEXT NOT NULL,
+            php_files TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS scan_results (
+            scan_key TEXT NOT NULL,
+            url TEXT NOT NULL,
+            result TEXT NOT NULL,
+            PRIMARY KEY (scan_key, url)
+        );
+    """
+    
+    def __init__(self, path=CHECKPOINT_PATH):
+        super().__init__(path)
+    
+    def save_crawl(self, scan_key, phase, frontier, visited, php_files):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO scan_checkpoints VALUES (?, ?, ?, ?, ?, ?)',
+                (scan_key, phase, json.dumps(list(frontier)), json.dumps(list(visited)),
+                 json.dumps(list(php_files)), datetime.now().isoformat(timespec='seconds'))
+            )
+            self._conn.commit()
+    
+    def save_result(self, scan_key, result):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO scan_results VALUES (?, ?, ?)',
+                (scan_key, result['url'], json.dumps(result, ensure_ascii=False, default=json_default))
+            )
+            self._conn.commit()
+    
+    def summary(self, scan_key):
+        """สรุปสั้นของ checkpoint (สำหรับแสดงผล) หรือ None ถ้าไม่มี"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT phase, json_array_length(visited), json_array_length(php_files), updated_at '
+                'FROM scan_checkpoints WHERE scan_key = ?', (scan_key,)
+            ).fetchone()
+            if row is None:
+                return None
+            scanned = self._conn.execute(
+                'SELECT COUNT(*) FROM scan_results WHERE scan_key = ?', (scan_key,)
+            ).fetchone()[0]
+        return {'phase': row[0], 'visited': row[1], 'php_files': row[2],
+                'updated_at': row[3], 'scanned': scanned}
+    
+    def load(self, scan_key):
+        """คืน dict ของ phase, frontier, visited, php_files หรือ None ถ้าไม่มี checkpoint"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT phase, frontier, visited, php_files FROM scan_checkpoints WHERE scan_key = ?',
+                (scan_key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            'phase': row[0],
+            'frontier': [tuple(item) for item in json.loads(row[1])],
+            'visited': json.loads(row[2]),
+            'php_files': json.loads(row[3])
+        }
+    
+    def completed_results(self, scan_key):
+        """ผลของไฟล์ที่สแกนเสร็จแล้ว (dict: url -> result)"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT url, result FROM scan_results WHERE scan_key = ?', (scan_key,)
+            ).fetchall()
+        completed = {}
+        for url, data in rows:
+            result = json.loads(data)
+            result['findings'] = findings_from_dicts(result['findings'])
+            completed[url] = result
+        return completed
+    
+    def clear(self, scan_key=None):
+        """ลบ checkpoint ของ scan_key (หรือทั้งหมดถ้าไม่ระบุ)"""
+        with self._lock:
+            if scan_key is None:
+                self._conn.execute('DELETE FROM scan_checkpoints')
+                self._conn.execute('DELETE FROM scan_results')
+            else:
+                self._conn.execute('DELETE FROM scan_checkpoints WHERE scan_key = ?', (scan_key,))
+                self._conn.execute('DELETE FROM scan_results WHERE scan_key = ?', (scan_key,))
+            self._conn.commit()
+
+def checkpoint_key(website_url, method):
+    """คีย์ checkpoint ของการสแกนเว็บไซต์หนึ่งด้วย method หนึ่ง"""
+    return f"{website_url.rstrip('/')}|{method}"
+
+def scan_file_cached(content, filename, cross_line=False, cache=None, timer=None):
+    """เหมือน scan_file แต่ใช้ผลจาก cache ถ้าเนื้อหาเดิมเคยสแกนด้วย ruleset เดียวกัน
+    
+    คืน (findings, cached)
+    """
+    if cache is None:
+        return scan_file(content, filename, cross_line=cross_line, timer=timer), False
+    if not is_php_content(content, filename):
+        return [], False
+    
+    rules = RULES
+    index = WEBSHELL_INDEX
+    filename_findings = check_filename(filename, rules)
+    content_hash = calculate_file_hash(content)
+    ruleset = ruleset_key(cross_line, binary=not isinstance(content, str), rules=rules, index=index)
+    
+    content_findings = cache.get(content_hash, ruleset)
+    if content_findings is not None:
+        return filename_findings + content_findings, True
+    
+    content_findings = scan_content(content, filename, cross_line=cross_line,
+                                    prefilter=not filename_findings, timer=timer, rules=rules)
+    content_findings.extend(index.findings(content, timer=timer))
+    if not has_rule_timeout(content_findings):
+        cache.put(content_hash, ruleset, content_findings)
+    return filename_findings + content_findings, False
+
+# ========== Rule Packs ==========
+
+RULE_ARTIFACT_DIR = CACHE_DIR / 'rules'
+SEVERITY_LEVELS = ('critical', 'high', 'medium', 'low')
+RULE_PACK_SECTIONS = ('name', 'functions', 'patterns', 'severities', 'backdoor_names', 'rules')
+YARA_CONDITIONS = ('any of them',)
+YARA_REGEX_STRING = re.compile(r'/(.*)/([is]*)', re.DOTALL)
+RULE_NAME = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+
+class RulePackError(ValueError):
+    """rule pack อ่านไม่ได้หรือมี rule ที่ไม่ถูกต้อง"""
+
+class RuleSet:
+    """ชุด rule ที่ใช้สแกน (built-in รวมกับ rule pack) สร้างจาก artifact ของ build_rule_artifact
+    
+    artifact เก็บผลวิเคราะห์ที่แพง (literal ของ prefilter, rule ที่เสี่ยง backtracking) ไว้แล้ว
+    ส่วน regex compile เมื่อถูกใช้ครั้งแรก การสร้าง RuleSet จึงเร็วแม้มี rule หลายพันตัว
+    """
+    def __init__(self, artifact):
+        self.sources = [tuple(source) for source in artifact['sources']]
+        self.functions = artifact['functions']
+        self.severities = artifact['severities']
+        self.backdoor_names = artifact['backdoor_names']
+        self.version = compute_ruleset_version(artifact)
+        self.patterns = {}
+        self.prefilter = KeywordPrefilter()
+        self.prefilter.add(FUNCTION_RULE, artifact['function_literals'])
+        for category, rules in artifact['patterns'].items():
+            self.patterns[category] = []
+            for rule in rules:
+                pattern_rule = PatternRule(rule['id'], rule['source'], rule['prone'], rule['scope'])
+                self.prefilter.add(pattern_rule, rule['literals'])
+                self.patterns[category].append(pattern_rule)
+        self.prefilter.compile(artifact['prefilter'])
+        self._function_matchers = {}
+    
+    @property
+    def rule_count(self):
+        return sum(len(funcs) for funcs in self.functions.values()) + sum(
+            len(rules) for rules in self.patterns.values())
+    
+    def severity(self, category):
+        return self.severities.get(category, 'medium')
+    
+    def function_matcher(self, binary=False):
+        """(regex รวม, [(severity, func)]) ของฟังก์ชันอันตรายสำหรับ str หรือ bytes"""
+        matcher = self._function_matchers.get(binary)
+        if matcher is None:
+            matcher = self._function_matchers[binary] = build_function_matcher(self.functions, binary)
+        return matcher
+
+def _check_regex(source, where):
+    """compile ทดสอบทั้งแบบ str และ bytes เพื่อให้ rule ที่ผิดถูกปฏิเสธตอนโหลด ไม่ใช่กลางการสแกน"""
+    try:
+        re.compile(source, re.IGNORECASE)
+        re.compile(source.encode('utf-8'), re.IGNORECASE)
+    except re.error as e:
+        raise RulePackError(f"{where}: invalid regex {source!r}: {e}")
+
+def _string_list(value, where):
+    if not isinstance(value, list) or not all(isinstance(item, str) and item for item in value):
+        raise RulePackError(f"{where}: expected a list of non-empty strings")
+    return value
+
+def _check_severity(severity, where):
+    if severity not in SEVERITY_LEVELS:
+        raise RulePackError(f"{where}: unknown severity {severity!r} (use one of {', '.join(SEVERITY_LEVELS)})")
+    return severity
+
+def _set_category_severity(db, category, severity, where):
+    """ตั้ง severity ของ category จาก pack: category built-in เปลี่ยนไม่ได้ และทุก pack ต้องตรงกัน"""
+    _check_severity(severity, where)
+    if category in SUSPICIOUS_PATTERNS or category in PATTERN_SEVERITIES:
+        builtin = PATTERN_SEVERITIES.get(category, 'medium')
+        if severity != builtin:
+            raise RulePackError(f"{where}: cannot change severity of built-in category {category!r} "
+                                f"(fixed at {builtin!r})")
+    elif db['severities'].setdefault(category, severity) != severity:
+        raise RulePackError(f"{where}: severity {severity!r} conflicts with "
+                            f"{db['severities'][category]!r} already set for category {category!r}")
+
+def _check_scope(scope, where):
+    """scope ของ rule: ชนิด token เดียวหรือ list (None = ทุกที่)"""
+    if scope is None:
+        return None
+    kinds = [scope] if isinstance(scope, str) else _string_list(scope, where)
+    unknown = [kind for kind in kinds if kind not in TOKEN_KINDS]
+    if unknown:
+        raise RulePackError(f"{where}: unknown token kind {unknown[0]!r} (use one of {', '.join(TOKEN_KINDS)})")
+    return sorted(set(kinds), key=TOKEN_KINDS.index)
+
+def yara_rule_source(rule, where):
+    """แปลง rule แบบ YARA เป็น regex เดียว
+    
+    strings: ข้อความธรรมดา หรือ /regex/ (ต่อท้ายด้วย i, s ได้) ทุก rule ไม่สนตัวพิมพ์อยู่แล้ว
+    condition: รองรับเฉพาะ 'any of them' (match เมื่อพบ string ใดก็ได้ในบรรทัด)
+    """
+    condition = ' '.join(str(rule.get('condition', 'any of them')).split())
+    if condition not in YARA_CONDITIONS:
+        raise RulePackError(f"{where}: unsupported condition {condition!r} (supported: {', '.join(YARA_CONDITIONS)})")
+    strings = rule.get('strings')
+    if isinstance(strings, dict):
+        strings = list(strings.values())
+    strings = _string_list(strings, f"{where}.strings")
+    
+    alternatives = []
+    for value in strings:
+        match = YARA_REGEX_STRING.fullmatch(value)
+        if match:
+            source, modifiers = match.groups()
+            if 's' in modifiers:
+                source = f'(?s:{source})'
+        else:
+            source = re.escape(value)
+        _check_regex(source, f"{where}.strings")
+        alternatives.append(source)
+    return alternatives[0] if len(alternatives) == 1 else '|'.join(f'(?:{a})' for a in alternatives)
+
+def merge_rule_pack(db, pack, where):
+    """เพิ่ม rule จาก pack (dict ที่อ่านจาก JSON/YAML) เข้า db ที่ build_rule_artifact เตรียมไว้
+    
+    rule pack เพิ่มได้อย่างเดียว: rule built-in, severity ของ category built-in และ id ของ rule เดิมไม่เปลี่ยน
+    """
+    if not isinstance(pack, dict):
+        raise RulePackError(f"{where}: a rule pack must be a mapping")
+    unknown = set(pack) - set(RULE_PACK_SECTIONS)
+    if unknown:
+        raise RulePackError(f"{where}: unknown sections {sorted(unknown)} (expected {', '.join(RULE_PACK_SECTIONS)})")
+    
+    for severity, functions in (pack.get('functions') or {}).items():
+        _check_severity(severity, f"{where}.functions")
+        existing = db['functions'].setdefault(severity, [])
+        for func in _string_list(functions, f"{where}.functions.{severity}"):
+            _check_regex(function_pattern(func), f"{where}.functions.{severity}")
+            if func not in existing:
+                existing.append(func)
+    
+    for category, severity in (pack.get('severities') or {}).items():
+        _set_category_severity(db, category, severity, f"{where}.severities.{category}")
+    
+    for category, patterns in (pack.get('patterns') or {}).items():
+        rules = db['patterns'].setdefault(category, [])
+        for pattern in _string_list(patterns, f"{where}.patterns.{category}"):
+            _check_regex(pattern, f"{where}.patterns.{category}")
+            rules.append((f'{category}/{len(rules)}', pattern, None))
+    
+    for n, rule in enumerate(pack.get('rules') or []):
+        rule_where = f"{where}.rules[{n}]"
+        if not isinstance(rule, dict) or not RULE_NAME.fullmatch(str(rule.get('name', ''))):
+            raise RulePackError(f"{rule_where}: each rule needs a 'name' made of letters, digits and _")
+        meta = rule.get('meta') or {}
+        category = rule.get('category', meta.get('category', rule['name']))
+        severity = rule.get('severity', meta.get('severity'))
+        if severity is not None:
+            _set_category_severity(db, category, severity, rule_where)
+        rule_id = f"{category}/{rule['name']}"
+        rules = db['patterns'].setdefault(category, [])
+        if any(existing_id == rule_id for existing_id, _, _ in rules):
+            raise RulePackError(f"{rule_where}: duplicate rule {rule_id!r}")
+        scope = _check_scope(rule.get('scope', meta.get('scope')), f"{rule_where}.scope")
+        rules.append((rule_id, yara_rule_source(rule, rule_where), scope))
+    
+    names = _string_list(pack.get('backdoor_names') or [], f"{where}.backdoor_names")
+    db['backdoor_names'].extend(name.lower() for name in names if name.lower() not in db['backdoor_names'])
+
+def build_rule_artifact(packs=()):
+    """รวม built-in กับ packs [(path, pack dict)] แล้ววิเคราะห์ทุก rule ไว้ล่วงหน้า
+    
+    คืน dict ที่ serialize เป็น JSON ได้ (ดู RuleSet) ไม่มี compiled regex อยู่ในนั้น
+    เพราะ regex ของ Python serialize ไม่ได้ จึงเก็บเฉพาะส่วนที่คำนวณแพง
+    """
+    db = {
+        'functions': {severity: list(funcs) for severity, funcs in DANGEROUS_FUNCTIONS.items()},
+        'patterns': {
+            category: [(f'{category}/{n}', pattern, None) for n, pattern in enumerate(patterns)]
+            for category, patterns in SUSPICIOUS_PATTERNS.items()
+        },
+        'severities': dict(PATTERN_SEVERITIES),
+        'backdoor_names': list(COMMON_BACKDOOR_NAMES),
+    }
+    for path, pack in packs:
+        merge_rule_pack(db, pack, path)
+    
+    functions = [func for funcs in db['functions'].values() for func in funcs]
+    function_literals = rule_literals([rf'\b{function_pattern(func)}' for func in functions])
+    patterns = {
+        category: [
+            {'id': rule_id, 'source': source, 'literals': rule_literals([source]),
+             'prone': is_backtracking_prone(source), 'scope': scope}
+            for rule_id, source, scope in rules
+        ]
+        for category, rules in db['patterns'].items()
+    }
+    prefilter = KeywordPrefilter()
+    prefilter.add(FUNCTION_RULE, function_literals)
+    for rules in patterns.values():
+        for rule in rules:
+            prefilter.add(rule['id'], rule['literals'])
+    
+    return {
+        'sources': [],
+        'functions': db['functions'],
+        'function_literals': function_literals,
+        'patterns': patterns,
+        'severities': db['severities'],
+        'backdoor_names': db['backdoor_names'],
+        'prefilter': prefilter.trie_sources(),
+    }
+
+def parse_rule_pack(path, data):
+    """อ่าน rule pack จาก bytes ของไฟล์: .yaml/.yml ใช้ PyYAML นอกนั้นเป็น JSON"""
+    try:
+        text = data.decode('utf-8-sig')
+        if Path(path).suffix.lower() in ('.yaml', '.yml'):
+            if yaml is None:
+                raise RulePackError(f"{path}: install PyYAML to load YAML rule packs")
+            return yaml.safe_load(text)
+        return json.loads(text)
+    except RulePackError:
+        raise
+    except Exception as e:
+        raise RulePackError(f"{path}: cannot parse rule pack: {e}")
+
+def rule_artifact_key(digests):
+    """คีย์ของ artifact: hash ของไฟล์ rule pack ทุกไฟล์ + built-in + ค่าที่มีผลต่อการวิเคราะห์"""
+    payload = json.dumps([SCANNER_VERSION, MIN_KEYWORD_LENGTH, MAX_LITERAL_ALTERNATIVES,
+                          DANGEROUS_FUNCTIONS, SUSPICIOUS_PATTERNS, PATTERN_SEVERITIES,
+                          COMMON_BACKDOOR_NAMES, list(digests)], sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+def read_rule_packs(paths):
+    """อ่านไฟล์ rule pack คืน [(path, sha256 ของเนื้อหา, bytes)] ตามลำดับ"""
+    packs = []
+    for path in paths:
+        try:
+            data = Path(path).read_bytes()
+        except OSError as e:
+            raise RulePackError(f"{path}: {e.strerror or e}")
+        packs.append((str(path), hashlib.sha256(data).hexdigest(), data))
+    return packs
+
+def load_rule_set(paths=(), packs=None):
+    """RuleSet ของ built-in + rule pack ตาม paths (ตามลำดับ) หรือ packs จาก read_rule_packs
+    
+    artifact ที่วิเคราะห์แล้วถูกเก็บใน RULE_ARTIFACT_DIR โดยคีย์ด้วย hash ของเนื้อหาไฟล์
+    โหลดครั้งถัดไปจึงไม่ต้อง parse YAML/JSON หรือวิเคราะห์ rule ใหม่ แก้ไฟล์เมื่อไรคีย์ก็เปลี่ยนเอง
+    """
+    packs = read_rule_packs(paths) if packs is None else packs
+    if not packs:
+        return RuleSet(build_rule_artifact())
+    
+    artifact_path = RULE_ARTIFACT_DIR / f"{rule_artifact_key(digest for _, digest, _ in packs)}.json"
+    try:
+        artifact = json.loads(artifact_path.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        artifact = build_rule_artifact([(path, parse_rule_pack(path, data)) for path, _, data in packs])
+        try:
+            RULE_ARTIFACT_DIR.mkdir(parents=True, exist_ok=True)
+            # เขียนไฟล์ชั่วคราวแล้ว replace: process อื่นที่อ่านพร้อมกันไม่เห็นไฟล์ครึ่งเดียว
+            temp_path = artifact_path.with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+            temp_path.write_text(json.dumps(artifact), encoding='utf-8')
+            os.replace(temp_path, artifact_path)
+        except OSError:
+            pass
+    # คีย์ขึ้นกับเนื้อหาเท่านั้น จึงเก็บ path ปัจจุบันแทน path ตอนสร้าง artifact
+    artifact['sources'] = [(path, digest) for path, digest, _ in packs]
+    return RuleSet(artifact)
+
+def activate_rule_packs(paths=()):
+    """สลับ RULES เป็นชุดของ paths เมื่อไฟล์หรือเนื้อหาไฟล์เปลี่ยนไปจากชุดที่ใช้อยู่ (hot reload)
+    
+    การสแกนที่กำลังทำอยู่ใช้ RuleSet เดิมต่อจนจบ การสแกนที่เริ่มหลังจากนี้ใช้ชุดใหม่
+    """
+    global RULES
+    packs = read_rule_packs(paths)
+    if [(path, digest) for path, digest, _ in packs] != RULES.sources:
+        RULES = load_rule_set(packs=packs)
+    return RULES
+
+def parse_rule_pack_paths(text):
+    """แยก path ของ rule pack (หนึ่ง path ต่อบรรทัด ข้ามบรรทัดว่างและ # comment)"""
+    return [line.strip() for line in text.splitlines()
+            if line.strip() and not line.strip().startswith('#')]
+
+RULES = load_rule_set()
+
+# ========== Webshell Similarity ==========
+
+WEBSHELL_INDEX_DIR = CACHE_DIR / 'similarity'
+SIMILARITY_SHINGLE = 8             # bytes ต่อ shingle (หลังตัดช่องว่างและแปลงเป็นตัวเล็ก)
+SIMILARITY_BINS = 128              # ค่าต่อ signature (one-permutation MinHash)
+SIMILARITY_BAND_ROWS = 4           # ค่าต่อ band ของ LSH (128 / 4 = 32 band)
+SIMILARITY_THRESHOLD = 0.5         # Jaccard โดยประมาณขั้นต่ำที่นับว่าเป็นตระกูลเดียวกัน
+SIMILARITY_MIN_BYTES = 512         # เนื้อหาที่สั้นกว่านี้ (หลัง normalize) เปรียบเทียบไม่ได้ความหมาย
+SIMILARITY_MAX_BYTES = 4 * 1024 * 1024   # bytes แรกของไฟล์ที่นำมาคิด signature
+SIMILARITY_WHITESPACE = b' \t\r\n\f\v'
+_SIMILARITY_EMPTY = np.uint64(2 ** 64 - 1)
+_SIMILARITY_BIN_SHIFT = np.uint64(64 - (SIMILARITY_BINS.bit_length() - 1))
+
+class WebshellIndexError(ValueError):
+    """ตัวอย่าง webshell หรือไฟล์ index อ่านไม่ได้"""
+
+class SimilaritySketch:
+    """MinHash แบบ one-permutation ของเนื้อหา อัปเดตทีละส่วนได้ (stream) ผลเท่ากับคิดทั้งไฟล์
+    
+    shingle คือ SIMILARITY_SHINGLE bytes ติดกันของเนื้อหาที่ตัดช่องว่างและแปลงเป็นตัวเล็กแล้ว
+    hash ของ shingle แบ่งเป็น SIMILARITY_BINS ช่องด้วย bit บน แต่ละช่องเก็บค่าน้อยสุด
+    การเว้นวรรค ย่อหน้า หรือแก้ไม่กี่ byte จึงเปลี่ยน signature เพียงไม่กี่ช่อง
+    """
+    def __init__(self):
+        self.bins = np.full(SIMILARITY_BINS, _SIMILARITY_EMPTY, dtype=np.uint64)
+        self.size = 0       # bytes ดิบที่นำมาคิดแล้ว (ไม่เกิน SIMILARITY_MAX_BYTES)
+        self.length = 0     # bytes หลัง normalize
+        self._tail = b''    # SIMILARITY_SHINGLE - 1 bytes ท้ายสุด สำหรับ shingle ที่คร่อมรอยต่อ
+    
+    def update(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8', errors='ignore')
+        data = bytes(data[:SIMILARITY_MAX_BYTES - self.size])
+        if not data:
+            return
+        self.size += len(data)
+        normalized = data.lower().translate(None, SIMILARITY_WHITESPACE)
+        self.length += len(normalized)
+        text = self._tail + normalized
+        self._tail = text[-(SIMILARITY_SHINGLE - 1):]
+        if len(text) < SIMILARITY_SHINGLE:
+            return
+        
+        values = np.frombuffer(text, dtype=np.uint8).astype(np.uint64)
+        count = len(values) - SIMILARITY_SHINGLE + 1
+        hashes = np.zeros(count, dtype=np.uint64)
+        for n in range(SIMILARITY_SHINGLE):
+            hashes = hashes * np.uint64(257) + values[n:n + count]
+        # splitmix64 finalizer กระจาย bit ให้ bit บน (ที่ใช้เลือกช่อง) สุ่มพอ
+        hashes ^= hashes >> np.uint64(30)
+        hashes *= np.uint64(0xbf58476d1ce4e5b9)
+        hashes ^= hashes >> np.uint64(27)
+        hashes *= np.uint64(0x94d049bb133111eb)
+        hashes ^= hashes >> np.uint64(31)
+        np.minimum.at(self.bins, (hashes >> _SIMILARITY_BIN_SHIFT).astype(np.intp), hashes)
+    
+    def signature(self):
+        """signature (array ของ uint64) หรือ None ถ้าเนื้อหาสั้นเกินจะเปรียบเทียบ
+        
+        ช่องที่ไม่มี shingle ใช้ค่าของช่องถัดไปที่มีค่า (densification) บวกระยะห่าง
+        เพื่อให้ทุกช่องยังเทียบกันได้
+        """
+        if self.length < SIMILARITY_MIN_BYTES:
+            return None
+        signature = self.bins.copy()
+        filled = np.flatnonzero(signature != _SIMILARITY_EMPTY)
+        empty = np.flatnonzero(signature == _SIMILARITY_EMPTY)
+        if len(empty):
+            nearest = filled[np.searchsorted(filled, empty) % len(filled)]
+            distance = ((nearest - empty) % SIMILARITY_BINS).astype(np.uint64)
+            signature[empty] = signature[nearest] + distance * np.uint64(0x9e3779b97f4a7c15)
+        return signature
+
+def similarity_signature(content):
+    """signature ของเนื้อหาทั้งไฟล์ (str, bytes หรือ mmap) ดู SimilaritySketch"""
+    sketch = SimilaritySketch()
+    sketch.update(content)
+    return sketch.signature()
+
+def _lsh_bands(signature):
+    """คีย์ของ bucket ทุก band: เนื้อหาที่คล้ายกันมากจะมีอย่างน้อยหนึ่ง band ที่ตรงกันทั้ง band"""
+    rows = signature.reshape(-1, SIMILARITY_BAND_ROWS)
+    return [(band, row.tobytes()) for band, row in enumerate(rows)]
+
+class WebshellIndex:
+    """index ของ signature ตัวอย่าง webshell ที่รู้จัก สำหรับระบุตระกูลของไฟล์ที่สแกน
+    
+    lookup ดูเฉพาะตัวอย่างที่อยู่ bucket เดียวกันใน LSH band ใด band หนึ่ง
+    (ไม่เทียบกับทุกตัวอย่าง) แล้วจึงประมาณ Jaccard จากสัดส่วนช่องของ signature ที่เท่ากัน
+    """
+    def __init__(self, artifact):
+        self.sources = [tuple(source) for source in artifact['sources']]
+        self.samples = artifact['samples']
+        self.signatures = [np.frombuffer(bytes.fromhex(sample['signature']), dtype='<u8')
+                           for sample in self.samples]
+        self.version = hashlib.sha1(json.dumps(
+            [SIMILARITY_SHINGLE, SIMILARITY_BINS, SIMILARITY_BAND_ROWS, SIMILARITY_THRESHOLD,
+             SIMILARITY_MAX_BYTES, [sample['signature'] for sample in self.samples],
+             [[sample['family'], sample['name']] for sample in self.samples]]
+        ).encode('utf-8')).hexdigest()[:16] if self.samples else ''
+        self.buckets = defaultdict(list)
+        for n, signature in enumerate(self.signatures):
+            for key in _lsh_bands(signature):
+                self.buckets[key].append(n)
+    
+    @property
+    def families(self):
+        return sorted({sample['family'] for sample in self.samples})
+    
+    def lookup(self, signature):
+        """[(คะแนน, sample)] ของตัวอย่างที่คล้ายไม่น้อยกว่า SIMILARITY_THRESHOLD เรียงจากมากไปน้อย"""
+        candidates = set()
+        for key in _lsh_bands(signature):
+            candidates.update(self.buckets.get(key, ()))
+        matches = []
+        for n in candidates:
+            score = np.count_nonzero(self.signatures[n] == signature) / SIMILARITY_BINS
+            if score >= SIMILARITY_THRESHOLD:
+                matches.append((score, self.samples[n]))
+        matches.sort(key=lambda match: (-match[0], match[1]['family'], match[1]['name']))
+        return matches
+    
+    def findings(self, content=None, sketch=None, timer=None):
+        """finding ของตระกูลที่ใกล้ที่สุด (ไม่มีตัวอย่างใน index = ไม่คิด signature เลย)"""
+        if not self.samples:
+            return []
+        started = time.perf_counter()
+        signature = sketch.signature() if sketch is not None else similarity_signature(content)
+        matches = self.lookup(signature) if signature is not None else []
+        if timer is not None:
+            timer.add_phase('similarity', time.perf_counter() - started)
+        if not matches:
+            return []
+        score, sample = matches[0]
+        return [Finding(
+            'known_webshell', 'critical', 0, sample['name'], sample['family'],
+            f"similarity/{sample['family']}",
+            description=f"Similar to known {sample['family']} webshell "
+                        f"({score:.0%} match with {sample['name']})"
+        )]
+
+def _sample_files(path):
+    """ไฟล์ตัวอย่างใต้ path (ข้ามไฟล์และโฟลเดอร์ที่ขึ้นต้นด้วยจุด) เรียงตามชื่อ"""
+    if path.is_file():
+        return [path]
+    return sorted(file for file in path.rglob('*') if file.is_file()
+                  and not any(part.startswith('.') for part in file.relative_to(path).parts))
+
+def sample_family(root, file):
+    """ตระกูลของตัวอย่าง: ชื่อโฟลเดอร์ย่อยชั้นแรกใต้ root (c99/x.php) หรือชื่อไฟล์ (c99.php)"""
+    parts = file.relative_to(root).parts if root.is_dir() else (file.name,)
+    return (parts[0] if len(parts) > 1 else Path(parts[0]).stem).lower()
+
+def webshell_source_fingerprint(path):
+    """fingerprint ของ path จากชื่อ ขนาด และเวลาแก้ไขของทุกไฟล์ (ไม่ต้องอ่านเนื้อหา)
+    
+    rerun ของ Streamlit จึงตรวจได้เร็วว่าตัวอย่างเปลี่ยนหรือไม่ แม้มีตัวอย่างหลายพันไฟล์
+    """
+    path = Path(path)
+    if not path.exists():
+        raise WebshellIndexError(f"{path}: no such file or directory")
+    entries = []
+    for file in _sample_files(path):
+        stat = file.stat()
+        entries.append([str(file.relative_to(path)) if path.is_dir() else file.name,
+                        stat.st_size, stat.st_mtime_ns])
+    return hashlib.sha256(json.dumps(entries).encode('utf-8')).hexdigest()
+
+def read_index_file(path):
+    """ตัวอย่างจากไฟล์ index (.json) ที่สร้างไว้แล้ว แจกจ่ายได้โดยไม่ต้องมีไฟล์ webshell จริง"""
+    try:
+        artifact = json.loads(Path(path).read_text(encoding='utf-8'))
+    except (OSError, ValueError) as e:
+        raise WebshellIndexError(f"{path}: cannot read index: {e}")
+    if not isinstance(artifact, dict) or artifact.get('params') != similarity_params():
+        raise WebshellIndexError(f"{path}: index was built with different similarity settings")
+    samples = artifact.get('samples')
+    if not isinstance(samples, list) or not all(
+            isinstance(sample, dict) and {'family', 'name', 'signature'} <= set(sample)
+            for sample in samples):
+        raise WebshellIndexError(f"{path}: expected a list of samples with family, name and signature")
+    return samples
+
+def similarity_params():
+    return [SIMILARITY_SHINGLE, SIMILARITY_BINS, SIMILARITY_MIN_BYTES, SIMILARITY_MAX_BYTES]
+
+def build_webshell_artifact(paths):
+    """คิด signature ของตัวอย่างทุกไฟล์ใน paths (โฟลเดอร์ ไฟล์ตัวอย่าง หรือไฟล์ index .json)"""
+    samples = []
+    for path in map(Path, paths):
+        if path.is_file() and path.suffix.lower() == '.json':
+            samples.extend(read_index_file(path))
+            continue
+        for file in _sample_files(path):
+            try:
+                with open(file, 'rb') as f:
+                    data = f.read(SIMILARITY_MAX_BYTES)
+            except OSError as e:
+                raise WebshellIndexError(f"{file}: {e.strerror or e}")
+            signature = similarity_signature(data)
+            # ตัวอย่างที่สั้นเกินไปเทียบไม่ได้ความหมาย ข้ามไปแทนที่จะทำให้ทั้ง index ใช้ไม่ได้
+            if signature is None:
+                continue
+            samples.append({
+                'family': sample_family(path, file),
+                'name': file.name,
+                'sha256': hashlib.sha256(data).hexdigest(),
+                'signature': signature.astype('<u8').tobytes().hex(),
+            })
+    return {'params': similarity_params(), 'sources': [], 'samples': samples}
+
+def load_webshell_index(paths=(), sources=None):
+    """WebshellIndex ของตัวอย่างใน paths (เก็บ artifact ไว้ใน WEBSHELL_INDEX_DIR)
+    
+    คีย์ของ artifact คือ fingerprint ของทุก path เมื่อไฟล์ตัวอย่างเปลี่ยน คีย์ก็เปลี่ยนเอง
+    """
+    sources = [(str(path), webshell_source_fingerprint(path)) for path in paths] \
+        if sources is None else sources
+    if not sources:
+        return WebshellIndex({'sources': [], 'samples': []})
+    
+    key = hashlib.sha256(json.dumps([similarity_params(), sources]).encode('utf-8')).hexdigest()[:32]
+    artifact_path = WEBSHELL_INDEX_DIR / f"{key}.json"
+    try:
+        artifact = json.loads(artifact_path.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        artifact = build_webshell_artifact([path for path, _ in sources])
+        try:
+            WEBSHELL_INDEX_DIR.mkdir(parents=True, exist_ok=True)
+            temp_path = artifact_path.with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+            temp_path.write_text(json.dumps(artifact), encoding='utf-8')
+            os.replace(temp_path, artifact_path)
+        except OSError:
+            pass
+    artifact['sources'] = sources
+    return WebshellIndex(artifact)
+
+def activate_webshell_index(paths=()):
+    """สลับ WEBSHELL_INDEX เป็นของ paths เมื่อไฟล์ตัวอย่างเปลี่ยนไปจากชุดที่ใช้อยู่ (เหมือน activate_rule_packs)"""
+    global WEBSHELL_INDEX
+    sources = [(str(path), webshell_source_fingerprint(path)) for path in paths]
+    if sources != WEBSHELL_INDEX.sources:
+        WEBSHELL_INDEX = load_webshell_index(sources=sources)
+    return WEBSHELL_INDEX
+
+WEBSHELL_INDEX = load_webshell_index()
+
+# ========== Streaming Scan ==========
+
+STREAM_WINDOW_SIZE = 1024 * 1024   # ตัวอักษรต่อ window
+STREAM_OVERLAP = 4096              # ช่วงทับซ้อนให้ pattern ที่คร่อมรอยต่อ window ยัง match
+STREAM_CONTEXT = 64                # ตัวอักษรก่อนช่วงของ window สำหรับ \b และ lookbehind
+STREAM_READ_SIZE = 64 * 1024       # bytes ต่อการอ่านจาก network
+
+class StreamScanner:
+    """สแกนเนื้อหาที่ทยอยเข้ามาเป็น window ขนาดคงที่ที่ทับซ้อนกัน
+    
+    match ถูกนับให้ window ที่จุดเริ่มของ match อยู่ในช่วงของตัวเองเท่านั้น
+    จึงไม่ซ้ำกันระหว่าง window และหน่วยความจำคงที่ตามขนาด window
+    
+    ถ้ามี cache และไฟล์จบใน window เดียว จะตรวจ cache ด้วย hash ก่อนสแกน
+    hash และ similarity sketch คิดจาก byte ดิบที่อ่านได้ จึงตรงกับการสแกนไฟล์เดียวกันจาก disk
+    
+    PhpTokens ถือว่าเนื้อหาที่ไม่มี <?php เลยเป็น code ทั้งหมด ซึ่งตัดสินจากทั้งไฟล์
+    จนกว่าจะพบ open tag จึงสแกนแต่ละ window สองแบบ (เริ่มเป็น HTML และเริ่มเป็น code)
+    แล้วเลือกแบบ code ตอนจบเฉพาะเมื่อทั้งไฟล์ไม่มี open tag
+    """
+    def __init__(self, filename, cross_line=False, window_size=STREAM_WINDOW_SIZE,
+                 overlap=STREAM_OVERLAP, cache=None, timer=None):
+        self.filename = filename
+        self.cross_line = cross_line
+        self.timer = timer or PhaseTimer()
+        self.window_size = max(window_size, overlap + STREAM_CONTEXT + 1)
+        self.overlap = overlap
+        self.cache = cache
+        self.rules = RULES
+        self.index = WEBSHELL_INDEX
+        self.filename_findings = []
+        self.content_findings = []
+        self.hasher = hashlib.md5()
+        self.sketch = SimilaritySketch() if self.index.samples else None
+        self.saturated = False
+        self.cached = False
+        self.is_php = None
+        self._windows_scanned = 0
+        self._pieces = []
+        self._buffered = 0
+        self._owned_from = 0
+        self._line_offset = 0
+        self._offset = 0
+        self._php_state = ('html', None)
+        self._seen_rules = set()
+        self._prefilter = True
+        # การสแกนแบบเริ่มเป็น code (ใช้เมื่อทั้งไฟล์ไม่มี open tag) None = พบ open tag แล้ว
+        self._code_scan = {'state': ('code', None), 'findings': [], 'seen': set()}
+    
+    def feed(self, text, data=None):
+        """เพิ่มข้อความ คืน False เมื่อคะแนนความเสี่ยงเต็ม 100 แล้ว (หยุดอ่านต่อได้)
+        
+        data คือ byte ดิบที่ decode ได้เป็น text (None = encode text เป็น UTF-8)
+        """
+        if self.saturated or self.is_php is False:
+            return False
+        
+        if data is None:
+            data = text.encode('utf-8', errors='ignore')
+        self.hasher.update(data)
+        if self.sketch is not None:
+            with self.timer.phase('similarity'):
+                self.sketch.update(data)
+        self._pieces.append(text)
+        self._buffered += len(text)
+        
+        while self._buffered >= self.window_size and not self.saturated and self.is_php is not False:
+            self._scan_window(final=False)
+        return not self.saturated and self.is_php is not False
+    
+    @property
+    def findings(self):
+        return self.filename_findings + self.content_findings
+    
+    def finish(self):
+        """สแกนส่วนที่เหลือ แล้วคืน findings ทั้งหมด"""
+        if self.saturated or self.is_php is False:
+            self._resolve_code_scan()
+            return self.findings
+        
+        content_hash = self.hasher.hexdigest()
+        ruleset = ruleset_key(self.cross_line, rules=self.rules, index=self.index)
+        
+        if self.cache is not None and self._windows_scanned == 0:
+            # ทั้งไฟล์อยู่ใน buffer แล้ว จึงรู้ hash ก่อนสแกน
+            if not self._start_file(''.join(self._pieces)):
+                return self.findings
+            cached = self.cache.get(content_hash, ruleset)
+            if cached is not None:
+                self.content_findings = cached
+                self.cached = True
+                return self.findings
+        
+        self._scan_window(final=True)
+        self._resolve_code_scan()
+        if self.is_php and not self.saturated:
+            self.content_findings.extend(self.index.findings(sketch=self.sketch, timer=self.timer))
+        
+        if (self.cache is not None and self.is_php and not self.saturated
+                and not has_rule_timeout(self.content_findings)):
+            self.cache.put(content_hash, ruleset, self.content_findings)
+        return self.findings
+    
+    def _resolve_code_scan(self):
+        """เนื้อหาที่อ่านแล้วไม่มี open tag เลย: ใช้ผลแบบ code ให้ตรงกับ scan_file ของเนื้อหาเดียวกัน"""
+        if self._code_scan is not None and self._windows_scanned:
+            self.content_findings = self._code_scan['findings']
+        self._code_scan = None
+    
+    def _start_file(self, window):
+        """ตรวจว่าเป็น PHP และตรวจชื่อไฟล์ (ทำครั้งเดียวที่ window แรก)"""
+        if self.is_php is None:
+            self.is_php = is_php_content(window, self.filename)
+            if self.is_php:
+                self.filename_findings = check_filename(self.filename, self.rules)
+                self._prefilter = not self.filename_findings
+        return self.is_php
+    
+    def _scan_window(self, final):
+        buffer = ''.join(self._pieces)
+        window = buffer if final else buffer[:self.window_size]
+        
+        if not self._start_file(window):
+            return
+        self._windows_scanned += 1
+        
+        owned_end = len(window) if final else len(window) - self.overlap
+        if self._code_scan is not None:
+            # "<?" ท้าย window อาจเป็นต้นของ <?xml จึงให้ window ถัดไป (ที่ทับซ้อนกัน) ตัดสินแทน
+            search_end = len(window) if final else len(window) - 3
+            if _LEXER_PATTERNS[False].open_tag.search(window, 0, search_end):
+                self._code_scan = None
+        
+        tokens = PhpTokens(window, state=self._php_state)
+        self._collect(window, owned_end, tokens, self.content_findings, self._seen_rules)
+        score = calculate_risk_score(self.findings)
+        if self._code_scan is not None:
+            code_tokens = PhpTokens(window, state=self._code_scan['state'])
+            self._collect(window, owned_end, code_tokens, self._code_scan['findings'], self._code_scan['seen'])
+            # ยังไม่รู้ว่าใช้ผลแบบไหน จึงหยุดอ่านเมื่อคะแนนเต็มทั้งสองแบบ
+            score = min(score, calculate_risk_score(self.filename_findings + self._code_scan['findings']))
+        
+        if score >= 100:
+            self.saturated = True
+        
+        if not final:
+            drop = owned_end - STREAM_CONTEXT
+            # window ถัดไปเริ่มที่ drop จึง lex ต่อจากสถานะของ lexer ตรงนั้น
+            self._php_state = tokens.state_at(drop)
+            if self._code_scan is not None:
+                self._code_scan['state'] = code_tokens.state_at(drop)
+            self._line_offset += buffer.count('\n', 0, drop)
+            self._offset += drop
+            rest = buffer[drop:]
+            self._pieces = [rest]
+            self._buffered = len(rest)
+            self._owned_from = STREAM_CONTEXT
+
+    def _collect(self, window, owned_end, tokens, findings, seen):
+        for finding in scan_content(window, self.filename, cross_line=self.cross_line,
+                                    prefilter=self._prefilter,
+                                    owned=(self._owned_from, owned_end),
+                                    line_offset=self._line_offset, offset=self._offset,
+                                    timer=self.timer, rules=self.rules, tokens=tokens):
+            # บรรทัดยาวที่คร่อมหลาย window อาจให้ rule เดิมซ้ำ (1 finding ต่อ rule ต่อบรรทัด)
+            key = (finding.rule, finding.line)
+            if key in seen:
+                continue
+            seen.add(key)
+            findings.append(finding)
+
+def read_stream_into(response, scanner, max_bytes=None):
+    """อ่าน response แบบ stream ส่งให้ scanner ทีละส่วน คืน (complete, truncated)
+    
+    complete=True เมื่ออ่านครบทั้งไฟล์ ส่วน truncated=True เฉพาะเมื่อหยุดเพราะถึง max_bytes
+    หรือคะแนนเต็ม ไฟล์ที่หยุดอ่านเพราะไม่ใช่ PHP จึงไม่นับว่าถูกตัด
+    ส่ง byte ดิบคู่กับข้อความที่ decode แล้ว ให้ hash ไม่ขึ้นกับ encoding หรือ byte ที่ decode ไม่ได้
+    """
+    decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')(errors='replace')
+    received = 0
+    
+    for chunk in response.iter_content(chunk_size=STREAM_READ_SIZE):
+        if max_bytes and received + len(chunk) > max_bytes:
+            chunk = chunk[:max_bytes - received]
+            scanner.feed(decoder.decode(chunk, final=True), chunk)
+            return False, True
+        received += len(chunk)
+        if not scanner.feed(decoder.decode(chunk), chunk):
+            return False, scanner.saturated
+    
+    scanner.feed(decoder.decode(b'', final=True), b'')
+    return True, False
+
+def calculate_risk_score(findings):
+    score = 0
+    severity_weights = {'critical': 10, 'high': 5, 'medium': 2}
+    
+    for finding in findings:
+        severity = finding.get('severity', 'medium')
+        score += severity_weights.get(severity, 1)
+    
+    return min(score, 100)
+
+def get_risk_level(score):
+    if score >= 50:
+        return 'CRITICAL', '🔴'
+    elif score >= 30:
+        return 'HIGH', '🟠'
+    elif score >= 10:
+        return 'MEDIUM', '🟡'
+    elif score > 0:
+        return 'LOW', '🟢'
+    else:
+        return 'CLEAN', '✅'
+
+def fetch_url_content(url, timeout=10, session=None):
+    try:
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+        }
+        response = (session or requests).get(url, headers=headers, timeout=timeout, verify=False)
+        response.raise_for_status()
+        return response.text, response.status_code
+    except Exception as e:
+        raise Exception(f"Error fetching URL: {str(e)}")
+
+# ========== Concurrent Fetching ==========
+
+def mount_connection_pool(session, pool_size):
+    """ขยาย connection pool (keep-alive) ของ session ให้พอสำหรับทุก worker"""
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+def create_session(pool_size=10):
+    """สร้าง Session ที่มี connection pool (keep-alive) พอสำหรับทุก worker"""
+    session = requests.Session()
+    mount_connection_pool(session, pool_size)
+    session.headers.update({
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+    })
+    return session
+
+class HostRateLimiter:
+    """เว้นระยะ request ไปยัง host เดียวกันอย่างน้อย delay วินาที (ใช้ร่วมกันหลาย thread ได้)"""
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self._next_slot = {}
+        self._lock = threading.Lock()
+    
+    def wait(self, url):
+        """รอจนถึงคิวของ host นี้ แล้วจองคิวถัดไป"""
+        if self.delay <= 0:
+            return
+        
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.delay
+        
+        if slot > now:
+            time.sleep(slot - now)
+
+def open_url_stream(url, timeout=10, session=None, extra_headers=None):
+    """เปิด URL แบบ stream (ยังไม่อ่าน body) ผู้เรียกต้องปิด response เอง"""
+    try:
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+        }
+        headers.update(extra_headers or {})
+        response = (session or requests).get(url, headers=headers, timeout=timeout,
+                                              verify=False, stream=True)
+        response.raise_for_status()
+        return response
+    except Exception as e:
+        raise Exception(f"Error fetching URL: {str(e)}")
+
+def scan_url(url, session=None, timeout=10, cross_line=False, rate_limiter=None,
+             max_bytes=None, cache=None, http_cache=None):
+    """ดึงและสแกน URL เดียวแบบ stream คืน result dict (สถานะ failed ถ้าดึงไม่ได้)
+    
+    อ่านไม่เกิน max_bytes และหยุดอ่านทันทีเมื่อคะแนนความเสี่ยงเต็ม 100 (truncated=True)
+    ถ้ามี http_cache จะส่ง conditional request และใช้ผลเดิมเมื่อได้ 304 Not Modified
+    result['timings'] เก็บเวลาแต่ละ phase และต้นทุนต่อ rule (ดู PhaseTimer)
+    """
+    timer = PhaseTimer()
+    try:
+        if rate_limiter:
+            with timer.phase('rate_limit'):
+                rate_limiter.wait(url)
+        filename = urlparse(url).path.split('/')[-1] or 'index.php'
+        scanner = StreamScanner(filename, cross_line=cross_line, cache=cache, timer=timer)
+        
+        # ผลเดิมใช้ได้เฉพาะเมื่อสแกนด้วย ruleset เดียวกัน
+        entry = http_cache.get(url, 'scan') if http_cache else None
+        if entry and entry['payload'].get('ruleset') != ruleset_key(cross_line, rules=scanner.rules, index=scanner.index):
+            entry = None
+        
+        with timer.phase('request'):
+            response = open_url_stream(url, timeout=timeout, session=session,
+                                       extra_headers=conditional_headers(entry))
+        with response:
+            if response.status_code == 304 and entry:
+                http_cache.record_not_modified()
+                findings = findings_from_dicts(entry['payload']['findings'])
+                content_hash = entry['payload']['hash']
+                complete = True
+                truncated = False
+                cached = True
+            else:
+                # เวลา transfer = เวลาอ่าน body ทั้งหมด หักเวลาที่ใช้สแกนระหว่างอ่าน
+                started = time.perf_counter()
+                scanning = timer.total
+                try:
+                    complete, truncated = read_stream_into(response, scanner, max_bytes=max_bytes)
+                except Exception as e:
+                    raise Exception(f"Error fetching URL: {str(e)}")
+                timer.add_phase('transfer', time.perf_counter() - started - (timer.total - scanning))
+                findings = scanner.finish()
+                content_hash = scanner.hasher.hexdigest()
+                cached = scanner.cached
+                
+                if http_cache and complete and not has_rule_timeout(findings):
+                    http_cache.put(url, 'scan', response, {
+                        'ruleset': ruleset_key(cross_line, rules=scanner.rules, index=scanner.index),
+                        'findings': findings,
+                        'hash': content_hash
+                    })
+        
+        score = calculate_risk_score(findings)
+        risk_level, emoji = get_risk_level(score)
+        
+        return {
+            'url': url,
+            'filename': filename,
+            'findings': findings,
+            'score': score,
+            'risk_level': risk_level,
+            'status': 'success',
+            'hash': content_hash,
+            'truncated': truncated,
+            'cached': cached,
+            'timings': timer.as_dict()
+        }
+        
+    except Exception as e:
+        return {
+            'url': url,
+            'filename': urlparse(url).path.split('/')[-1] or 'unknown',
+            'findings': [],
+            'score': 0,
+            'risk_level': 'ERROR',
+            'status': 'failed',
+            'error': str(e),
+            'timings': timer.as_dict()
+        }
+
+def profiled_call(profiler, func, *args):
+    """เรียก func ภายใต้ profiler (ถ้ามี) ใช้กับงานที่รันใน worker thread"""
+    if profiler is None:
+        return func(*args)
+    with profiler.profile():
+        return func(*args)
+
+def scan_urls_concurrently(urls, timeout=10, delay=0.0, max_workers=4, cross_line=False,
+                           max_bytes=None, cache=None, http_cache=None, profiler=None):
+    """สแกนหลาย URL พร้อมกันด้วย thread pool คืน (index, result) ตามลำดับที่เสร็จ
+    
+    ทุก worker ใช้ Session เดียวกัน (connection pool ร่วม) และ delay ถูกใช้เป็น
+    rate limit ต่อ host แทนการ sleep ทั้งระบบ การสแกนจึงทับซ้อนกับการดึงไฟล์อื่น
+    ถ้ามี profiler (ScanProfiler) จะ profile การสแกนแต่ละ URL ด้วย cProfile (ทีละ URL)
+    """
+    session = create_session(pool_size=max_workers)
+    rate_limiter = HostRateLimiter(delay)
+    
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(profiled_call, profiler, scan_url, url, session, timeout, cross_line,
+                                rate_limiter, max_bytes, cache, http_cache): i
+                for i, url in enumerate(urls)
+            }
+            try:
+                for future in as_completed(futures):
+                    yield futures[future], future.result()
+            finally:
+                for future in futures:
+                    future.cancel()
+    finally:
+        session.close()
+
+def scan_urls_resumable(urls, checkpoints, scan_key, **options):
+    """เหมือน scan_urls_concurrently แต่ใช้ผลที่เสร็จแล้วจาก checkpoint และบันทึกผลใหม่ทีละไฟล์
+    
+    ไฟล์ที่สแกนไม่สำเร็จ (status 'failed') ไม่ถูกบันทึก จึงถูกลองใหม่เมื่อ resume
+    """
+    completed = checkpoints.completed_results(scan_key)
+    remaining = []
+    for i, url in enumerate(urls):
+        if url in completed:
+            yield i, completed[url]
+        else:
+            remaining.append(i)
+    
+    for j, result in scan_urls_concurrently([urls[i] for i in remaining], **options):
+        if result.get('status') != 'failed':
+            checkpoints.save_result(scan_key, result)
+        yield remaining[j], result
+
+# ========== Local Files & ZIP Archives ==========
+
+PHP_EXTENSIONS = ('.php', '.phtml', '.php3', '.php4', '.php5', '.php7', '.phps', '.inc')
+
+SCAN_SOURCES = ["Website URL", "ZIP Archive", "Server Directory"]
+
+def is_local_candidate(name, all_files=False):
+    """เลือกไฟล์ที่ควรสแกน (นามสกุล PHP หรือทุกไฟล์ถ้า all_files)"""
+    return all_files or name.lower().endswith(PHP_EXTENSIONS)
+
+def list_directory_files(root, all_files=False):
+    """รายการ path ของไฟล์ที่ควรสแกนใน directory (ไม่ตาม symlink)"""
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            if is_local_candidate(name, all_files) and not os.path.islink(path):
+                paths.append(path)
+    return paths
+
+def list_zip_members(zip_file, all_files=False):
+    """รายการ member ใน ZIP ที่ควรสแกน (อ่านเฉพาะ metadata)"""
+    return [
+        info for info in zip_file.infolist()
+        if not info.is_dir() and is_local_candidate(info.filename, all_files)
+    ]
+
+def iter_zip_tasks(zip_file, members, archive_name, max_bytes=None):
+    """อ่านเนื้อหา member ทีละไฟล์จาก ZIP ในหน่วยความจำ (ไม่แตกไฟล์ลงดิสก์)"""
+    for info in members:
+        with zip_file.open(info) as member:
+            data = member.read(max_bytes + 1) if max_bytes else member.read()
+        yield f"{archive_name}:{info.filename}", data
+
+_worker_cache = None
+
+def _init_local_worker(use_cache, rule_packs=(), webshell_samples=()):
+    """initializer ของ worker process: เปิด ScanCache และโหลด rule pack/ตัวอย่าง webshell หนึ่งครั้งต่อ process"""
+    global _worker_cache
+    _worker_cache = ScanCache() if use_cache else None
+    activate_rule_packs(rule_packs)
+    activate_webshell_index(webshell_samples)
+
+def map_file(path, max_bytes=None):
+    """เปิดไฟล์แบบ memory-map อ่านอย่างเดียว คืน (content, truncated)
+    
+    ไฟล์ว่างคืน b'' เพราะ mmap ขนาด 0 ไม่ได้
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        length = min(size, max_bytes) if max_bytes else size
+        if length == 0:
+            return b'', False
+        return mmap.mmap(f.fileno(), length, access=mmap.ACCESS_READ), length < size
+
+def scan_local_file(location, data=None, cross_line=False, max_bytes=None):
+    """สแกนไฟล์ local หนึ่งไฟล์ (รันใน worker process) ถ้า data=None จะ mmap จาก location
+    
+    สแกนเป็น bytes โดยตรง ไม่ decode ทั้งไฟล์เป็น str จึงแทบไม่ใช้หน่วยความจำเพิ่มแม้ไฟล์ใหญ่
+    """
+    filename = location.replace('\\', '/').split('/')[-1]
+    content = None
+    timer = PhaseTimer()
+    try:
+        with timer.phase('read'):
+            if data is None:
+                content, truncated = map_file(location, max_bytes)
+            else:
+                truncated = bool(max_bytes) and len(data) > max_bytes
+                content = data[:max_bytes] if truncated else data
+        
+        findings, cached = scan_file_cached(content, filename, cross_line=cross_line,
+                                            cache=_worker_cache, timer=timer)
+        score = calculate_risk_score(findings)
+        risk_level, emoji = get_risk_level(score)
+        
+        return {
+            'url': location,
+            'filename': filename,
+            'findings': findings,
+            'score': score,
+            'risk_level': risk_level,
+            'status': 'success',
+            'hash': calculate_file_hash(content),
+            'truncated': truncated,
+            'cached': cached,
+            'timings': timer.as_dict()
+        }
+        
+    except Exception as e:
+        return {
+            'url': location,
+            'filename': filename,
+            'findings': [],
+            'score': 0,
+            'risk_level': 'ERROR',
+            'status': 'failed',
+            'error': str(e),
+            'timings': timer.as_dict()
+        }
+    
+    finally:
+        if isinstance(content, mmap.mmap):
+            content.close()
+
+def scan_local_files(tasks, cross_line=False, max_bytes=None, processes=None, use_cache=True):
+    """สแกนไฟล์ local ด้วย ProcessPoolExecutor คืน result ตามลำดับที่เสร็จ
+    
+    tasks คือ iterable ของ (location, data) โดย data=None ให้ worker อ่านไฟล์เอง
+    จำนวนงานค้างถูกจำกัดไว้ที่ processes * 4 เนื้อหาจาก ZIP จึงไม่ค้างในหน่วยความจำทั้งหมด
+    """
+    processes = processes or os.cpu_count() or 1
+    tasks = iter(tasks)
+    pending = set()
+    exhausted = False
+    
+    # worker ที่ไม่ได้ fork จาก process นี้ต้องโหลด rule pack ชุดเดียวกันเอง (จาก artifact ใน cache)
+    rule_packs = [path for path, _ in RULES.sources]
+    webshell_samples = [path for path, _ in WEBSHELL_INDEX.sources]
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_local_worker,
+                             initargs=(use_cache, rule_packs, webshell_samples)) as executor:
+        while pending or not exhausted:
+            while not exhausted and len(pending) < processes * 4:
+                try:
+                    location, data = next(tasks)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending.add(executor.submit(scan_local_file, location, data, cross_line, max_bytes))
+            
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+# ========== Report Generation ==========
+
+SLOWEST_LIMIT = 10                       # จำนวนแถวในตาราง slowest rules / hosts / files
+NETWORK_PHASES = ('request', 'transfer')  # phase ที่นับเป็นเวลาของ host
 
-def check_filename(filename):
-    results = []
-    
-    if any(bad_name in filename.lower() for bad_name in COMMON_BACKDOOR_NAMES):
-        results.append({
-            'type': 'suspicious_filename',
-            'severity': 'high',
-            'line': 0,
-            'code': filename,
-            'category': 'backdoor',
-            'description': f'Suspicious filename: {filename}'
-        })
+CLUSTER_MIN_MEMBERS = 2          # cluster ที่มีสมาชิกน้อยกว่านี้ไม่ใช่ content ซ้ำ จึงไม่แสดง
+CLUSTER_URL_LIMIT = 50           # URL ตัวอย่างสูงสุดที่เก็บต่อ cluster (จำนวนสมาชิกนับครบทุกไฟล์)
+CLUSTER_COLUMNS = ['Members', 'Sites', 'Variants', 'Risk Level', 'Risk Score', 'Filename',
+                   'Findings', 'Signature', 'Example URL']
+CODE_WHITESPACE = re.compile(r'\s+')
+
+def finding_signature(findings):
+    """signature ของ finding ในเนื้อหาที่ไม่ขึ้นกับเลขบรรทัด ชื่อไฟล์ และการเว้นวรรค
     
-    return results
+    payload เดียวกันที่ถูกฝังต่างตำแหน่งหรือต่างเว็บไซต์จึงได้ signature เดียวกัน
+    """
+    return tuple(sorted({
+        (finding['rule'], CODE_WHITESPACE.sub('', str(finding['code'])).lower())
+        for finding in findings if finding['type'] != 'suspicious_filename'
+    }))
 
-def scan_file(content, filename):
-    results = []
+def location_site(location):
+    """ส่วนของ location ที่แยกเว็บไซต์ใน cluster: host ของ URL หรือ directory ของไฟล์ local/ZIP
     
-    if not (filename.endswith('.php') or filename.endswith('.phtml') or 
-            content.strip().startswith('<?php') or '<?php' in content[:100]):
-        return results
+    ไฟล์ local และใน ZIP ไม่มี host จึงนับแต่ละ directory (และแต่ละ archive) เป็นคนละที่
+    """
+    if '://' in location:
+        return location.partition('://')[2].partition('/')[0]
+    directory = location.replace('\\', '/').rpartition('/')[0]
+    # ไฟล์ที่อยู่บนสุดของ ZIP ("archive.zip:shell.php") ใช้ชื่อ archive
+    return directory or location.rpartition(':')[0]
+
+class DuplicateClusters:
+    """รวมไฟล์ที่ติดเชื้อเป็น cluster ด้วย hash map แทนการเทียบทีละคู่ (O(1) ต่อไฟล์)
     
-    results.extend(check_filename(filename))
-    results.extend(scan_dangerous_functions(content, filename))
-    results.extend(scan_suspicious_patterns(content, filename))
+    cluster คือไฟล์ที่มี finding signature เดียวกัน ภายใน cluster นับ hash ที่ต่างกันเป็น variant
+    ไฟล์ที่ hash ตรงกันจึงอยู่ cluster เดียวกันเสมอ และ duplicate_files นับสำเนาที่เหมือนกันทุก byte
+    """
+    def __init__(self):
+        self._clusters = {}
+        self._hash_counts = defaultdict(int)
+        self._hash_signatures = {}    # hash -> signature (สำเนาที่เหมือนกันไม่ต้องคิด signature ซ้ำ)
     
-    return results
-
-def calculate_risk_score(findings):
-    score = 0
-    severity_weights = {'critical': 10, 'high': 5, 'medium': 2}
+    def add(self, result):
+        findings = result.get('findings')
+        if not findings:
+            return
+        content_hash = result.get('hash')
+        if content_hash:
+            self._hash_counts[content_hash] += 1
+        
+        signature = self._hash_signatures.get(content_hash) if content_hash else None
+        if signature is None:
+            # ไฟล์ที่มีแค่ finding ของชื่อไฟล์ รวมกลุ่มเฉพาะสำเนาที่เหมือนกันทุก byte
+            # ถ้าไม่มี hash รวมกลุ่มตามชื่อไฟล์แทน ไฟล์ที่ไม่เกี่ยวกันจึงไม่รวมเป็น cluster เดียว
+            signature = finding_signature(findings) or (
+                (('hash', content_hash),) if content_hash else (('filename', result['filename'].lower()),))
+            if content_hash:
+                self._hash_signatures[content_hash] = signature
+        
+        cluster = self._clusters.get(signature)
+        if cluster is None:
+            cluster = self._clusters[signature] = {
+                'members': 0,
+                'sites': set(),
+                'hashes': set(),
+                'score': result['score'],
+                'risk_level': result['risk_level'],
+                'filename': result['filename'],
+                'findings': sorted({finding['rule'] for finding in findings}),
+                'urls': [],
+            }
+        cluster['members'] += 1
+        if result['score'] > cluster['score']:
+            cluster['score'], cluster['risk_level'] = result['score'], result['risk_level']
+        cluster['sites'].add(location_site(result['url']))
+        if content_hash:
+            cluster['hashes'].add(content_hash)
+        if len(cluster['urls']) < CLUSTER_URL_LIMIT:
+            cluster['urls'].append(result['url'])
     
-    for finding in findings:
-        severity = finding.get('severity', 'medium')
-        score += severity_weights.get(severity, 1)
+    @property
+    def duplicate_files(self):
+        """จำนวนไฟล์ที่เป็นสำเนาซ้ำ (ไม่นับสำเนาแรกของแต่ละ hash)"""
+        return sum(count - 1 for count in self._hash_counts.values())
     
-    return min(score, 100)
-
-def get_risk_level(score):
-    if score >= 50:
-        return 'CRITICAL', '🔴'
-    elif score >= 30:
-        return 'HIGH', '🟠'
-    elif score >= 10:
-        return 'MEDIUM', '🟡'
-    elif score > 0:
-        return 'LOW', '🟢'
-    else:
-        return 'CLEAN', '✅'
+    def clusters(self, min_members=CLUSTER_MIN_MEMBERS):
+        """cluster ที่มีสมาชิกตั้งแต่ min_members เรียงตามจำนวนสมาชิกแล้วตาม risk score"""
+        clusters = [
+            {
+                'signature': hashlib.sha1(json.dumps(signature).encode('utf-8')).hexdigest()[:16],
+                'members': cluster['members'],
+                'sites': len(cluster['sites']),
+                'variants': len(cluster['hashes']),
+                'risk_level': cluster['risk_level'],
+                'score': cluster['score'],
+                'filename': cluster['filename'],
+                'findings': cluster['findings'],
+                'urls': cluster['urls'],
+            }
+            for signature, cluster in self._clusters.items() if cluster['members'] >= min_members
+        ]
+        clusters.sort(key=lambda cluster: (-cluster['members'], -cluster['score'], cluster['signature']))
+        return clusters
 
-def fetch_url_content(url, timeout=10):
-    try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        }
-        response = requests.get(url, headers=headers, timeout=timeout, verify=False)
-        response.raise_for_status()
-        return response.text, response.status_code
-    except Exception as e:
-        raise Exception(f"Error fetching URL: {str(e)}")
+def cluster_row(cluster):
+    """แถวของ cluster หนึ่งในตาราง/รายงาน CSV"""
+    return {
+        'Members': cluster['members'],
+        'Sites': cluster['sites'],
+        'Variants': cluster['variants'],
+        'Risk Level': cluster['risk_level'],
+        'Risk Score': cluster['score'],
+        'Filename': cluster['filename'],
+        'Findings': ', '.join(cluster['findings']),
+        'Signature': cluster['signature'],
+        'Example URL': cluster['urls'][0],
+    }
 
-# ========== Report Generation ==========
+def export_clusters_csv(clusters):
+    """Export cluster ของ content ซ้ำเป็น CSV"""
+    return pd.DataFrame([cluster_row(cluster) for cluster in clusters], columns=CLUSTER_COLUMNS)
 
-def generate_summary_stats(results):
-    """สร้างสถิติสรุป"""
-    total_files = len(results)
-    total_issues = sum(len(r['findings']) for r in results)
+class SummaryStats:
+    """สะสมสถิติสรุปทีละไฟล์ ไม่ต้องเก็บผลทั้งหมดไว้ในหน่วยความจำ
     
-    severity_counts = defaultdict(int)
-    category_counts = defaultdict(int)
+    รวมเวลาจาก result['timings'] เป็นเวลาต่อ phase ต่อ rule ต่อ host และไฟล์ที่ช้าที่สุด
+    """
+    def __init__(self):
+        self.total_files = 0
+        self.total_issues = 0
+        self.severity_counts = defaultdict(int)
+        self.category_counts = defaultdict(int)
+        self.risk_levels = defaultdict(int)
+        self.phase_seconds = defaultdict(float)
+        self.rule_costs = defaultdict(lambda: [0.0, 0, 0])   # rule -> [วินาที, match, ไฟล์]
+        self.host_costs = defaultdict(lambda: [0.0, 0])      # host -> [วินาที, ไฟล์]
+        self._slowest_files = []                             # min-heap ของ (วินาที, url)
+        self.duplicates = DuplicateClusters()
     
-    for result in results:
+    def add(self, result):
+        self.total_files += 1
+        self.total_issues += len(result['findings'])
         for finding in result['findings']:
-            severity_counts[finding['severity']] += 1
+            self.severity_counts[finding['severity']] += 1
             if 'category' in finding:
-                category_counts[finding['category']] += 1
+                self.category_counts[finding['category']] += 1
+        self.risk_levels[result['risk_level']] += 1
+        self.duplicates.add(result)
+        if result.get('timings'):
+            self.add_timings(result['url'], result['timings'])
     
-    risk_levels = defaultdict(int)
-    for result in results:
-        risk_levels[result['risk_level']] += 1
+    def add_timings(self, url, timings):
+        phases = timings['phases']
+        for name, seconds in phases.items():
+            self.phase_seconds[name] += seconds
+        for rule, (seconds, matches) in timings['rules'].items():
+            cost = self.rule_costs[rule]
+            cost[0] += seconds
+            cost[1] += matches
+            cost[2] += 1
+        
+        host = urlparse(url).netloc
+        if host:
+            cost = self.host_costs[host]
+            cost[0] += sum(phases.get(name, 0.0) for name in NETWORK_PHASES)
+            cost[1] += 1
+        
+        item = (sum(phases.values()), url)
+        if len(self._slowest_files) < SLOWEST_LIMIT:
+            heapq.heappush(self._slowest_files, item)
+        else:
+            heapq.heappushpop(self._slowest_files, item)
+    
+    def add_crawl_timings(self, timings):
+        """เพิ่มเวลาของขั้น crawl (PhaseTimer.as_dict ของ WebsiteCrawler) เป็น phase crawl_*"""
+        for name, seconds in timings['phases'].items():
+            self.phase_seconds[f'crawl_{name}'] += seconds
+    
+    def performance(self, limit=SLOWEST_LIMIT):
+        """ตารางเวลาต่อ phase, rule ที่ช้าที่สุด, host ที่ช้าที่สุด และไฟล์ที่ช้าที่สุด"""
+        rules = sorted(self.rule_costs.items(), key=lambda item: item[1][0], reverse=True)
+        hosts = sorted(self.host_costs.items(), key=lambda item: item[1][0], reverse=True)
+        return {
+            'phases': {name: round(seconds, 4) for name, seconds in self.phase_seconds.items()},
+            'slowest_rules': [
+                {'rule': rule, 'seconds': round(seconds, 4), 'matches': matches, 'files': files,
+                 'ms_per_file': round(seconds * 1000 / files, 3)}
+                for rule, (seconds, matches, files) in rules[:limit]
+            ],
+            'slowest_hosts': [
+                {'host': host, 'seconds': round(seconds, 4), 'files': files,
+                 'avg_seconds': round(seconds / files, 4)}
+                for host, (seconds, files) in hosts[:limit]
+            ],
+            'slowest_files': [
+                {'url': url, 'seconds': round(seconds, 4)}
+                for seconds, url in sorted(self._slowest_files, reverse=True)
+            ]
+        }
     
+    def as_dict(self):
+        return {
+            'total_files': self.total_files,
+            'total_issues': self.total_issues,
+            'severity_counts': dict(self.severity_counts),
+            'category_counts': dict(self.category_counts),
+            'risk_levels': dict(self.risk_levels),
+            'clean_files': self.risk_levels.get('CLEAN', 0),
+            'infected_files': self.total_files - self.risk_levels.get('CLEAN', 0),
+            'duplicate_files': self.duplicates.duplicate_files,
+            'clusters': self.duplicates.clusters(),
+            'performance': self.performance()
+        }
+
+def generate_summary_stats(results, crawl_timings=None):
+    """สร้างสถิติสรุป"""
+    stats = SummaryStats()
+    for result in results:
+        stats.add(result)
+    if crawl_timings:
+        stats.add_crawl_timings(crawl_timings)
+    return stats.as_dict()
+
+CSV_COLUMNS = ['URL', 'Filename', 'Risk Level', 'Risk Score', 'Total Issues', 'Critical', 'High', 'Medium']
+
+def csv_row(result):
+    """แถวสรุปของไฟล์หนึ่งในรายงาน CSV"""
     return {
-        'total_files': total_files,
-        'total_issues': total_issues,
-        'severity_counts': dict(severity_counts),
-        'category_counts': dict(category_counts),
-        'risk_levels': dict(risk_levels),
-        'clean_files': risk_levels.get('CLEAN', 0),
-        'infected_files': total_files - risk_levels.get('CLEAN', 0)
+        'URL': result['url'],
+        'Filename': result['filename'],
+        'Risk Level': result['risk_level'],
+        'Risk Score': result['score'],
+        'Total Issues': len(result['findings']),
+        'Critical': sum(1 for f in result['findings'] if f['severity'] == 'critical'),
+        'High': sum(1 for f in result['findings'] if f['severity'] == 'high'),
+        'Medium': sum(1 for f in result['findings'] if f['severity'] == 'medium'),
     }
 
 def export_to_csv(results):
     """Export ผลเป็น CSV"""
-    data = []
+    return pd.DataFrame([csv_row(result) for result in results], columns=CSV_COLUMNS)
+
+def export_detailed_json(results, performance=None, clusters=None):
+    """Export รายละเอียดเป็น JSON พร้อมตารางเวลา (performance) และ cluster ของ content ซ้ำ"""
+    if performance is None or clusters is None:
+        stats = generate_summary_stats(results)
+        performance = stats['performance'] if performance is None else performance
+        clusters = stats['clusters'] if clusters is None else clusters
+    return ''.join(iter_detailed_json(results, performance, clusters))
+
+def iter_detailed_json(results, performance, clusters):
+    """ข้อความของรายงาน JSON ทีละส่วน (เหมือน json.dumps ทั้งก้อนด้วย indent=2)
     
+    results เป็น iterator ได้ จึงเขียนรายงานของเว็บไซต์ใหญ่โดยไม่โหลดผลทั้งหมดเข้าหน่วยความจำ
+    """
+    def dumps(value, level):
+        # newline ใน string ถูก escape เสมอ newline ที่เหลือจึงเป็นการขึ้นบรรทัดของ indent
+        text = json.dumps(value, indent=2, ensure_ascii=False, default=json_default)
+        return text.replace('\n', '\n' + '  ' * level)
+    
+    yield ('{\n  "performance": ' + dumps(performance, 1)
+           + ',\n  "clusters": ' + dumps(clusters, 1) + ',\n  "results": [')
+    separator = '\n    '
+    for result in results:
+        yield separator + dumps(result, 2)
+        separator = ',\n    '
+    yield (']' if separator == '\n    ' else '\n  ]') + '\n}'
+
+class StreamingReportWriter:
+    """เขียนรายงานทีละไฟล์ระหว่างสแกน: CSV หนึ่งแถว และ NDJSON หนึ่งบรรทัดต่อไฟล์
+    
+    flush ทุกครั้งที่เขียน ถ้าการสแกนถูกขัดจังหวะ ผลของไฟล์ที่สแกนแล้วจะยังอยู่ในรายงาน
+    และสะสมสถิติสรุปไว้ใน stats โดยไม่ต้องเก็บผลทั้งหมด
+    รายงาน JSON เต็มรูปแบบเขียนจาก NDJSON เมื่อสแกนจบแล้ว (write_json)
+    """
+    def __init__(self, output_dir, basename):
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        self.csv_path = output_dir / f'{basename}.csv'
+        self.ndjson_path = output_dir / f'{basename}.ndjson'
+        self.json_path = output_dir / f'{basename}.json'
+        self.stats = SummaryStats()
+        self._csv_file = open(self.csv_path, 'w', newline='', encoding='utf-8')
+        self._ndjson_file = open(self.ndjson_path, 'w', encoding='utf-8')
+        self._csv = csv.DictWriter(self._csv_file, fieldnames=CSV_COLUMNS)
+        self._csv.writeheader()
+        self._csv_file.flush()
+    
+    def write(self, result):
+        self._csv.writerow(csv_row(result))
+        self._ndjson_file.write(json.dumps(result, ensure_ascii=False, default=json_default) + '\n')
+        self._csv_file.flush()
+        self._ndjson_file.flush()
+        self.stats.add(result)
+    
+    def close(self):
+        self._csv_file.close()
+        self._ndjson_file.close()
+    
+    def write_json(self):
+        """เขียนรายงาน JSON (รูปแบบเดียวกับ export_detailed_json) จากผลใน NDJSON ทีละไฟล์"""
+        stats = self.stats.as_dict()
+        with open(self.json_path, 'w', encoding='utf-8') as f:
+            f.writelines(iter_detailed_json(read_ndjson_results(self.ndjson_path),
+                                            stats['performance'], stats['clusters']))
+        return self.json_path
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
+RISK_LEVELS = ['CRITICAL', 'HIGH', 'MEDIUM', 'LOW', 'CLEAN', 'ERROR']
+RESULT_COLUMNS = ['Risk Level', 'Risk Score', 'Filename', 'Issues', 'Critical', 'High', 'Medium',
+                  'Categories', 'URL', 'Hash', 'Error']
+
+def results_frame(results):
+    """DataFrame เดียวของผลทุกไฟล์ (หนึ่งแถวต่อไฟล์) เรียงตาม risk score
+    
+    index ของแถวคือตำแหน่งใน results ใช้เปิดดู finding ของไฟล์ที่เลือกได้
+    """
+    rows = []
     for result in results:
-        data.append({
-            'URL': result['url'],
-            'Filename': result['filename'],
-            'Risk Level': result['risk_level'],
-            'Risk Score': result['score'],
-            'Total Issues': len(result['findings']),
-            'Critical': sum(1 for f in result['findings'] if f['severity'] == 'critical'),
-            'High': sum(1 for f in result['findings'] if f['severity'] == 'high'),
-            'Medium': sum(1 for f in result['findings'] if f['severity'] == 'medium'),
-        })
-    
-    df = pd.DataFrame(data)
-    return df
-
-def export_detailed_json(results):
-    """Export รายละเอียดเป็น JSON"""
-    return json.dumps(results, indent=2, ensure_ascii=False)
+        severities = [finding['severity'] for finding in result['findings']]
+        rows.append((
+            result['risk_level'], result['score'], result['filename'], len(severities),
+            severities.count('critical'), severities.count('high'), severities.count('medium'),
+            ', '.join(sorted({finding['category'] for finding in result['findings'] if 'category' in finding})),
+            result['url'], result.get('hash', ''), result.get('error', '')
+        ))
+    frame = pd.DataFrame(rows, columns=RESULT_COLUMNS)
+    return frame.sort_values('Risk Score', ascending=False, kind='stable')
+
+def filter_results_frame(frame, risk_levels=None, categories=None, url_text=''):
+    """กรองแถวของ results_frame ด้วย risk level, category (มีอย่างน้อยหนึ่งอย่าง) และข้อความใน URL"""
+    mask = pd.Series(True, index=frame.index)
+    if risk_levels is not None:
+        mask &= frame['Risk Level'].isin(risk_levels)
+    if categories:
+        pattern = f"(?:^|, )(?:{'|'.join(map(re.escape, categories))})(?:,|$)"
+        mask &= frame['Categories'].str.contains(pattern, regex=True)
+    if url_text:
+        mask &= frame['URL'].str.contains(url_text, case=False, regex=False)
+    return frame[mask]
+
+def page_count(frame, page_size):
+    """จำนวนหน้าของตาราง (อย่างน้อย 1 หน้า)"""
+    return max(1, (len(frame) + page_size - 1) // page_size)
+
+def page_rows(frame, page, page_size):
+    """แถวของหน้า page (เริ่มที่ 1) ของตาราง"""
+    return frame.iloc[(page - 1) * page_size:page * page_size]
+
+def read_ndjson_results(path):
+    """อ่านผลจากรายงาน NDJSON ทีละไฟล์ (ไม่โหลดทั้งรายงานเข้าหน่วยความจำ)"""
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def report_basename(source, label=None):
+    """ชื่อไฟล์รายงาน (ไม่รวมนามสกุล) label ใช้แทน hostname สำหรับการสแกนไฟล์ local"""
+    label = label or urlparse(source).netloc
+    return f"malware_scan_{label}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
 
 # ========== UI ==========
 
-def display_finding_summary(result):
-    """แสดงสรุปแต่ละไฟล์"""
-    score = result['score']
-    risk_level, emoji = get_risk_level(score)
+def display_performance(performance):
+    """แสดงเวลาต่อ phase และตาราง rule / host / ไฟล์ที่ช้าที่สุด"""
+    with st.expander("⏱️ Performance (slowest rules, hosts and files)"):
+        if performance['phases']:
+            phase_data = pd.DataFrame(
+                list(performance['phases'].items()),
+                columns=['Phase', 'Seconds']
+            ).sort_values('Seconds', ascending=False)
+            st.bar_chart(phase_data.set_index('Phase'))
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            st.markdown("**🐢 Slowest Rules**")
+            st.dataframe(pd.DataFrame(performance['slowest_rules'],
+                                      columns=['rule', 'seconds', 'matches', 'files', 'ms_per_file']),
+                         hide_index=True,
+                         use_container_width=True)
+        with col2:
+            st.markdown("**🌐 Slowest Hosts** (request + transfer)")
+            st.dataframe(pd.DataFrame(performance['slowest_hosts'],
+                                      columns=['host', 'seconds', 'files', 'avg_seconds']),
+                         hide_index=True,
+                         use_container_width=True)
+        
+        st.markdown("**📄 Slowest Files**")
+        st.dataframe(pd.DataFrame(performance['slowest_files'], columns=['url', 'seconds']),
+                     hide_index=True,
+                     use_container_width=True)
+
+RESULTS_PAGE_SIZES = [25, 50, 100, 250]
+LAST_SCAN_KEY = 'last_scan'
+# key ใน st.session_state ของตัวกรองและหน้าของตารางผล (ล้างเมื่อมีผลสแกนใหม่)
+RESULTS_WIDGET_KEYS = ('results_risk_levels', 'results_categories', 'results_url', 'results_page_size',
+                       'results_page', 'results_filters')
+RISK_EMOJI = {'CRITICAL': '🔴', 'HIGH': '🟠', 'MEDIUM': '🟡', 'LOW': '🟢', 'CLEAN': '✅', 'ERROR': '❌'}
+FINDING_COLUMNS = ['line', 'severity', 'type', 'category', 'function', 'description', 'code']
+
+@st.fragment
+def display_results_table(frame, results, categories, show_clean=False):
+    """ตารางผลแบบแบ่งหน้าจาก DataFrame เดียว กรองฝั่ง server แล้วส่งไปเฉพาะหน้าที่แสดง
     
-    col1, col2, col3, col4 = st.columns([3, 1, 1, 1])
+    เป็น fragment: เปลี่ยนตัวกรองหรือหน้าแล้ว rerun เฉพาะส่วนนี้ เวลา render จึงขึ้นกับขนาดหน้า
+    ไม่ขึ้นกับจำนวนไฟล์ทั้งหมด ตัวกรองและหน้าอยู่ใน st.session_state จึงคงอยู่เมื่อทั้งหน้า rerun
+    """
+    counts = frame['Risk Level'].value_counts()
+    levels = [level for level in RISK_LEVELS if counts.get(level)]
     
+    col1, col2, col3 = st.columns([2, 2, 3])
     with col1:
-        st.markdown(f"**{result['filename']}**")
-        st.caption(f"🔗 {result['url']}")
+        risk_levels = st.multiselect(
+            "Risk level", levels,
+            default=[level for level in levels if level != 'CLEAN' or show_clean],
+            format_func=lambda level: f"{RISK_EMOJI[level]} {level} ({counts[level]})",
+            key='results_risk_levels'
+        )
     with col2:
-        if risk_level == 'CRITICAL':
-            st.error(f"{emoji} {risk_level}")
-        elif risk_level == 'HIGH':
-            st.warning(f"{emoji} {risk_level}")
-        elif risk_level == 'MEDIUM':
-            st.info(f"{emoji} {risk_level}")
-        else:
-            st.success(f"{emoji} {risk_level}")
+        selected_categories = st.multiselect("Category", categories, key='results_categories')
+    with col3:
+        url_text = st.text_input("URL contains", value="", key='results_url')
+    
+    filtered = filter_results_frame(frame, risk_levels, selected_categories, url_text.strip())
+    
+    col1, col2, col3 = st.columns([1, 1, 3])
+    with col1:
+        # แสดงเสมอแม้ไม่มีผลตรงตัวกรอง widget ที่ไม่ถูก render จะถูกล้างค่าใน session_state
+        page_size = st.selectbox("Rows per page", RESULTS_PAGE_SIZES, index=1, key='results_page_size')
+    if filtered.empty:
+        st.info("No files match the filters")
+        return
+    pages = page_count(filtered, page_size)
+    # เปลี่ยนตัวกรองแล้วกลับไปหน้าแรก ไม่ค้างที่หน้าที่เกินจำนวนหน้าใหม่
+    filters = (tuple(risk_levels), tuple(selected_categories), url_text, page_size)
+    if st.session_state.get('results_filters') != filters:
+        st.session_state['results_filters'] = filters
+        st.session_state['results_page'] = 1
+    with col2:
+        page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, key='results_page')
+    with col3:
+        st.caption(f"Showing {len(filtered)} of {len(frame)} files")
+    
+    page_frame = page_rows(filtered, page, page_size)
+    st.dataframe(page_frame, hide_index=True, use_container_width=True,
+                 column_config={'URL': st.column_config.TextColumn(width='large'),
+                                'Risk Score': st.column_config.ProgressColumn(min_value=0, max_value=100,
+                                                                              format='%d')})
+    
+    selected = st.selectbox(
+        "Show findings for", page_frame.index,
+        format_func=lambda row: f"{RISK_EMOJI.get(frame.at[row, 'Risk Level'], '')} "
+                                f"{frame.at[row, 'Filename']} - {frame.at[row, 'URL']}"
+    )
+    display_findings(results[selected])
+
+def display_findings(result):
+    """แสดง finding ของไฟล์หนึ่งเป็นตารางเดียว"""
+    st.caption(f"🔗 {result['url']}")
+    st.caption(f"🔑 Hash: {result.get('hash', 'N/A')}")
+    if result['status'] == 'failed':
+        st.error(f"Error: {result.get('error', 'Unknown error')}")
+    elif result['findings']:
+        st.dataframe(pd.DataFrame([dict(finding) for finding in result['findings']],
+                                  columns=FINDING_COLUMNS),
+                     hide_index=True, use_container_width=True)
+    else:
+        st.success("✅ No issues found")
+
+CLUSTER_DISPLAY_LIMIT = 20   # cluster ที่แสดงรายชื่อสมาชิกแบบ expander (ตารางแสดงครบทุก cluster)
+
+def display_clusters(clusters, duplicate_files):
+    """แสดง cluster ของ content ซ้ำ: หนึ่งแถวต่อ cluster แทนหนึ่งแถวต่อไฟล์"""
+    if not clusters:
+        return
+    st.divider()
+    st.subheader("🧩 Duplicate Content Clusters")
+    members = sum(cluster['members'] for cluster in clusters)
+    st.caption(f"{members} infected files in {len(clusters)} clusters "
+               f"({duplicate_files} byte-identical copies)")
+    st.dataframe(export_clusters_csv(clusters), hide_index=True, use_container_width=True)
+    
+    for cluster in clusters[:CLUSTER_DISPLAY_LIMIT]:
+        risk_level, emoji = get_risk_level(cluster['score'])
+        with st.expander(f"{emoji} {cluster['filename']} - {cluster['members']} files on "
+                         f"{cluster['sites']} site(s), {cluster['variants']} variant(s)"):
+            st.caption(f"🧬 Signature: {cluster['signature']} | Findings: {', '.join(cluster['findings'])}")
+            for url in cluster['urls']:
+                st.caption(f"🔗 {url}")
+            if cluster['members'] > len(cluster['urls']):
+                st.caption(f"... and {cluster['members'] - len(cluster['urls'])} more")
+
+def display_profile(profiler, report_name):
+    """แสดงผล cProfile และปุ่มดาวน์โหลดไฟล์ .prof"""
+    summary = profiler.top()
+    if not summary:
+        return
+    with st.expander("🧪 cProfile (top functions by cumulative time)"):
+        st.code(summary, language=None)
+        path = profiler.dump(CACHE_DIR / 'profiles' / f'{report_name}.prof')
+        st.download_button(
+            "📥 Download .prof",
+            data=Path(path).read_bytes(),
+            file_name=f"{report_name}.prof",
+            mime="application/octet-stream"
+        )
+
+def display_results(results, report_name, show_clean=False, crawl_timings=None):
+    """แสดงสถิติ ปุ่ม export และรายละเอียดผลสแกน"""
+    st.divider()
+    st.subheader("📊 Scan Results")
+    
+    # สถิติ
+    stats = generate_summary_stats(results, crawl_timings)
+    
+    col1, col2, col3, col4, col5 = st.columns(5)
+    with col1:
+        st.metric("Total Files", stats['total_files'])
+    with col2:
+        st.metric("Clean Files", stats['clean_files'], delta="Good" if stats['clean_files'] > 0 else None)
     with col3:
-        st.metric("Score", f"{score}/100")
+        st.metric("Infected Files", stats['infected_files'], delta="Bad" if stats['infected_files'] > 0 else None)
     with col4:
-        st.metric("Issues", len(result['findings']))
+        st.metric("Total Issues", stats['total_issues'])
+    with col5:
+        infection_rate = (stats['infected_files'] / stats['total_files'] * 100) if stats['total_files'] > 0 else 0
+        st.metric("Infection Rate", f"{infection_rate:.1f}%")
+    
+    # Severity breakdown
+    st.divider()
+    st.subheader("⚠️ Severity Breakdown")
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        critical = stats['severity_counts'].get('critical', 0)
+        st.metric("🔴 Critical", critical)
+    with col2:
+        high = stats['severity_counts'].get('high', 0)
+        st.metric("🟠 High", high)
+    with col3:
+        medium = stats['severity_counts'].get('medium', 0)
+        st.metric("🟡 Medium", medium)
+    
+    # Category breakdown
+    if stats['category_counts']:
+        st.divider()
+        st.subheader("📈 Threat Categories")
+        
+        category_data = pd.DataFrame(
+            list(stats['category_counts'].items()),
+            columns=['Category', 'Count']
+        ).sort_values('Count', ascending=False)
+        
+        st.bar_chart(category_data.set_index('Category'))
+    
+    display_clusters(stats['clusters'], stats['duplicate_files'])
+    
+    display_performance(stats['performance'])
+    
+    # Export
+    st.divider()
+    st.subheader("💾 Export Results")
+    
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        # CSV Export
+        csv_df = export_to_csv(results)
+        csv_data = csv_df.to_csv(index=False)
+        
+        st.download_button(
+            "📥 Download CSV Report",
+            data=csv_data,
+            file_name=f"{report_name}.csv",
+            mime="text/csv",
+            use_container_width=True
+        )
+    
+    with col2:
+        # JSON Export
+        json_data = export_detailed_json(results, stats['performance'], stats['clusters'])
+        
+        st.download_button(
+            "📥 Download JSON Report",
+            data=json_data,
+            file_name=f"{report_name}.json",
+            mime="application/json",
+            use_container_width=True
+        )
+    
+    with col3:
+        # Cluster Export
+        st.download_button(
+            "📥 Download Clusters CSV",
+            data=export_clusters_csv(stats['clusters']).to_csv(index=False),
+            file_name=f"{report_name}_clusters.csv",
+            mime="text/csv",
+            use_container_width=True
+        )
+    
+    # Detailed Results
+    st.divider()
+    st.subheader("📋 Detailed Scan Results")
+    display_results_table(results_frame(results), results, sorted(stats['category_counts']),
+                          show_clean=show_clean)
+
+def remember_scan(source, results, report_name, crawl_timings=None):
+    """เก็บผลสแกนล่าสุดใน st.session_state แล้วล้างตัวกรอง/หน้าของผลเดิม"""
+    for key in RESULTS_WIDGET_KEYS:
+        st.session_state.pop(key, None)
+    st.session_state[LAST_SCAN_KEY] = {
+        'source': source,
+        'results': results,
+        'report_name': report_name,
+        'crawl_timings': crawl_timings,
+    }
+
+def display_last_scan(source, show_clean=False):
+    """แสดงผลสแกนล่าสุดของ source นี้ซ้ำเมื่อทั้งหน้า rerun (เช่นกดปุ่มดาวน์โหลดหรือเปลี่ยนค่าใน sidebar)"""
+    scan = st.session_state.get(LAST_SCAN_KEY)
+    if scan and scan['source'] == source:
+        display_results(scan['results'], scan['report_name'], show_clean=show_clean,
+                        crawl_timings=scan['crawl_timings'])
 
 def main():
     st.title("🌐 PHP Website Malware Scanner")
@@ -433,84 +4257,294 @@ def main():
     # Sidebar
     st.sidebar.header("⚙️ Scanner Settings")
     
-    # Website URL
-    website_url = st.sidebar.text_input(
-        "🌐 Website URL:",
-        placeholder="https://example.com",
-        help="Enter the website URL to scan"
+    scan_source = st.sidebar.radio(
+        "📦 Scan Source:",
+        SCAN_SOURCES,
+        help="Scan a live website, an uploaded ZIP backup, or a directory on this server"
     )
     
-    st.sidebar.divider()
-    
-    st.sidebar.subheader("🔍 Crawling Options")
-    
-    crawler_method = st.sidebar.radio(
-        "Scanning Method:",
-        ["Auto Crawl", "Sitemap Only", "Common Paths", "Full Scan (All Methods)"]
-    )
+    website_url = ''
+    zip_file = None
+    local_dir = ''
+    all_files = False
+    max_depth = 2
+    max_pages = 50
+    parallel_crawl = False
+    crawler_method = CRAWL_METHODS[0]
+    wordlist_file = None
     
-    if crawler_method in ["Auto Crawl", "Full Scan (All Methods)"]:
-        max_depth = st.sidebar.slider("Max Crawl Depth:", 1, 5, 3)
-        max_pages = st.sidebar.slider("Max Pages to Visit:", 10, 500, 100)
+    if scan_source == "Website URL":
+        # Website URL
+        website_url = st.sidebar.text_input(
+            "🌐 Website URL:",
+            placeholder="https://example.com",
+            help="Enter the website URL to scan"
+        )
+        
+        st.sidebar.divider()
+        
+        st.sidebar.subheader("🔍 Crawling Options")
+        
+        crawler_method = st.sidebar.radio(
+            "Scanning Method:",
+            CRAWL_METHODS
+        )
+        
+        if crawler_method in ["Auto Crawl", "Full Scan (All Methods)"]:
+            max_depth = st.sidebar.slider("Max Crawl Depth:", 1, 5, 3)
+            max_pages = st.sidebar.slider("Max Pages to Visit:", 10, 500, 100)
+            parallel_crawl = st.sidebar.checkbox(
+                "Parallel breadth-first crawl",
+                value=True,
+                help="Crawl level by level using the concurrent request workers"
+            )
+        
+        if crawler_method in ["Common Paths", "Full Scan (All Methods)"]:
+            wordlist_file = st.sidebar.file_uploader(
+                "Custom Path Wordlist:",
+                type=['txt'],
+                help="One path per line; replaces the built-in common paths list"
+            )
+        
+        st.sidebar.divider()
+        
     else:
-        max_depth = 2
-        max_pages = 50
-    
-    st.sidebar.divider()
+        if scan_source == "ZIP Archive":
+            zip_file = st.sidebar.file_uploader(
+                "📦 ZIP Archive:",
+                type=['zip'],
+                help="Site backup to scan; members are read in memory without extracting"
+            )
+        else:
+            local_dir = st.sidebar.text_input(
+                "📁 Directory Path:",
+                placeholder="/var/www/html",
+                help="Directory on the machine running the scanner"
+            )
+        all_files = st.sidebar.checkbox(
+            "Scan all file types",
+            value=False,
+            help="By default only PHP extensions (" + ", ".join(PHP_EXTENSIONS) + ") are scanned"
+        )
+        
+        st.sidebar.divider()
     
     st.sidebar.subheader("⚡ Performance")
     timeout = st.sidebar.slider("Request Timeout (sec):", 5, 30, 10)
-    delay = st.sidebar.slider("Delay Between Requests (sec):", 0.0, 2.0, 0.5, 0.1)
+    delay = st.sidebar.slider(
+        "Delay Between Requests (sec):", 0.0, 2.0, 0.5, 0.1,
+        help="Minimum gap between requests to the same host"
+    )
+    max_workers = st.sidebar.slider("Concurrent Requests:", 1, 16, 4)
+    processes = st.sidebar.slider(
+        "Worker Processes:", 1, max(os.cpu_count() or 1, 2), os.cpu_count() or 1,
+        help="Processes used to scan ZIP archives and server directories"
+    )
+    max_file_mb = st.sidebar.slider(
+        "Max File Size (MB):", 1, 100, 10,
+        help="Files are streamed and scanned up to this size; larger files are scanned partially"
+    )
     
     st.sidebar.divider()
     
     show_clean = st.sidebar.checkbox("Show clean files", value=False)
+    cross_line = st.sidebar.checkbox(
+        "Detect multi-line patterns",
+        value=False,
+        help="Allow suspicious patterns to match across line breaks (e.g. eval( and base64_decode on separate lines)"
+    )
+    use_cache = st.sidebar.checkbox(
+        "Reuse cached results for unchanged files",
+        value=True,
+        help="Files whose content hash was already scanned with the same rules are not rescanned"
+    )
+    use_http_cache = st.sidebar.checkbox(
+        "Revalidate unchanged URLs (ETag / Last-Modified)",
+        value=True,
+        help="Send conditional requests and reuse stored links and findings on 304 Not Modified"
+    )
+    write_reports = st.sidebar.checkbox(
+        "Write reports while scanning",
+        value=False,
+        help="Append a CSV row and an NDJSON line per file as soon as it is scanned, so an interrupted scan keeps its partial results"
+    )
+    report_dir = st.sidebar.text_input("Report Directory:", value="reports") if write_reports else None
+    profile_scan = scan_source == "Website URL" and st.sidebar.checkbox(
+        "Profile scan (cProfile)",
+        value=False,
+        help="Profile the file scanning workers and offer the merged .prof dump for pstats/snakeviz"
+    )
+    st.sidebar.divider()
+    
+    st.sidebar.subheader("📚 Rule Packs")
+    rule_pack_text = st.sidebar.text_area(
+        "Rule pack files (one path per line):",
+        value="",
+        help="JSON or YAML files with extra functions, patterns, YARA-like rules and backdoor file names. "
+             "Edited files are reloaded automatically on the next run"
+    )
+    try:
+        rules = activate_rule_packs(parse_rule_pack_paths(rule_pack_text))
+    except RulePackError as e:
+        st.sidebar.error(f"❌ {e}")
+        st.error("❌ Fix or remove the rule pack in the sidebar to continue")
+        st.stop()
+    if rules.sources:
+        st.sidebar.caption(f"{rules.rule_count} rules active from {len(rules.sources)} pack(s) "
+                           f"+ built-in (ruleset {rules.version})")
+    
+    st.sidebar.subheader("🧬 Webshell Samples")
+    webshell_sample_text = st.sidebar.text_area(
+        "Sample directories or index files (one path per line):",
+        value="",
+        help="Known webshells (c99, r57, wso, b374k, ...) grouped in one sub-directory per family, "
+             "or .json signature indexes. Scanned files similar to a sample are reported with its family"
+    )
+    try:
+        index = activate_webshell_index(parse_rule_pack_paths(webshell_sample_text))
+    except WebshellIndexError as e:
+        st.sidebar.error(f"❌ {e}")
+        st.error("❌ Fix or remove the webshell sample path in the sidebar to continue")
+        st.stop()
+    if index.sources:
+        st.sidebar.caption(f"{len(index.samples)} samples from {len(index.families)} families "
+                           f"(index {index.version or 'empty'})")
+    
+    if st.sidebar.button("🗑️ Clear Scan Cache"):
+        for store in (ScanCache(), HttpCache()):
+            store.clear()
+            store.close()
+        st.sidebar.success("Scan cache cleared")
     
     # Main Content
-    if website_url:
-        if st.button("🚀 Start Website Scan", type="primary", use_container_width=True):
+    if scan_source != "Website URL":
+        if zip_file is None and not local_dir:
+            st.info("👈 Upload a ZIP archive or enter a directory path in the sidebar to start scanning")
+        elif not st.button("🚀 Start Local Scan", type="primary", use_container_width=True):
+            display_last_scan(scan_source, show_clean=show_clean)
+        else:
+            max_bytes = max_file_mb * 1024 * 1024
+            
+            if zip_file is not None:
+                archive = zipfile.ZipFile(zip_file)
+                members = list_zip_members(archive, all_files)
+                locations = [f"{zip_file.name}:{info.filename}" for info in members]
+                tasks = iter_zip_tasks(archive, members, zip_file.name, max_bytes)
+                report_name = report_basename(zip_file.name, f"zip_{Path(zip_file.name).stem}")
+            elif os.path.isdir(local_dir):
+                archive = None
+                locations = list_directory_files(local_dir, all_files)
+                tasks = ((path, None) for path in locations)
+                report_name = report_basename(local_dir, f"dir_{Path(os.path.abspath(local_dir)).name or 'root'}")
+            else:
+                st.error(f"❌ Directory not found: {local_dir}")
+                return
+            
+            if not locations:
+                st.warning("⚠️ No files to scan!")
+                return
+            
+            st.subheader(f"🔍 Scanning {len(locations)} Files")
+            
+            # เก็บตามลำดับเดิมของรายการไฟล์ แม้จะเสร็จไม่เรียงกัน
+            order = defaultdict(deque)
+            for i, location in enumerate(locations):
+                order[location].append(i)
+            results = [None] * len(locations)
+            
+            scan_progress = st.progress(0)
+            scan_status = st.empty()
+            
+            writer = StreamingReportWriter(report_dir, report_name) if write_reports else None
+            
+            completed = 0
+            try:
+                for result in scan_local_files(tasks, cross_line=cross_line, max_bytes=max_bytes,
+                                               processes=processes, use_cache=use_cache):
+                    results[order[result['url']].popleft()] = result
+                    if writer is not None:
+                        writer.write(result)
+                    completed += 1
+                    scan_status.info(f"🔍 Scanned: {result['url'][-60:]} ({completed}/{len(locations)})")
+                    scan_progress.progress(completed / len(locations))
+            finally:
+                if archive is not None:
+                    archive.close()
+                if writer is not None:
+                    writer.close()
+            
+            scan_status.empty()
+            scan_progress.empty()
+            
+            if writer is not None:
+                st.info(f"💾 Reports written to `{writer.csv_path}` and `{writer.ndjson_path}`")
+            
+            remember_scan(scan_source, results, report_name)
+            display_results(results, report_name, show_clean=show_clean)
+    
+    elif website_url:
+        checkpoints = CheckpointStore()
+        scan_key = checkpoint_key(website_url, crawler_method)
+        saved = checkpoints.summary(scan_key)
+        if saved:
+            st.info(f"⏸️ Unfinished scan saved at {saved['updated_at']}: "
+                    f"{saved['visited']} pages visited, {saved['scanned']}/{saved['php_files']} "
+                    f"PHP files scanned ({'crawling' if saved['phase'] == 'crawl' else 'scanning'})")
+        
+        start = st.button("🚀 Start Website Scan", type="primary", use_container_width=True)
+        resume = bool(saved) and st.button("▶️ Resume Scan", use_container_width=True)
+        if not (start or resume):
+            checkpoints.close()
+            display_last_scan(scan_source, show_clean=show_clean)
+        else:
+            state = checkpoints.load(scan_key) if resume else None
+            if not resume:
+                checkpoints.clear(scan_key)
             
             # Phase 1: Crawling
             st.subheader("🕷️ Phase 1: Website Crawling")
             
+            http_cache = HttpCache() if use_http_cache else None
             crawler = WebsiteCrawler(
                 website_url, 
                 max_depth=max_depth, 
                 max_pages=max_pages,
-                timeout=timeout
+                timeout=timeout,
+                http_cache=http_cache
             )
             
             crawl_status = st.empty()
             crawl_progress = st.progress(0)
             
-            php_files_found = set()
-            
             def update_progress(url, visited, php_count):
                 crawl_status.info(f"🔍 Crawling: {url[:60]}... | Visited: {visited} | PHP files: {php_count}")
             
-            # Crawl ตาม method ที่เลือก
-            if crawler_method in ["Auto Crawl", "Full Scan (All Methods)"]:
-                st.info("🕷️ Auto crawling website...")
-                crawler.crawl(progress_callback=update_progress)
-                php_files_found.update(crawler.php_files)
-            
-            if crawler_method in ["Sitemap Only", "Full Scan (All Methods)"]:
-                st.info("🗺️ Checking sitemap...")
-                sitemap_files = crawler.try_sitemap()
-                php_files_found.update(sitemap_files)
-                st.success(f"✅ Found {len(sitemap_files)} PHP files from sitemap")
+            wordlist_paths = None
+            if wordlist_file is not None:
+                wordlist_paths = parse_wordlist(wordlist_file.getvalue().decode('utf-8', errors='ignore'))
             
-            if crawler_method in ["Common Paths", "Full Scan (All Methods)"]:
-                st.info("📁 Checking common paths...")
-                common_files = crawler.try_common_paths()
-                php_files_found.update(common_files)
-                st.success(f"✅ Found {len(common_files)} files from common paths")
+            if state and state['phase'] == 'scan':
+                # รายการไฟล์ครบแล้วใน checkpoint ข้ามไป Phase 2 ได้เลย
+                php_files_list = state['php_files']
+                st.info(f"▶️ Resuming from checkpoint with {len(php_files_list)} PHP files")
+            else:
+                # Crawl ตาม method ที่เลือก (บันทึก frontier เป็นระยะ)
+                php_files_list = discover_php_files(
+                    crawler,
+                    crawler_method,
+                    parallel_crawl=parallel_crawl,
+                    max_workers=max_workers,
+                    wordlist_paths=wordlist_paths,
+                    progress_callback=update_progress,
+                    notify=lambda level, message: getattr(st, level)(message),
+                    crawl_state=state,
+                    checkpoint=lambda crawl: checkpoints.save_crawl(scan_key, 'crawl', **crawl)
+                )
+                checkpoints.save_crawl(scan_key, 'scan', [], crawler.visited_urls, php_files_list)
             
             crawl_status.empty()
             crawl_progress.empty()
             
-            php_files_list = list(php_files_found)
-            
             if not php_files_list:
                 st.warning("⚠️ No PHP files found on this website!")
                 st.info("""
@@ -520,6 +4554,10 @@ def main():
                 - Crawler couldn't access them
                 - Try different scanning method
                 """)
+                if http_cache is not None:
+                    http_cache.close()
+                checkpoints.clear(scan_key)
+                checkpoints.close()
                 return
             
             st.success(f"✅ Crawling completed! Found **{len(php_files_list)}** PHP files")
@@ -535,206 +4573,65 @@ def main():
             st.subheader("🔍 Phase 2: Malware Scanning")
             
             total_files = len(php_files_list)
-            results = []
+            results = [None] * total_files
             
             scan_progress = st.progress(0)
             scan_status = st.empty()
             
-            for i, url in enumerate(php_files_list):
-                scan_status.info(f"🔍 Scanning: {url[:60]}... ({i+1}/{total_files})")
-                
-                try:
-                    content, status_code = fetch_url_content(url, timeout=timeout)
-                    filename = urlparse(url).path.split('/')[-1] or 'index.php'
-                    
-                    findings = scan_file(content, filename)
-                    score = calculate_risk_score(findings)
-                    risk_level, emoji = get_risk_level(score)
-                    
-                    results.append({
-                        'url': url,
-                        'filename': filename,
-                        'findings': findings,
-                        'score': score,
-                        'risk_level': risk_level,
-                        'status': 'success',
-                        'hash': calculate_file_hash(content)
-                    })
-                    
-                except Exception as e:
-                    results.append({
-                        'url': url,
-                        'filename': urlparse(url).path.split('/')[-1] or 'unknown',
-                        'findings': [],
-                        'score': 0,
-                        'risk_level': 'ERROR',
-                        'status': 'failed',
-                        'error': str(e)
-                    })
-                
-                scan_progress.progress((i + 1) / total_files)
-                
-                if delay > 0 and i < total_files - 1:
-                    time.sleep(delay)
+            cache = ScanCache() if use_cache else None
+            report_name = report_basename(website_url)
+            writer = StreamingReportWriter(report_dir, report_name) if write_reports else None
+            profiler = ScanProfiler() if profile_scan else None
+            
+            completed = 0
+            try:
+                for i, result in scan_urls_resumable(
+                    php_files_list,
+                    checkpoints,
+                    scan_key,
+                    timeout=timeout,
+                    delay=delay,
+                    max_workers=max_workers,
+                    cross_line=cross_line,
+                    max_bytes=max_file_mb * 1024 * 1024,
+                    cache=cache,
+                    http_cache=http_cache,
+                    profiler=profiler
+                ):
+                    # เก็บตามลำดับเดิมของรายการไฟล์ แม้จะเสร็จไม่เรียงกัน
+                    results[i] = result
+                    if writer is not None:
+                        writer.write(result)
+                    completed += 1
+                    scan_status.info(f"🔍 Scanned: {result['url'][:60]}... ({completed}/{total_files})")
+                    scan_progress.progress(completed / total_files)
+                checkpoints.clear(scan_key)
+            finally:
+                if cache is not None:
+                    cache.close()
+                if http_cache is not None:
+                    http_cache.close()
+                if writer is not None:
+                    writer.close()
+                checkpoints.close()
             
             scan_status.empty()
             scan_progress.empty()
             
-            # Phase 3: Results
-            st.divider()
-            st.subheader("📊 Scan Results")
-            
-            # สถิติ
-            stats = generate_summary_stats(results)
-            
-            col1, col2, col3, col4, col5 = st.columns(5)
-            with col1:
-                st.metric("Total Files", stats['total_files'])
-            with col2:
-                st.metric("Clean Files", stats['clean_files'], delta="Good" if stats['clean_files'] > 0 else None)
-            with col3:
-                st.metric("Infected Files", stats['infected_files'], delta="Bad" if stats['infected_files'] > 0 else None)
-            with col4:
-                st.metric("Total Issues", stats['total_issues'])
-            with col5:
-                infection_rate = (stats['infected_files'] / stats['total_files'] * 100) if stats['total_files'] > 0 else 0
-                st.metric("Infection Rate", f"{infection_rate:.1f}%")
-            
-            # Severity breakdown
-            st.divider()
-            st.subheader("⚠️ Severity Breakdown")
-            
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                critical = stats['severity_counts'].get('critical', 0)
-                st.metric("🔴 Critical", critical)
-            with col2:
-                high = stats['severity_counts'].get('high', 0)
-                st.metric("🟠 High", high)
-            with col3:
-                medium = stats['severity_counts'].get('medium', 0)
-                st.metric("🟡 Medium", medium)
-            
-            # Category breakdown
-            if stats['category_counts']:
-                st.divider()
-                st.subheader("📈 Threat Categories")
-                
-                category_data = pd.DataFrame(
-                    list(stats['category_counts'].items()),
-                    columns=['Category', 'Count']
-                ).sort_values('Count', ascending=False)
-                
-                st.bar_chart(category_data.set_index('Category'))
-            
-            # Export
-            st.divider()
-            st.subheader("💾 Export Results")
-            
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                # CSV Export
-                csv_df = export_to_csv(results)
-                csv = csv_df.to_csv(index=False)
-                
-                st.download_button(
-                    "📥 Download CSV Report",
-                    data=csv,
-                    file_name=f"malware_scan_{urlparse(website_url).netloc}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                    mime="text/csv",
-                    use_container_width=True
-                )
+            if cache is not None and cache.hits:
+                st.info(f"♻️ Reused cached results for {cache.hits} unchanged files")
+            if http_cache is not None and http_cache.not_modified:
+                st.info(f"♻️ {http_cache.not_modified} URLs were not modified since the last scan")
             
-            with col2:
-                # JSON Export
-                json_data = export_detailed_json(results)
-                
-                st.download_button(
-                    "📥 Download JSON Report",
-                    data=json_data,
-                    file_name=f"malware_scan_{urlparse(website_url).netloc}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
-                    mime="application/json",
-                    use_container_width=True
-                )
+            # Phase 3: Results
+            if writer is not None:
+                st.info(f"💾 Reports written to `{writer.csv_path}` and `{writer.ndjson_path}`")
             
-            # Detailed Results
-            st.divider()
-            st.subheader("📋 Detailed Scan Results")
-            
-            # แสดงผลเรียงตาม risk score
-            results_sorted = sorted(results, key=lambda x: x['score'], reverse=True)
-            
-            # แยกตาม risk level
-            critical_files = [r for r in results_sorted if r['risk_level'] == 'CRITICAL']
-            high_files = [r for r in results_sorted if r['risk_level'] == 'HIGH']
-            medium_files = [r for r in results_sorted if r['risk_level'] == 'MEDIUM']
-            low_files = [r for r in results_sorted if r['risk_level'] == 'LOW']
-            clean_files = [r for r in results_sorted if r['risk_level'] == 'CLEAN']
-            error_files = [r for r in results_sorted if r['status'] == 'failed']
-            
-            # Critical Files
-            if critical_files:
-                st.error(f"🔴 CRITICAL RISK FILES ({len(critical_files)})")
-                for result in critical_files:
-                    with st.expander(f"🔴 {result['filename']} - Score: {result['score']}/100"):
-                        st.caption(f"🔗 {result['url']}")
-                        st.caption(f"🔑 Hash: {result.get('hash', 'N/A')}")
-                        
-                        for finding in result['findings']:
-                            st.markdown(f"""
-                            **Line {finding['line']}**: {finding['description']}
-                            ```php
-                            {finding['code']}
-                            ```
-                            """)
-            
-            # High Risk Files
-            if high_files:
-                st.warning(f"🟠 HIGH RISK FILES ({len(high_files)})")
-                for result in high_files:
-                    with st.expander(f"🟠 {result['filename']} - Score: {result['score']}/100"):
-                        st.caption(f"🔗 {result['url']}")
-                        st.caption(f"🔑 Hash: {result.get('hash', 'N/A')}")
-                        
-                        for finding in result['findings']:
-                            st.markdown(f"""
-                            **Line {finding['line']}**: {finding['description']}
-                            ```php
-                            {finding['code']}
-                            ```
-                            """)
-            
-            # Medium Risk Files
-            if medium_files:
-                with st.expander(f"🟡 MEDIUM RISK FILES ({len(medium_files)})"):
-                    for result in medium_files:
-                        display_finding_summary(result)
-                        st.divider()
-            
-            # Low Risk Files
-            if low_files:
-                with st.expander(f"🟢 LOW RISK FILES ({len(low_files)})"):
-                    for result in low_files:
-                        display_finding_summary(result)
-                        st.divider()
-            
-            # Clean Files
-            if show_clean and clean_files:
-                with st.expander(f"✅ CLEAN FILES ({len(clean_files)})"):
-                    for result in clean_files:
-                        st.success(f"✅ {result['filename']}")
-                        st.caption(f"🔗 {result['url']}")
-                        st.divider()
-            
-            # Error Files
-            if error_files:
-                with st.expander(f"❌ ERROR FILES ({len(error_files)})"):
-                    for result in error_files:
-                        st.error(f"❌ {result['filename']}")
-                        st.caption(f"🔗 {result['url']}")
-                        st.caption(f"Error: {result.get('error', 'Unknown error')}")
-                        st.divider()
+            remember_scan(scan_source, results, report_name, crawl_timings=crawler.timer.as_dict())
+            display_results(results, report_name, show_clean=show_clean,
+                            crawl_timings=crawler.timer.as_dict())
+            if profiler is not None:
+                display_profile(profiler, report_name)
     
     else:
         st.info("👈 Enter a website URL in the sidebar to start scanning")
@@ -745,7 +4642,7 @@ def main():
         1. **Enter Website URL** - Input the website you want to scan
         2. **Choose Scanning Method**:
            - **Auto Crawl**: Automatically find PHP files by crawling
-           - **Sitemap Only**: Use sitemap.xml to find files
+           - **Sitemap Only**: Use the sitemaps listed in robots.txt (or sitemap.xml) to find files
            - **Common Paths**: Check common directories
            - **Full Scan**: Use all methods combined
         3. **Configure Settings** - Adjust depth, limits, and delays
@@ -780,7 +4677,7 @@ def main():
         
         **Scanning Methods:**
         - 🕷️ **Auto Crawl**: Follows links to discover PHP files
-        - 🗺️ **Sitemap**: Parses sitemap.xml for URLs
+        - 🗺️ **Sitemap**: Follows robots.txt sitemaps, sitemap indexes and .xml.gz files
         - 📁 **Common Paths**: Checks frequently used directories
         - 🔍 **Full Scan**: Combines all methods for comprehensive coverage
         
@@ -818,5 +4715,220 @@ def main():
         - Respects rate limiting
         """)
 
+# ========== Command Line (Batch Mode) ==========
+
+CLI_METHODS = {
+    'auto': "Auto Crawl",
+    'sitemap': "Sitemap Only",
+    'paths': "Common Paths",
+    'full': "Full Scan (All Methods)",
+}
+
+def read_sites_file(path):
+    """อ่านรายชื่อเว็บไซต์ (หนึ่ง URL ต่อบรรทัด, # = comment)"""
+    sites = []
+    for line in Path(path).read_text(encoding='utf-8').splitlines():
+        line = line.strip()
+        if line and not line.startswith('#'):
+            sites.append(line if '://' in line else f'https://{line}')
+    return sites
+
+def scan_site(website_url, options):
+    """สแกนเว็บไซต์หนึ่งแบบ headless แล้วเขียนรายงาน CSV/NDJSON/JSON (รันใน worker process)"""
+    started = time.monotonic()
+    activate_rule_packs(options['rule_packs'])
+    activate_webshell_index(options['webshell_samples'])
+    http_cache = HttpCache() if options['use_cache'] else None
+    cache = ScanCache() if options['use_cache'] else None
+    checkpoints = CheckpointStore()
+    scan_key = checkpoint_key(website_url, options['method'])
+    profiler = ScanProfiler() if options['profile'] else None
+    basename = report_basename(website_url)
+    crawler = None
+    
+    try:
+        state = checkpoints.load(scan_key) if options['resume'] else None
+        if state is None:
+            checkpoints.clear(scan_key)
+        
+        if state and state['phase'] == 'scan':
+            php_files = state['php_files']
+        else:
+            crawler = WebsiteCrawler(
+                website_url,
+                max_depth=options['max_depth'],
+                max_pages=options['max_pages'],
+                timeout=options['timeout'],
+                http_cache=http_cache
+            )
+            php_files = discover_php_files(
+                crawler,
+                options['method'],
+                max_workers=options['workers'],
+                wordlist_paths=options['wordlist_paths'],
+                crawl_state=state,
+                checkpoint=lambda crawl: checkpoints.save_crawl(scan_key, 'crawl', **crawl)
+            )
+            checkpoints.save_crawl(scan_key, 'scan', [], crawler.visited_urls, php_files)
+        
+        # เขียนผลทีละไฟล์ทันทีที่สแกนเสร็จ ไม่เก็บผลทั้งเว็บไซต์ไว้ในหน่วยความจำ
+        with StreamingReportWriter(options['output_dir'], basename) as writer:
+            for i, result in scan_urls_resumable(
+                php_files,
+                checkpoints,
+                scan_key,
+                timeout=options['timeout'],
+                delay=options['delay'],
+                max_workers=options['workers'],
+                cross_line=options['cross_line'],
+                max_bytes=options['max_bytes'],
+                cache=cache,
+                http_cache=http_cache,
+                profiler=profiler
+            ):
+                writer.write(result)
+        checkpoints.clear(scan_key)
+        if crawler is not None:
+            writer.stats.add_crawl_timings(crawler.timer.as_dict())
+        writer.write_json()
+    finally:
+        for store in (cache, http_cache, checkpoints):
+            if store is not None:
+                store.close()
+    
+    return {
+        'site': website_url,
+        'stats': writer.stats.as_dict(),
+        'csv': str(writer.csv_path),
+        'json': str(writer.json_path),
+        'ndjson': str(writer.ndjson_path),
+        'profile': str(profiler.dump(Path(options['output_dir']) / f'{basename}.prof')) if profiler else None,
+        'elapsed': round(time.monotonic() - started, 1)
+    }
+
+def cli_main(argv=None):
+    """สแกนหลายเว็บไซต์จาก command line (เช่นจาก cron) โดยแยก process ต่อเว็บไซต์"""
+    parser = argparse.ArgumentParser(
+        description="PHP Website Malware Scanner - headless batch mode"
+    )
+    parser.add_argument('sites', nargs='*', help="website URLs to scan")
+    parser.add_argument('-f', '--sites-file', help="file with one website URL per line")
+    parser.add_argument('-o', '--output-dir', default='reports', help="directory for CSV/JSON/NDJSON reports")
+    parser.add_argument('-p', '--processes', type=int, default=os.cpu_count() or 1,
+                        help="number of sites scanned in parallel (worker processes)")
+    parser.add_argument('-m', '--method', choices=CLI_METHODS, default='full', help="file discovery method")
+    parser.add_argument('--max-depth', type=int, default=3)
+    parser.add_argument('--max-pages', type=int, default=100)
+    parser.add_argument('--timeout', type=int, default=10, help="request timeout in seconds")
+    parser.add_argument('--delay', type=float, default=0.5, help="minimum seconds between requests to a host")
+    parser.add_argument('--workers', type=int, default=4, help="concurrent requests per site")
+    parser.add_argument('--max-file-mb', type=int, default=10)
+    parser.add_argument('--wordlist', help="custom path wordlist for common path probing")
+    parser.add_argument('--multiline', action='store_true', help="detect multi-line patterns")
+    parser.add_argument('--no-cache', action='store_true', help="do not read or write the scan caches")
+    parser.add_argument('--profile', action='store_true',
+                        help="write a cProfile dump (.prof) of the file scanning per site next to the reports")
+    parser.add_argument('--resume', action='store_true',
+                        help="continue unfinished scans from their last checkpoint instead of starting over")
+    parser.add_argument('--rules', action='append', default=[], metavar='PACK',
+                        help="JSON or YAML rule pack added to the built-in rules (repeatable)")
+    parser.add_argument('--webshell-samples', action='append', default=[], metavar='PATH',
+                        help="directory of known webshell samples (one sub-directory per family) "
+                             "or .json signature index used for family attribution (repeatable)")
+    args = parser.parse_args(argv)
+    
+    sites = list(args.sites)
+    if args.sites_file:
+        sites.extend(read_sites_file(args.sites_file))
+    if not sites:
+        parser.error("no sites given (pass URLs or --sites-file)")
+    try:
+        # โหลดครั้งแรกที่นี่เพื่อตรวจ rule pack และสร้าง artifact ให้ worker ทุกตัวใช้ร่วมกัน
+        rules = activate_rule_packs(args.rules)
+    except RulePackError as e:
+        parser.error(str(e))
+    if rules.sources:
+        print(f"📚 {rules.rule_count} rules active from {len(rules.sources)} pack(s) (ruleset {rules.version})")
+    try:
+        index = activate_webshell_index(args.webshell_samples)
+    except WebshellIndexError as e:
+        parser.error(str(e))
+    if index.sources:
+        print(f"🧬 {len(index.samples)} webshell samples from {len(index.families)} families (index {index.version or 'empty'})")
+    
+    options = {
+        'output_dir': args.output_dir,
+        'method': CLI_METHODS[args.method],
+        'max_depth': args.max_depth,
+        'max_pages': args.max_pages,
+        'timeout': args.timeout,
+        'delay': args.delay,
+        'workers': args.workers,
+        'max_bytes': args.max_file_mb * 1024 * 1024,
+        'wordlist_paths': parse_wordlist(Path(args.wordlist).read_text(encoding='utf-8')) if args.wordlist else None,
+        'cross_line': args.multiline,
+        'use_cache': not args.no_cache,
+        'resume': args.resume,
+        'profile': args.profile,
+        'rule_packs': args.rules,
+        'webshell_samples': args.webshell_samples,
+    }
+    
+    summaries = []
+    exit_code = 0
+    with ProcessPoolExecutor(max_workers=max(1, min(args.processes, len(sites)))) as executor:
+        futures = {executor.submit(scan_site, site, options): site for site in sites}
+        for future in as_completed(futures):
+            site = futures[future]
+            try:
+                summary = future.result()
+            except Exception as e:
+                print(f"❌ {site}: {e}", file=sys.stderr)
+                exit_code = 1
+                continue
+            
+            stats = summary['stats']
+            print(f"✅ {site}: {stats['total_files']} files, {stats['infected_files']} infected, "
+                  f"{stats['total_issues']} issues ({summary['elapsed']}s) -> {summary['json']}")
+            slowest = stats['performance']['slowest_rules']
+            if slowest:
+                print(f"   ⏱️ slowest rule: {slowest[0]['rule']} ({slowest[0]['seconds']}s)")
+            if summary['profile']:
+                print(f"   🧪 profile: {summary['profile']}")
+            summaries.append({
+                'Site': site,
+                'Total Files': stats['total_files'],
+                'Infected Files': stats['infected_files'],
+                'Total Issues': stats['total_issues'],
+                'Critical': stats['severity_counts'].get('critical', 0),
+                'High': stats['severity_counts'].get('high', 0),
+                'Medium': stats['severity_counts'].get('medium', 0),
+                'Clusters': len(stats['clusters']),
+                'CSV Report': summary['csv'],
+                'JSON Report': summary['json'],
+                'NDJSON Report': summary['ndjson'],
+            })
+    
+    if summaries:
+        summary_path = Path(args.output_dir) / f"batch_summary_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        pd.DataFrame(summaries).to_csv(summary_path, index=False)
+        print(f"📊 Batch summary: {summary_path}")
+        
+        # payload เดียวกันบนหลายเว็บไซต์: รวม cluster ข้ามรายงานของทุกเว็บไซต์
+        duplicates = DuplicateClusters()
+        for summary in summaries:
+            for result in read_ndjson_results(summary['NDJSON Report']):
+                duplicates.add(result)
+        clusters = duplicates.clusters()
+        if clusters:
+            clusters_path = summary_path.with_name(summary_path.name.replace('batch_summary', 'batch_clusters'))
+            export_clusters_csv(clusters).to_csv(clusters_path, index=False)
+            print(f"🧩 {len(clusters)} duplicate clusters across sites: {clusters_path}")
+    
+    return exit_code
+
 if __name__ == "__main__":
-    main()
+    if st.runtime.exists():
+        main()
+    else:
+        sys.exit(cli_main())
@@ -0,0 +1,82 @@
+import importlib.util
+import logging
+from pathlib import Path
+
+import pytest
+
+SCANNER_PATH = Path(__file__).resolve().parent.parent / 'mal-scan-php.py'
+
+
+def load_scanner():
+    """โหลด mal-scan-php.py เป็น module (ชื่อไฟล์มีขีดจึง import ตรงๆ ไม่ได้)"""
+    spec = importlib.util.spec_from_file_location('mal_scan_php', SCANNER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope='session')
+def scanner():
+    # streamlit เตือนเรื่อง ScriptRunContext เมื่อไม่ได้รันผ่าน streamlit run
+    logging.getLogger('streamlit').setLevel(logging.ERROR)
+    return load_scanner()
+
+
+def finding_keys(findings):
+    """(rule, line, code) ของ finding เรียงแล้ว ใช้เทียบผลสองทางว่าเท่ากัน"""
+    return sorted((finding['rule'], finding['line'], finding['code']) for finding in findings)
+
+
+class FakeRaw:
+    def __init__(self, body):
+        self.body = body
+
+    def read(self, size, decode_content=False):
+        return self.body[:size]
+
+
+class FakeResponse:
+    """response แบบ stream ที่ส่ง body ทีละ 3 byte"""
+    def __init__(self, body, status_code=200, headers=None):
+        self.body = body
+        self.status_code = status_code
+        self.encoding = 'utf-8'
+        self.headers = headers or {}
+        self.raw = FakeRaw(body)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f'HTTP {self.status_code}')
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.body), 3):
+            yield self.body[start:start + 3]
+
+
+class FakeSession:
+    """session ที่ตอบจาก dict ของ URL -> body (URL ใน etags ตอบ 304 เมื่อ If-None-Match ตรงกัน)"""
+    def __init__(self, pages, etags=None):
+        self.pages = pages
+        self.etags = etags or {}
+        self.requested = []
+
+    def mount(self, prefix, adapter):
+        pass
+
+    def close(self):
+        pass
+
+    def get(self, url, headers=None, **kwargs):
+        self.requested.append(url)
+        etag = self.etags.get(url)
+        if etag and (headers or {}).get('If-None-Match') == etag:
+            return FakeResponse(b'', 304, {'ETag': etag})
+        if url not in self.pages:
+            return FakeResponse(b'', 404)
+        return FakeResponse(self.pages[url], headers={'ETag': etag} if etag else None)
@@ -0,0 +1,39 @@
+"""ไฟล์เดียวกันต้องได้ผลเท่ากันไม่ว่าจะสแกนเป็น str (URL) หรือ bytes (mmap/ZIP)"""
+import pytest
+
+from conftest import finding_keys
+
+NON_ASCII_SOURCES = [
+    # byte >= 0x80 เป็นส่วนของชื่อใน PHP: ไม่ใช่การเรียก base64_decode
+    '<?php ébase64_decode($x);',
+    '<?php €eval($_POST["a"]);',
+    '<?php $日本 = 1; 日本system("id");',
+    # \xa0 เป็นตัวอักษรของชื่อ ไม่ใช่ whitespace
+    '<?php eval\xa0($code);',
+    '<?php function\xa0system() {}',
+    # ชื่อ/ข้อความ non-ASCII รอบการเรียกจริง
+    '<?php $é = base64_decode($données); eval($é);',
+    '<?php // commentaire é\nsystem($_GET["ç"]);',
+    '<?php echo "naïve"; shell_exec("ls ñ");',
+    '<?php $a = "日本語"; assert($_REQUEST["x"]);',
+]
+
+
+@pytest.mark.parametrize('source', NON_ASCII_SOURCES)
+def test_str_and_bytes_findings_match(scanner, source):
+    text = finding_keys(scanner.scan_content(source, 'a.php'))
+    binary = finding_keys(scanner.scan_content(source.encode('utf-8'), 'a.php'))
+    assert text == binary
+
+
+def test_identifier_prefix_is_not_a_call(scanner):
+    source = '<?php ébase64_decode($x);'
+    assert scanner.scan_content(source, 'a.php') == []
+    assert scanner.scan_content(source.encode('utf-8'), 'a.php') == []
+
+
+def test_call_after_non_ascii_text_is_found(scanner):
+    source = '<?php $é = 1; base64_decode($x);'
+    for content in (source, source.encode('utf-8')):
+        rules = {finding['rule'] for finding in scanner.scan_content(content, 'a.php')}
+        assert 'function/base64_decode' in rules
@@ -0,0 +1,64 @@
+"""CheckpointStore: บันทึกสถานะการสแกนเว็บไซต์และสแกนต่อหลัง rerun"""
+import pytest
+
+from conftest import FakeSession
+
+BASE = 'https://example.com'
+
+
+@pytest.fixture
+def checkpoints(scanner, tmp_path):
+    return scanner.CheckpointStore(tmp_path / 'checkpoints.sqlite')
+
+
+def test_crawl_state_round_trip(scanner, checkpoints):
+    key = scanner.checkpoint_key(BASE + '/', 'Auto Crawl')
+    assert key == scanner.checkpoint_key(BASE, 'Auto Crawl')
+    assert checkpoints.load(key) is None
+
+    checkpoints.save_crawl(key, 'crawl', [(f'{BASE}/a', 1), (f'{BASE}/b', 2)],
+                           {BASE, f'{BASE}/x.php'}, [f'{BASE}/x.php'])
+    state = checkpoints.load(key)
+    assert state['phase'] == 'crawl'
+    assert state['frontier'] == [(f'{BASE}/a', 1), (f'{BASE}/b', 2)]
+    assert sorted(state['visited']) == [BASE, f'{BASE}/x.php']
+    assert state['php_files'] == [f'{BASE}/x.php']
+
+    checkpoints.save_crawl(key, 'scan', [], state['visited'], state['php_files'])
+    summary = checkpoints.summary(key)
+    assert (summary['phase'], summary['visited'], summary['php_files'], summary['scanned']) == ('scan', 2, 1, 0)
+
+
+def test_results_round_trip_and_clear(scanner, checkpoints):
+    key = scanner.checkpoint_key(BASE, 'Sitemap Only')
+    result = scanner.scan_local_file(f'{BASE}/x.php', data=b'<?php eval($_GET["c"]);\n')
+    result['url'] = f'{BASE}/x.php'
+    checkpoints.save_crawl(key, 'scan', [], [], [f'{BASE}/x.php'])
+    checkpoints.save_result(key, result)
+
+    restored = checkpoints.completed_results(key)[f'{BASE}/x.php']
+    assert [f['rule'] for f in restored['findings']] == [f['rule'] for f in result['findings']]
+    assert isinstance(restored['findings'][0], scanner.Finding)
+    assert restored['score'] == result['score']
+    assert checkpoints.summary(key)['scanned'] == 1
+
+    checkpoints.clear(key)
+    assert checkpoints.load(key) is None
+    assert checkpoints.completed_results(key) == {}
+
+
+def test_resumable_scan_skips_completed_files(scanner, checkpoints, monkeypatch):
+    urls = [f'{BASE}/{n}.php' for n in range(4)] + [f'{BASE}/missing.php']
+    session = FakeSession({url: b'<?php system($_GET["c"]);\n' for url in urls[:4]})
+    monkeypatch.setattr(scanner, 'create_session', lambda pool_size=10: session)
+    key = scanner.checkpoint_key(BASE, 'Common Paths')
+
+    first = dict(scanner.scan_urls_resumable(urls, checkpoints, key, max_workers=2))
+    assert sorted(first) == list(range(5))
+    assert first[4]['status'] == 'failed'
+
+    session.requested.clear()
+    second = dict(scanner.scan_urls_resumable(urls, checkpoints, key, max_workers=2))
+    # เฉพาะไฟล์ที่สแกนไม่สำเร็จที่ถูกดึงใหม่
+    assert session.requested == [f'{BASE}/missing.php']
+    assert [second[i]['score'] for i in range(4)] == [first[i]['score'] for i in range(4)]
@@ -0,0 +1,89 @@
+"""cli_main: สแกนเว็บไซต์แบบ headless แล้วเขียนรายงาน CSV/JSON พร้อม batch summary"""
+import functools
+import http.server
+import json
+import sys
+import threading
+
+import pandas as pd
+import pytest
+
+SHELL = b'<?php eval(base64_decode($_POST["c"])); ?>\n'
+CLEAN = b'<?php echo "hello"; ?>\n'
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def site_url(tmp_path):
+    """เว็บไซต์จริงบน localhost (worker process ของ cli_main มองไม่เห็น monkeypatch)"""
+    root = tmp_path / 'site'
+    root.mkdir()
+    (root / 'index.html').write_bytes(b'<html><body><a href="/shell.php">a</a>'
+                                      b'<a href="/clean.php">b</a></body></html>')
+    (root / 'shell.php').write_bytes(SHELL)
+    (root / 'clean.php').write_bytes(CLEAN)
+    handler = functools.partial(QuietHandler, directory=str(root))
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}/'
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def workdir(scanner, tmp_path, monkeypatch):
+    # cache และ checkpoint อยู่ใต้ไดเรกทอรีปัจจุบัน
+    monkeypatch.chdir(tmp_path)
+    # worker process import module ตามชื่อ จึงต้องลงทะเบียน module ที่โหลดจากไฟล์ไว้
+    monkeypatch.setitem(sys.modules, scanner.__name__, scanner)
+    return tmp_path
+
+
+def test_cli_scans_site_and_writes_reports(scanner, site_url, workdir, capsys):
+    out = workdir / 'reports'
+    code = scanner.cli_main([site_url, '-o', str(out), '-p', '1', '-m', 'auto',
+                             '--delay', '0', '--workers', '2', '--timeout', '5'])
+    assert code == 0
+    assert '1 infected' in capsys.readouterr().out
+
+    [report] = out.glob('malware_scan_127.0.0.1*.json')
+    data = json.loads(report.read_text(encoding='utf-8'))
+    assert {'performance', 'clusters', 'results'} <= set(data)
+    results = {result['filename']: result for result in data['results']}
+    assert set(results) == {'shell.php', 'clean.php'}
+    assert results['shell.php']['score'] > 0
+    assert {finding['rule'] for finding in results['shell.php']['findings']} >= {'function/eval'}
+    assert results['clean.php']['findings'] == []
+
+    [csv_report] = out.glob('malware_scan_127.0.0.1*.csv')
+    rows = pd.read_csv(csv_report).set_index('Filename')   # หนึ่งแถวต่อไฟล์
+    assert sorted(rows.index) == ['clean.php', 'shell.php']
+    assert rows.loc['shell.php', 'Total Issues'] == len(results['shell.php']['findings'])
+    assert rows.loc['clean.php', 'Total Issues'] == 0
+
+    [summary] = out.glob('batch_summary_*.csv')
+    summary = pd.read_csv(summary)
+    assert summary['Site'].tolist() == [site_url]
+    assert summary['Total Files'].tolist() == [2]
+    assert summary['Infected Files'].tolist() == [1]
+    assert summary['JSON Report'].tolist() == [str(report)]
+
+
+def test_cli_reports_failed_site(scanner, site_url, workdir, capsys):
+    blocked = workdir / 'reports'
+    blocked.write_text('not a directory')
+    code = scanner.cli_main([site_url, '-o', str(blocked), '-p', '1', '-m', 'auto', '--delay', '0'])
+    assert code == 1
+    assert site_url in capsys.readouterr().err
+    assert not list(workdir.glob('batch_summary_*.csv'))
+
+
+def test_cli_requires_sites(scanner, workdir):
+    with pytest.raises(SystemExit) as excinfo:
+        scanner.cli_main([])
+    assert excinfo.value.code == 2
@@ -0,0 +1,66 @@
+"""DuplicateClusters: จัดกลุ่มไฟล์ซ้ำและนับเว็บไซต์ของทั้ง URL ไฟล์ local และ ZIP"""
+import pytest
+
+PAYLOAD = b'<?php eval(base64_decode($_POST["a"]));'
+
+
+def clusters_of(scanner, results):
+    duplicates = scanner.DuplicateClusters()
+    for result in results:
+        duplicates.add(result)
+    return duplicates.clusters()
+
+
+@pytest.mark.parametrize('location, site', [
+    ('https://a.example/wp/shell.php', 'a.example'),
+    ('/var/www/site1/wp/shell.php', '/var/www/site1/wp'),
+    ('C:\\www\\site1\\shell.php', 'C:/www/site1'),
+    ('backup.zip:site1/shell.php', 'backup.zip:site1'),
+    ('backup.zip:shell.php', 'backup.zip'),
+])
+def test_location_site(scanner, location, site):
+    assert scanner.location_site(location) == site
+
+
+def test_local_and_zip_locations_count_as_separate_sites(scanner):
+    locations = ['/var/www/site1/shell.php', '/var/www/site2/shell.php', 'backup.zip:site3/shell.php']
+    results = [scanner.scan_local_file(location, data=PAYLOAD) for location in locations]
+    [cluster] = clusters_of(scanner, results)
+    assert cluster['members'] == 3
+    assert cluster['sites'] == 3
+    assert cluster['variants'] == 1
+
+
+def test_same_directory_is_one_site(scanner):
+    results = [scanner.scan_local_file(f'/var/www/site1/{name}', data=PAYLOAD) for name in ('a.php', 'b.php')]
+    [cluster] = clusters_of(scanner, results)
+    assert cluster['sites'] == 1
+
+
+def filename_only_result(url, filename):
+    return {
+        'url': url, 'filename': filename, 'score': 10, 'risk_level': 'LOW',
+        'findings': [{'type': 'suspicious_filename', 'rule': 'filename/backdoor_name', 'code': filename}],
+    }
+
+
+def test_filename_only_findings_without_hash_cluster_by_filename(scanner):
+    results = [
+        filename_only_result('https://a.example/c99.php', 'c99.php'),
+        filename_only_result('https://b.example/C99.php', 'C99.php'),
+        filename_only_result('https://a.example/r57.php', 'r57.php'),
+        filename_only_result('https://c.example/wso.php', 'wso.php'),
+    ]
+    [cluster] = clusters_of(scanner, results)
+    assert cluster['members'] == 2
+    assert cluster['sites'] == 2
+    assert sorted(cluster['urls']) == ['https://a.example/c99.php', 'https://b.example/C99.php']
+
+
+def test_filename_only_findings_with_hash_cluster_by_hash(scanner):
+    results = [scanner.scan_local_file(f'/srv/{site}/c99.php', data=data)
+               for site, data in (('a', b'one'), ('b', b'two'), ('c', b'one'))]
+    assert all(result['findings'] for result in results)
+    [cluster] = clusters_of(scanner, results)
+    assert cluster['members'] == 2
+    assert sorted(cluster['urls']) == ['/srv/a/c99.php', '/srv/c/c99.php']
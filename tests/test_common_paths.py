@@ -0,0 +1,75 @@
+"""try_common_paths: HEAD request พร้อมกันหลาย worker, wordlist และการหยุดเมื่อ host ไม่ตอบ"""
+import threading
+import time
+
+BASE = 'https://example.com'
+
+
+class HeadSession:
+    """session ที่ตอบ HEAD ตาม dict ของ path -> status (ไม่อยู่ใน dict = 404)"""
+    def __init__(self, statuses=None, down=False):
+        self.statuses = statuses or {}
+        self.down = down
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def mount(self, prefix, adapter):
+        pass
+
+    def head(self, url, **kwargs):
+        with self._lock:
+            self.calls += 1
+        time.sleep(0.01)
+        if self.down:
+            raise ConnectionError('connection refused')
+        return type('Response', (), {'status_code': self.statuses.get(url[len(BASE):], 404)})()
+
+
+def crawler_with(scanner, session):
+    crawler = scanner.WebsiteCrawler(BASE)
+    crawler.session = session
+    return crawler
+
+
+def test_found_paths_keep_wordlist_order(scanner):
+    paths = [f'/p{n}.php' for n in range(40)] + ['/admin/']
+    session = HeadSession({'/p30.php': 200, '/p3.php': 200, '/p12.php': 403, '/admin/': 200})
+    crawler = crawler_with(scanner, session)
+
+    found = crawler.try_common_paths(paths=paths, max_workers=8)
+    assert found == [f'{BASE}/p3.php', f'{BASE}/p30.php', f'{BASE}/admin']
+    assert crawler.php_files == [f'{BASE}/p3.php', f'{BASE}/p30.php']
+    assert session.calls == len(paths)
+
+
+def test_unreachable_host_aborts_early(scanner):
+    session = HeadSession(down=True)
+    crawler = crawler_with(scanner, session)
+    paths = [f'/p{n}.php' for n in range(200)]
+
+    assert crawler.try_common_paths(paths=paths, max_workers=2, max_failures=5) == []
+    # request ที่เหลือในคิวถูกยกเลิก เหลือเฉพาะที่ worker กำลังทำอยู่
+    time.sleep(0.05)
+    assert session.calls <= 5 + 2 * 2
+
+
+def test_failures_after_a_response_do_not_abort(scanner):
+    paths = ['/ok.php'] + [f'/p{n}.php' for n in range(30)]
+
+    class Flaky(HeadSession):
+        def head(self, url, **kwargs):
+            if url.endswith('/ok.php'):
+                with self._lock:
+                    self.calls += 1
+                return type('Response', (), {'status_code': 200})()
+            return super().head(url, **kwargs)
+
+    session = Flaky(down=True)
+    found = crawler_with(scanner, session).try_common_paths(paths=paths, max_workers=1, max_failures=5)
+    assert found == [f'{BASE}/ok.php']
+    assert session.calls == len(paths)
+
+
+def test_parse_wordlist(scanner):
+    text = '# comment\nadmin.php\n/shell.php\n\n  /admin.php  \nwp-content/x.php\n'
+    assert scanner.parse_wordlist(text) == ['/admin.php', '/shell.php', '/wp-content/x.php']
@@ -0,0 +1,184 @@
+"""WebsiteCrawler: ดึงลิงก์จากหน้าเว็บและใช้ผลเดิมจาก HttpCache"""
+import pytest
+
+from conftest import FakeResponse, FakeSession
+
+BASE = 'https://example.com'
+PAGE = (b'<html><body><a href="/about">About</a>'
+        b'<form action="/login.php"></form><script src="/app.js"></script></body></html>')
+
+SAMPLE = """<!DOCTYPE html><html><head>
+<base href="/app/"><base href="/ignored/">
+<link rel="stylesheet" href="style.css"><link rel="alternate" href="feed.php">
+<script src="js/app.js"></script><script src="/api.php?x=1"></script>
+</head><body>
+<a href="page.html">page</a><a href="#top">top</a><a>no href</a><a href="  ">blank</a>
+<area href="/map.php"><iframe src="frame.html"></iframe><frame src="https://example.com/f.php">
+<form action="submit.php"><input name="q"></form>
+<a href="https://other.org/x.php">other</a><a href="http://[::1">broken</a>
+<img src="logo.php"><a href="page.html">again</a>
+</body></html>"""
+
+
+@pytest.fixture(params=['lxml', 'html.parser'])
+def link_parser(request, scanner, monkeypatch):
+    if request.param == 'lxml':
+        if scanner.lxml_etree is None:
+            pytest.skip('lxml not installed')
+    else:
+        monkeypatch.setattr(scanner, 'lxml_etree', None)
+    return request.param
+
+
+def extract(scanner, html, chunk_size):
+    extractor = scanner.LinkExtractor()
+    for start in range(0, len(html), chunk_size):
+        extractor.feed(html[start:start + chunk_size])
+    return extractor, extractor.close()
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 100000])
+def test_link_extractor_tags_and_base(scanner, link_parser, chunk_size):
+    extractor, links = extract(scanner, SAMPLE, chunk_size)
+    assert extractor.base == '/app/'
+    assert links == [
+        ('link', 'style.css'), ('link', 'feed.php'), ('script', 'js/app.js'), ('script', '/api.php?x=1'),
+        ('a', 'page.html'), ('a', '#top'), ('area', '/map.php'), ('iframe', 'frame.html'),
+        ('frame', 'https://example.com/f.php'), ('form', 'submit.php'),
+        ('a', 'https://other.org/x.php'), ('a', 'http://[::1'), ('a', 'page.html'),
+    ]
+
+
+def test_resolve_links_uses_base_and_keeps_php_assets(scanner, link_parser):
+    extractor, links = extract(scanner, SAMPLE, 100000)
+    crawler = scanner.WebsiteCrawler(BASE)
+    assert crawler.resolve_links(f'{BASE}/dir/index.html', extractor.base, links) == [
+        f'{BASE}/app/feed.php', f'{BASE}/api.php?x=1', f'{BASE}/app/page.html', f'{BASE}/app',
+        f'{BASE}/map.php', f'{BASE}/app/frame.html', f'{BASE}/f.php', f'{BASE}/app/submit.php',
+    ]
+
+
+def test_page_without_base_resolves_against_page_url(scanner):
+    extractor, links = extract(scanner, '<a href="x.php">x</a><script src="a.js"></script>', 100000)
+    assert extractor.base is None
+    crawler = scanner.WebsiteCrawler(BASE)
+    assert crawler.resolve_links(f'{BASE}/dir/index.html', extractor.base, links) == [f'{BASE}/dir/x.php']
+
+
+def test_non_html_response_is_not_parsed(scanner):
+    crawler = scanner.WebsiteCrawler(BASE)
+    crawler.session = FakeSession({})
+    crawler.session.get = lambda url, **kwargs: FakeResponse(
+        b'<a href="/x.php">', headers={'Content-Type': 'application/pdf'})
+    assert crawler.get_links_from_page(f'{BASE}/doc') == []
+
+
+def crawler_with_cache(scanner, tmp_path, pages, etags=None):
+    crawler = scanner.WebsiteCrawler(BASE, http_cache=scanner.HttpCache(tmp_path / 'http.sqlite'))
+    crawler.session = FakeSession(pages, etags)
+    return crawler
+
+
+def test_cached_links_are_reused_on_304(scanner, tmp_path):
+    crawler = crawler_with_cache(scanner, tmp_path, {f'{BASE}/': PAGE}, {f'{BASE}/': '"v1"'})
+    links = crawler.get_links_from_page(f'{BASE}/')
+    assert links == [f'{BASE}/about', f'{BASE}/login.php']
+
+    crawler.session.pages = {}
+    assert crawler.get_links_from_page(f'{BASE}/') == links
+    assert crawler.http_cache.not_modified == 1
+
+
+def test_links_cached_by_older_extractor_are_refetched(scanner, tmp_path):
+    crawler = crawler_with_cache(scanner, tmp_path, {f'{BASE}/': PAGE}, {f'{BASE}/': '"v1"'})
+    # payload ก่อนมี LINK_EXTRACTOR_VERSION: list ของลิงก์ <a> อย่างเดียว
+    crawler.http_cache.put(f'{BASE}/', 'links', FakeResponse(b'', headers={'ETag': '"v1"'}),
+                           [f'{BASE}/about'])
+
+    assert crawler.get_links_from_page(f'{BASE}/') == [f'{BASE}/about', f'{BASE}/login.php']
+    assert crawler.http_cache.not_modified == 0
+    entry = crawler.http_cache.get(f'{BASE}/', 'links')
+    assert entry['payload']['version'] == scanner.LINK_EXTRACTOR_VERSION
+
+
+def test_sitemap_cached_without_version_is_refetched(scanner, tmp_path):
+    sitemap = (b'<?xml version="1.0"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+               b'<url><loc>https://example.com/a.php</loc></url></urlset>')
+    url = f'{BASE}/sitemap.xml'
+    crawler = crawler_with_cache(scanner, tmp_path, {url: sitemap}, {url: '"s1"'})
+    crawler.http_cache.put(url, 'sitemap', FakeResponse(b'', headers={'ETag': '"s1"'}), [['stale.php'], []])
+
+    assert crawler.fetch_sitemap(url) == [[f'{BASE}/a.php'], []]
+    crawler.session.pages = {}
+    assert crawler.fetch_sitemap(url) == [[f'{BASE}/a.php'], []]
+    assert crawler.http_cache.not_modified == 1
+
+
+def site_tree(fanout=3, depth=4):
+    """หน้าเว็บแบบต้นไม้ทุกหน้ามีลิงก์กลับหน้าแรก ใบของต้นไม้เป็นไฟล์ PHP"""
+    pages = {}
+
+    def add(path, level):
+        children = [] if level == depth else [f'{path}/{n}' for n in range(fanout)]
+        links = ''.join(f'<a href="{child}">x</a>' for child in children)
+        links += '<a href="/">home</a><a href="/leaf.php">php</a>'
+        pages[f'{BASE}{path or "/"}'] = f'<html><body>{links}</body></html>'.encode()
+        for child in children:
+            add(child, level + 1)
+
+    add('', 0)
+    # crawl เริ่มที่ BASE ส่วนลิงก์ "/" ได้ BASE + '/' ซึ่งเป็นหน้าเดียวกัน
+    pages[BASE] = pages[f'{BASE}/']
+    pages[f'{BASE}/leaf.php'] = b'<?php echo 1;'
+    return pages
+
+
+def crawl_both(scanner, pages, **limits):
+    dfs = scanner.WebsiteCrawler(BASE, **limits)
+    dfs.session = FakeSession(pages)
+    dfs.crawl()
+    bfs = scanner.WebsiteCrawler(BASE, **limits)
+    bfs.session = FakeSession(pages)
+    bfs.crawl_bfs(max_workers=3)
+    return dfs, bfs
+
+
+def test_bfs_matches_dfs_within_max_depth(scanner):
+    pages = site_tree()
+    for max_depth in range(4):
+        dfs, bfs = crawl_both(scanner, pages, max_depth=max_depth, max_pages=1000)
+        assert bfs.visited_urls == dfs.visited_urls, max_depth
+        assert sorted(bfs.php_files) == sorted(dfs.php_files)
+        # หน้าที่ความลึกสูงสุดไม่ถูกดึง
+        deepest = {url for url in bfs.visited_urls if url.count('/') == max_depth + 2}
+        assert not deepest & set(bfs.session.requested)
+
+
+def test_bfs_stops_at_max_pages(scanner):
+    dfs, bfs = crawl_both(scanner, site_tree(), max_depth=4, max_pages=20)
+    assert len(dfs.visited_urls) == len(bfs.visited_urls) == 20
+    # BFS เยี่ยมหน้าตื้นก่อน: หน้าแรกและลูกของหน้าแรกครบ
+    assert {f'{BASE}/0', f'{BASE}/1', f'{BASE}/2', f'{BASE}/leaf.php'} <= bfs.visited_urls
+
+
+
+def test_bfs_resumes_from_saved_checkpoint(scanner, tmp_path):
+    pages = site_tree()
+    full = scanner.WebsiteCrawler(BASE, max_depth=3, max_pages=1000)
+    full.session = FakeSession(pages)
+    full.crawl_bfs(max_workers=2)
+
+    checkpoints = scanner.CheckpointStore(tmp_path / 'checkpoints.sqlite')
+    key = scanner.checkpoint_key(BASE, 'Auto Crawl')
+    states = []
+    first = scanner.WebsiteCrawler(BASE, max_depth=3, max_pages=1000)
+    first.session = FakeSession(pages)
+    first.crawl_bfs(max_workers=2, checkpoint=states.append, checkpoint_interval=0)
+    # หยุดกลางคัน: เก็บ checkpoint ที่บันทึกไว้ระหว่าง crawl ลง store
+    checkpoints.save_crawl(key, 'crawl', **states[len(states) // 2])
+
+    resumed = scanner.WebsiteCrawler(BASE, max_depth=3, max_pages=1000)
+    resumed.session = FakeSession(pages)
+    resumed.crawl_bfs(max_workers=2, state=checkpoints.load(key))
+    assert resumed.visited_urls == full.visited_urls
+    assert sorted(resumed.php_files) == sorted(full.php_files)
@@ -0,0 +1,51 @@
+"""ตัวชี้วัด entropy / สัดส่วนสัญลักษณ์: ไม่ flag ข้อความภาษาอื่นหรือเส้นคั่น แต่ยังจับ code ที่ถูก obfuscate"""
+import base64
+import random
+
+import pytest
+
+THAI_COMMENT = '<?php\n// ' + 'ตรวจสอบไฟล์ PHP ที่น่าสงสัยและรายงานผลให้ผู้ดูแลระบบทราบ ' * 4 + '\necho 1;\n'
+CJK_STRING = '<?php\n$s = "' + '检查可疑的文件并报告结果。日本語のテキストです。' * 8 + '";\n'
+SEPARATORS = [
+    '<?php\n/' + '*' * 300 + '/\n',
+    '<?php\n// ' + '-=' * 150 + '\n',
+    '<?php\n#' + '#' * 250 + '\n',
+]
+NON_ALNUM_SHELL = ('<?php\n' + "$_=[];$_=@\"$_\";$_=$_['!'=='@'];$___=$_;$__=$_;$__++;$__++;"
+                   "$___.=$__;$___.=$__;$__=$_;$__++;$___.=$__;$_____='_';$____=$$_____;" * 3 + '\n')
+
+
+def entropy_rules(scanner, content):
+    return sorted(finding['rule'] for finding in scanner.scan_content(content, 'a.php')
+                  if finding['rule'].startswith('entropy/'))
+
+
+@pytest.mark.parametrize('source', [THAI_COMMENT, CJK_STRING] + SEPARATORS,
+                         ids=['thai', 'cjk', 'stars', 'dashes', 'hashes'])
+def test_text_and_separators_are_not_flagged(scanner, source):
+    assert entropy_rules(scanner, source) == []
+    assert entropy_rules(scanner, source.encode('utf-8')) == []
+
+
+def test_non_alphanumeric_shell_is_flagged(scanner):
+    assert entropy_rules(scanner, NON_ALNUM_SHELL) == ['entropy/symbol_density']
+
+
+def test_encoded_blob_is_flagged(scanner):
+    payload = base64.b64encode(random.Random(1).randbytes(600)).decode('ascii')
+    source = f'<?php\n$p = "{payload}";\n'
+    assert entropy_rules(scanner, source) == ['entropy/encoded_blob']
+
+
+def test_short_lines_are_ignored(scanner):
+    assert entropy_rules(scanner, '<?php\n' + '$_=@$_[\'!\'];\n' * 50) == []
+
+
+def test_statistics_do_not_depend_on_block_size(scanner, monkeypatch):
+    rng = random.Random(2)
+    lines = [THAI_COMMENT, NON_ALNUM_SHELL, base64.b64encode(rng.randbytes(3000)).decode(), 'x' * 10]
+    data = scanner.as_byte_array('\n'.join(lines * 5))
+    expected = scanner.line_statistics(data)
+    monkeypatch.setattr(scanner, 'ENTROPY_BLOCK_SIZE', 97)
+    for actual, wanted in zip(scanner.line_statistics(data), expected):
+        assert actual == pytest.approx(wanted)
@@ -0,0 +1,72 @@
+"""Finding: ตัดผลซ้ำต่อ (rule, บรรทัด), snippet สั้นรอบ match และ JSON ที่กะทัดรัด"""
+import json
+
+import pytest
+
+from conftest import load_scanner
+
+
+def snippet_limit(scanner):
+    # ตัดเหลือ MAX_SNIPPET_LENGTH บวก '...' หัวท้ายเมื่อบรรทัดถูกตัด
+    return scanner.MAX_SNIPPET_LENGTH + 2 * len('...')
+
+
+def long_line_payload(repeat):
+    return '<?php ' + 'eval(base64_decode($_POST["c"])); ' * repeat + '\n'
+
+
+@pytest.mark.parametrize('binary', [False, True])
+def test_long_single_line_gives_one_finding_per_rule(scanner, binary):
+    content = long_line_payload(50000)   # ~1.7 MB ในบรรทัดเดียว
+    findings = scanner.scan_content(content.encode() if binary else content, 'x.php')
+    rules = [finding['rule'] for finding in findings]
+    assert len(rules) == len(set(rules))
+    assert {'function/eval', 'function/base64_decode'} <= set(rules)
+    assert all(len(finding['code']) <= snippet_limit(scanner) for finding in findings)
+    # ผลทั้งหมดเล็กกว่าเนื้อหามาก (ไม่คัดลอกทั้งบรรทัดลงทุก finding)
+    assert len(json.dumps(findings, default=scanner.json_default)) < 10000
+
+
+def test_stream_windows_do_not_repeat_rule_on_same_line(scanner):
+    content = long_line_payload(20000)
+    stream = scanner.StreamScanner('x.php', window_size=64 * 1024, overlap=512)
+    for start in range(0, len(content), 10000):
+        stream.feed(content[start:start + 10000])
+    findings = stream.finish()
+    keys = [(finding['rule'], finding['line']) for finding in findings]
+    assert len(keys) == len(set(keys))
+    assert 'function/eval' in {rule for rule, _ in keys}
+
+
+def test_snippet_is_cut_around_the_match(scanner):
+    content = '<?php $a = "' + 'x' * 5000 + '"; system($_GET["c"]); $b = "' + 'y' * 5000 + '";\n'
+    finding = next(finding for finding in scanner.scan_content(content, 'x.php')
+                   if finding['rule'] == 'function/system')
+    assert len(finding['code']) <= snippet_limit(scanner)
+    assert finding['code'].startswith('...') and finding['code'].endswith('...')
+    assert 'system($_GET' in finding['code']
+    assert content[finding['start']:finding['end']].startswith('system')
+
+
+def test_dict_access_and_round_trip(scanner):
+    finding = scanner.Finding('dangerous_function', 'critical', 3, 'eval($x);', 'eval', 'function/eval', 10, 14)
+    assert finding['function'] == 'eval' and 'category' not in finding
+    assert finding.get('category') is None
+    assert finding['description'] == 'Dangerous function: eval()'
+    data = json.loads(json.dumps([finding], default=scanner.json_default))
+    assert [item.to_dict() for item in scanner.findings_from_dicts(data)] == [finding.to_dict()]
+
+
+def test_json_default_accepts_finding_from_reloaded_module(scanner):
+    # streamlit rerun โหลดสคริปต์ใหม่ Finding ใน session_state จึงเป็นคลาสจากรอบก่อน
+    old = load_scanner().Finding('suspicious_pattern', 'high', 1, 'x', 'webshell', 'webshell/0')
+    assert scanner.json_default(old)['category'] == 'webshell'
+
+
+def test_json_default_rejects_other_classes_named_finding(scanner):
+    class Finding:
+        def to_dict(self):
+            return {'leaked': True}
+
+    with pytest.raises(TypeError):
+        json.dumps(Finding(), default=scanner.json_default)
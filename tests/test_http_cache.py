@@ -0,0 +1,63 @@
+"""HttpCache และ conditional request: ใช้ผลเดิมเมื่อ server ตอบ 304 Not Modified"""
+import pytest
+
+from conftest import FakeResponse, FakeSession
+
+URL = 'https://example.com/shell.php'
+BODY = b'<?php eval($_POST["c"]);\n'
+
+
+@pytest.fixture
+def http_cache(scanner, tmp_path):
+    return scanner.HttpCache(tmp_path / 'http.sqlite')
+
+
+def test_conditional_headers(scanner):
+    assert scanner.conditional_headers(None) == {}
+    entry = {'etag': '"abc"', 'last_modified': 'Wed, 01 Jan 2025 00:00:00 GMT', 'payload': []}
+    assert scanner.conditional_headers(entry) == {
+        'If-None-Match': '"abc"', 'If-Modified-Since': 'Wed, 01 Jan 2025 00:00:00 GMT'}
+    assert scanner.conditional_headers({**entry, 'etag': None}) == {
+        'If-Modified-Since': 'Wed, 01 Jan 2025 00:00:00 GMT'}
+
+
+def test_put_requires_a_validator(http_cache):
+    http_cache.put(URL, 'scan', FakeResponse(b''), {'x': 1})
+    assert http_cache.get(URL, 'scan') is None
+
+    http_cache.put(URL, 'scan', FakeResponse(b'', headers={'Last-Modified': 'yesterday'}), {'x': 1})
+    assert http_cache.get(URL, 'scan') == {'etag': None, 'last_modified': 'yesterday', 'payload': {'x': 1}}
+    # kind แยก payload ของ URL เดียวกัน
+    assert http_cache.get(URL, 'links') is None
+
+
+def test_scan_url_reuses_findings_on_304(scanner, http_cache):
+    session = FakeSession({URL: BODY}, {URL: '"v1"'})
+    first = scanner.scan_url(URL, session=session, http_cache=http_cache)
+    assert not first['cached']
+    assert http_cache.not_modified == 0
+
+    session.pages = {}
+    second = scanner.scan_url(URL, session=session, http_cache=http_cache)
+    assert http_cache.not_modified == 1
+    assert second['cached'] and not second['truncated']
+    assert second['hash'] == first['hash']
+    assert [f['rule'] for f in second['findings']] == [f['rule'] for f in first['findings']]
+
+
+def test_scan_url_ignores_entry_from_other_ruleset(scanner, http_cache):
+    http_cache.put(URL, 'scan', FakeResponse(b'', headers={'ETag': '"v1"'}),
+                   {'ruleset': 'old', 'findings': [], 'hash': 'x'})
+    session = FakeSession({URL: BODY}, {URL: '"v1"'})
+
+    result = scanner.scan_url(URL, session=session, http_cache=http_cache)
+    assert http_cache.not_modified == 0
+    assert result['findings']
+    assert http_cache.get(URL, 'scan')['payload']['ruleset'] != 'old'
+
+
+def test_truncated_scan_is_not_cached(scanner, http_cache):
+    session = FakeSession({URL: BODY + b'$a = 1;\n' * 100}, {URL: '"v1"'})
+    result = scanner.scan_url(URL, session=session, http_cache=http_cache, max_bytes=50)
+    assert result['truncated']
+    assert http_cache.get(URL, 'scan') is None
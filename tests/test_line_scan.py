@@ -0,0 +1,101 @@
+"""การสแกนทั้งไฟล์ต้องให้ผลเหมือนการสแกนทีละบรรทัดแบบเดิม และเลขบรรทัดต้องถูกต้อง"""
+import random
+import re
+
+import pytest
+
+# ชิ้นส่วนโค้ดสำหรับสุ่ม: ไม่มี quote/comment/-> และไม่มี $ นำหน้าชื่อฟังก์ชัน
+# ซึ่งเป็นกรณีที่ตั้งใจให้ต่างจากเดิม (นับเฉพาะการเรียกในโค้ด)
+ATOMS = [
+    'eval', 'system', 'base64_decode', 'exec', 'assert', 'gzinflate', 'str_rot13',
+    'shell_exec', 'passthru', 'copy', 'include', 'preg_replace', '/e', '(', ')', ' ', '\t',
+    '\n', '\r\n', 'x', '$x', '$_GET[a]', ';', '.', '=', 'select a from b where', 'union --',
+    'sleep( 3', '1=1 or ', 'wso', 'FilesMan', '<script>', '</script>', 'javascript:',
+]
+
+
+def per_line_findings(scanner, source):
+    """{(rule, line)} จากการสแกนทีละบรรทัดแบบเดิม (re.search ของแต่ละฟังก์ชันและ pattern ต่อบรรทัด)"""
+    found = set()
+    for line_no, line in enumerate(source.split('\n'), 1):
+        for functions in scanner.DANGEROUS_FUNCTIONS.values():
+            for func in functions:
+                if re.search(rf'\b{func}\s*\(', line, re.IGNORECASE):
+                    found.add((f'function/{func}', line_no))
+        for category, patterns in scanner.SUSPICIOUS_PATTERNS.items():
+            for i, pattern in enumerate(patterns):
+                if re.search(pattern, line, re.IGNORECASE):
+                    found.add((f'{category}/{i}', line_no))
+    return found
+
+
+def whole_file_findings(scanner, content):
+    return {(finding['rule'], finding['line'])
+            for finding in scanner.scan_content(content, 'a.php')
+            if finding['type'] in ('dangerous_function', 'suspicious_pattern')}
+
+
+def test_matches_per_line_scan(scanner):
+    rng = random.Random(1)
+    for _ in range(500):
+        source = '<?php ' + ''.join(rng.choice(ATOMS) for _ in range(rng.randint(3, 40)))
+        expected = per_line_findings(scanner, source)
+        assert whole_file_findings(scanner, source) == expected, source
+        assert whole_file_findings(scanner, source.encode('utf-8')) == expected, source
+
+
+@pytest.mark.parametrize('source', [
+    '<?php eval\n(1);',
+    '<?php eval (\n1);',
+    '<?php $a = 1;\nsystem\t($x);\n',
+    '<?php\r\neval(base64_decode($x));\r\n',
+])
+def test_call_split_across_lines(scanner, source):
+    expected = per_line_findings(scanner, source)
+    assert whole_file_findings(scanner, source) == expected
+    assert whole_file_findings(scanner, source.encode('utf-8')) == expected
+
+
+@pytest.mark.parametrize('source', [
+    'a\nb\nc',
+    'a\nb\nc\n',
+    '\n\na\n',
+    'a\r\nb\r\nc',
+    'no newline',
+    '',
+])
+def test_line_index_numbers(scanner, source):
+    lines = source.split(scanner.newline_for(source))
+    offsets = [sum(len(line) + len(scanner.newline_for(source)) for line in lines[:i])
+               for i in range(len(lines))]
+    for content in (source, source.encode('utf-8')):
+        index = scanner.line_index_for(content)
+        for line_no, start in enumerate(offsets, 1):
+            assert index.line_number(start) == line_no
+            assert index.line_start(line_no) == start
+            # ตัวอักษรสุดท้ายของบรรทัดยังเป็นบรรทัดเดิม
+            if lines[line_no - 1]:
+                assert index.line_number(start + len(lines[line_no - 1]) - 1) == line_no
+
+
+def test_finding_lines_in_long_file(scanner):
+    lines = ['$a = 1;'] * 1000
+    expected = set()
+    for line_no in range(5, 1000, 37):
+        lines[line_no - 1] = 'eval($a);'
+        expected.add(line_no)
+    source = '\n'.join(lines)
+    for content in (source, source.encode('utf-8')):
+        findings = scanner.scan_content(content, 'a.php')
+        assert {finding['line'] for finding in findings if finding['rule'] == 'function/eval'} == expected
+
+
+def test_cross_line_pattern(scanner):
+    source = '<?php\n$a = 1;\neval(\n  base64_decode($x));\n'
+    for content in (source, source.encode('utf-8')):
+        per_line = scanner.scan_content(content, 'a.php')
+        assert not [finding for finding in per_line if finding['rule'] == 'backdoor/1']
+
+        cross_line = scanner.scan_content(content, 'a.php', cross_line=True)
+        # match ข้ามบรรทัดรายงานที่บรรทัดแรกของ match
+        assert [finding['line'] for finding in cross_line if finding['rule'] == 'backdoor/1'] == [3]
@@ -0,0 +1,83 @@
+"""สแกน directory และ ZIP ในเครื่องด้วย worker process"""
+import io
+import os
+import sys
+import zipfile
+
+import pytest
+
+SHELL = b'<?php eval(base64_decode($_POST["c"]));\n'
+CLEAN = b'<?php echo "hello";\n'
+
+
+@pytest.fixture
+def site_dir(tmp_path):
+    (tmp_path / 'wp').mkdir()
+    (tmp_path / 'wp' / 'shell.php').write_bytes(SHELL)
+    (tmp_path / 'index.PHP').write_bytes(CLEAN)
+    (tmp_path / 'readme.txt').write_bytes(b'eval(')
+    os.symlink(tmp_path / 'wp' / 'shell.php', tmp_path / 'link.php')
+    return tmp_path
+
+
+def zip_bytes(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def test_list_directory_files(scanner, site_dir):
+    names = {os.path.relpath(path, site_dir) for path in scanner.list_directory_files(str(site_dir))}
+    # symlink ไม่ถูกตาม และนามสกุลเทียบแบบไม่สนตัวพิมพ์
+    assert names == {os.path.join('wp', 'shell.php'), 'index.PHP'}
+    all_names = {os.path.relpath(path, site_dir)
+                 for path in scanner.list_directory_files(str(site_dir), all_files=True)}
+    assert 'readme.txt' in all_names and 'link.php' not in all_names
+
+
+def test_zip_members_are_read_up_to_max_bytes(scanner):
+    big = b'<?php\n' + b'$a = 1;\n' * 1000
+    data = zip_bytes({'site/': b'', 'site/big.php': big, 'site/shell.php': SHELL, 'notes.txt': b'x'})
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        members = scanner.list_zip_members(archive)
+        assert [info.filename for info in members] == ['site/big.php', 'site/shell.php']
+        tasks = dict(scanner.iter_zip_tasks(archive, members, 'site.zip', max_bytes=100))
+
+    # อ่านเกิน max_bytes หนึ่ง byte เพื่อให้รู้ว่าไฟล์ถูกตัด
+    assert len(tasks['site.zip:site/big.php']) == 101
+    assert tasks['site.zip:site/shell.php'] == SHELL
+
+    result = scanner.scan_local_file('site.zip:site/big.php', data=tasks['site.zip:site/big.php'],
+                                     max_bytes=100)
+    assert result['truncated']
+    assert result['hash'] == scanner.calculate_file_hash(big[:100])
+    assert not scanner.scan_local_file('site.zip:site/shell.php', data=SHELL, max_bytes=100)['truncated']
+
+
+def test_mapped_file_is_capped(scanner, site_dir):
+    path = site_dir / 'big.php'
+    path.write_bytes(SHELL * 100)
+    result = scanner.scan_local_file(str(path), max_bytes=len(SHELL))
+    assert result['truncated']
+    assert result['hash'] == scanner.calculate_file_hash(SHELL)
+    assert result['filename'] == 'big.php'
+
+
+def test_scan_local_files_with_worker_processes(scanner, site_dir, monkeypatch):
+    # worker process import module ตามชื่อ จึงต้องลงทะเบียน module ที่โหลดจากไฟล์ไว้
+    monkeypatch.setitem(sys.modules, scanner.__name__, scanner)
+    locations = scanner.list_directory_files(str(site_dir))
+    zip_data = zip_bytes({'a/shell.php': SHELL, 'a/clean.php': CLEAN})
+    with zipfile.ZipFile(io.BytesIO(zip_data)) as archive:
+        zip_tasks = list(scanner.iter_zip_tasks(archive, scanner.list_zip_members(archive), 'up.zip'))
+    tasks = [(location, None) for location in locations] + zip_tasks
+
+    results = {result['url']: result
+               for result in scanner.scan_local_files(tasks, processes=2, use_cache=False)}
+    assert set(results) == set(locations) | {'up.zip:a/shell.php', 'up.zip:a/clean.php'}
+    assert all(result['status'] == 'success' for result in results.values())
+    assert results['up.zip:a/shell.php']['score'] > 0
+    assert results['up.zip:a/clean.php']['score'] == 0
+    assert results[str(site_dir / 'wp' / 'shell.php')]['hash'] == results['up.zip:a/shell.php']['hash']
@@ -0,0 +1,160 @@
+"""PhpTokens: ชนิด token และ is_call ต้องเหมือนกันทั้ง str และ bytes"""
+import json
+
+import pytest
+
+
+def token_texts(scanner, source):
+    """[(kind, text)] ของ source ที่ lex เป็น str และเป็น bytes ต้องเท่ากัน"""
+    results = []
+    for content in (source, source.encode('utf-8')):
+        tokens = scanner.PhpTokens(content)
+        texts = []
+        for kind, start, end in tokens.tokens():
+            text = content[start:end]
+            texts.append((kind, text if isinstance(text, str) else text.decode('utf-8')))
+        results.append(texts)
+    assert results[0] == results[1]
+    return results[0]
+
+
+def test_heredoc_interpolation_is_code(scanner):
+    source = '<?php $a = <<<EOT\nsystem($x) {$b->c}\nEOT;\nsystem(1);'
+    assert token_texts(scanner, source) == [
+        ('code', '<?php $a = '),
+        ('string', '<<<EOT\nsystem($x) '),
+        ('code', '{$b->c}'),
+        ('string', '\nEOT'),
+        ('code', ';\nsystem(1);'),
+    ]
+
+
+def test_nowdoc_is_one_string(scanner):
+    source = "<?php $a = <<<'EOT'\n{$b} eval(1)\n  EOT;\neval(2);"
+    assert token_texts(scanner, source) == [
+        ('code', '<?php $a = '),
+        ('string', "<<<'EOT'\n{$b} eval(1)\n  EOT"),
+        ('code', ';\neval(2);'),
+    ]
+
+
+def test_heredoc_with_non_ascii_label(scanner):
+    source = '<?php $a = <<<ÉTIQ\nsystem(1)\nÉTIQ;\nsystem(2);'
+    assert token_texts(scanner, source) == [
+        ('code', '<?php $a = '),
+        ('string', '<<<ÉTIQ\nsystem(1)\nÉTIQ'),
+        ('code', ';\nsystem(2);'),
+    ]
+
+
+def test_close_tag_ends_line_comment(scanner):
+    source = '<?php // x ?> system(1) <?php system(2);'
+    assert token_texts(scanner, source) == [
+        ('code', '<?php '),
+        ('comment', '// x '),
+        ('code', '?>'),
+        ('html', ' system(1) '),
+        ('code', '<?php system(2);'),
+    ]
+
+
+def test_close_tag_inside_block_comment(scanner):
+    source = '<?php /* ?> */ system(3);'
+    assert token_texts(scanner, source) == [
+        ('code', '<?php '),
+        ('comment', '/* ?> */'),
+        ('code', ' system(3);'),
+    ]
+
+
+def test_double_quoted_interpolation(scanner):
+    source = '<?php $s = "x {$a} y ${b} z $c";'
+    assert token_texts(scanner, source) == [
+        ('code', '<?php $s = '),
+        ('string', '"x '),
+        ('code', '{$a}'),
+        ('string', ' y '),
+        ('code', '${b}'),
+        ('string', ' z $c"'),
+        ('code', ';'),
+    ]
+
+
+def test_non_ascii_identifiers_stay_code(scanner):
+    source = '<?php function é() {} é(); $日本 = "ü";'
+    assert token_texts(scanner, source) == [
+        ('code', '<?php function é() {} é(); $日本 = '),
+        ('string', '"ü"'),
+        ('code', ';'),
+    ]
+
+
+@pytest.mark.parametrize('prefix, expected', [
+    ('', True),
+    ('$x = ', True),
+    ('\\', True),
+    ('$a & ', True),
+    ('$o->', False),
+    ('$o -> ', False),
+    ('Foo::', False),
+    ('$', False),
+    ('Ns\\', False),
+    ('function ', False),
+    ('function &', False),
+    ('FUNCTION\n\t', False),
+    ('new ', False),
+    ('const ', False),
+    ('myfunction ', True),
+    ('éfunction ', True),
+    ('new &', True),
+    # \xa0 เป็นตัวอักษรของชื่อใน PHP ไม่ใช่ whitespace
+    ('function\xa0', True),
+    ('日本\\', False),
+])
+def test_is_call(scanner, prefix, expected):
+    source = f'<?php {prefix}system($x);'
+    for content in (source, source.encode('utf-8')):
+        name = 'system' if isinstance(content, str) else b'system'
+        tokens = scanner.PhpTokens(content)
+        assert tokens.is_call(content.index(name)) is expected
+
+
+def test_is_call_outside_code(scanner):
+    source = '<?php echo "system($x)"; // system($y)'
+    for content in (source, source.encode('utf-8')):
+        name = 'system' if isinstance(content, str) else b'system'
+        tokens = scanner.PhpTokens(content)
+        first = content.index(name)
+        assert not tokens.is_call(first)
+        assert not tokens.is_call(content.index(name, first + 1))
+
+
+@pytest.mark.parametrize('scope, lines', [
+    (None, {2, 3, 4, 5}),
+    ('code', {2}),
+    ('comment', {3}),
+    ('string', {4}),
+    ('html', {5}),
+    (['comment', 'string'], {3, 4}),
+])
+def test_scoped_rule_matches_only_in_token_kinds(scanner, tmp_path, monkeypatch, scope, lines):
+    monkeypatch.chdir(tmp_path)
+    rule = {'name': 'marker', 'strings': ['zz_marker']}
+    if scope is not None:
+        rule['scope'] = scope
+    pack = tmp_path / 'scoped.json'
+    pack.write_text(json.dumps({'rules': [rule]}), encoding='utf-8')
+    rules = scanner.load_rule_set([str(pack)])
+
+    source = "<?php\nzz_marker();\n// zz_marker\n$a = 'zz_marker';\n?>zz_marker\n"
+    for content in (source, source.encode('utf-8')):
+        findings = scanner.scan_content(content, 'a.php', rules=rules)
+        assert {finding['line'] for finding in findings if finding['rule'] == 'marker/marker'} == lines
+
+
+def test_unknown_scope_is_rejected(scanner, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    pack = tmp_path / 'scoped.json'
+    pack.write_text(json.dumps({'rules': [{'name': 'x', 'strings': ['x'], 'scope': 'regex'}]}), encoding='utf-8')
+    with pytest.raises(scanner.RulePackError, match='unknown token kind'):
+        scanner.load_rule_set([str(pack)])
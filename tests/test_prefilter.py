@@ -0,0 +1,35 @@
+"""prefilter เป็นแค่ทางลัด: เปิดหรือปิดต้องได้ finding เท่ากันทุกกรณี"""
+import pytest
+
+from conftest import finding_keys
+
+SOURCES = [
+    '<?php eval(base64_decode($_POST["a"]));',
+    '<?php\n$x = 1;\n\n@EVAL(GzInflate(Base64_Decode("abc")));\n',
+    '<?php\r\necho 1;\r\nSystem($cmd);\r\n$_GET["f"]($_GET["a"]);\r\n',
+    '<?php $payload = "' + 'A' * 120 + '"; str_rot13("x");',
+    "<?php // FilesMan\n$auth_pass = 'x';\nshell_exec('cmd');",
+    '<html><script src="x"></script><iframe src="y"><?php echo 1; ?>onload = go()',
+    "<?php $q = 'SELECT * FROM users WHERE id = 1 OR 1=1 -- ';\nsleep( 5 );",
+    '<?php $é = "café"; ébase64_decode($x); passthru($é);\n// 日本 document.cookie',
+    '<?php\n$a = preg_replace(\n"/x/e", $b, $c);\n',
+    '<?php\n$f = "ba" . "se64_decode";\n$f($x);\n',
+    '',
+    '<?php ' + 'echo 1;\n' * 200 + 'benchmark( 1000000, md5(1));\n',
+]
+
+
+@pytest.mark.parametrize('cross_line', [False, True])
+@pytest.mark.parametrize('source', SOURCES)
+def test_prefilter_parity(scanner, source, cross_line):
+    for content in (source, source.encode('utf-8')):
+        filtered = scanner.scan_content(content, 'index.php', cross_line=cross_line)
+        full = scanner.scan_content(content, 'index.php', cross_line=cross_line, prefilter=False)
+        assert finding_keys(filtered) == finding_keys(full)
+
+
+def test_prefilter_skips_lines_without_keywords(scanner):
+    content = '<?php\n' + 'echo 1;\n' * 50 + 'eval($x);\n'
+    spans = scanner.RULES.prefilter.candidate_spans(content)
+    lines = {content.count('\n', 0, start) + 1 for start, _ in spans}
+    assert lines == {52}
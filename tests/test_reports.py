@@ -0,0 +1,44 @@
+"""รายงาน JSON: แบบ stream ต้องได้ข้อความเดียวกับ export_detailed_json"""
+import json
+
+SOURCES = {
+    'shell.php': b'<?php eval(base64_decode($_POST["a"]));',
+    'copy.php': b'<?php eval(base64_decode($_POST["a"]));',
+    'clean.php': b'<?php echo "caf\xc3\xa9\\n";',
+}
+
+
+def scan_results(scanner):
+    return [scanner.scan_local_file(name, data=data) for name, data in SOURCES.items()]
+
+
+def test_streamed_json_matches_export(scanner):
+    results = scan_results(scanner)
+    stats = scanner.generate_summary_stats(results)
+    expected = json.dumps(
+        {'performance': stats['performance'], 'clusters': stats['clusters'], 'results': results},
+        indent=2, ensure_ascii=False, default=scanner.json_default
+    )
+    assert scanner.export_detailed_json(results) == expected
+    streamed = ''.join(scanner.iter_detailed_json(iter(results), stats['performance'], stats['clusters']))
+    assert streamed == expected
+
+
+def test_streamed_json_without_results(scanner):
+    text = ''.join(scanner.iter_detailed_json(iter(()), {'phases': {}}, []))
+    assert text == json.dumps({'performance': {'phases': {}}, 'clusters': [], 'results': []}, indent=2)
+
+
+def test_writer_json_report(scanner, tmp_path):
+    results = scan_results(scanner)
+    with scanner.StreamingReportWriter(tmp_path, 'report') as writer:
+        for result in results:
+            writer.write(result)
+    path = writer.write_json()
+
+    assert path.suffix == '.json'
+    report = json.loads(path.read_text(encoding='utf-8'))
+    assert [result['url'] for result in report['results']] == list(SOURCES)
+    assert len(report['clusters']) == 1
+    assert sorted(report['clusters'][0]['urls']) == ['copy.php', 'shell.php']
+    assert list(scanner.read_ndjson_results(writer.ndjson_path)) == report['results']
@@ -0,0 +1,58 @@
+"""ตารางผลแบบแบ่งหน้า: results_frame, ตัวกรอง และการแบ่งหน้า"""
+import pytest
+
+
+def result(url, score, categories=(), status='success'):
+    findings = [{'severity': 'high', 'category': category} for category in categories]
+    return {'url': url, 'filename': url.rsplit('/', 1)[-1], 'findings': findings, 'score': score,
+            'risk_level': 'ERROR' if status == 'failed' else 'HIGH' if score >= 30 else 'LOW' if score else 'CLEAN',
+            'status': status, 'hash': f'h{score}'}
+
+
+@pytest.fixture
+def frame(scanner):
+    results = [
+        result('https://a.example/clean.php', 0),
+        result('https://a.example/Shell.php', 40, ['webshell', 'sql_injection']),
+        result('https://b.example/low.php', 5, ['sql']),
+        result('https://b.example/down.php', 0, status='failed'),
+    ]
+    return scanner.results_frame(results)
+
+
+def test_results_frame_sorted_by_score_with_result_index(frame):
+    assert list(frame['Risk Score']) == [40, 5, 0, 0]
+    # index ชี้กลับไปยังตำแหน่งใน results
+    assert list(frame.index) == [1, 2, 0, 3]
+    assert frame.at[1, 'Categories'] == 'sql_injection, webshell'
+    assert frame.at[1, 'Issues'] == 2 and frame.at[1, 'High'] == 2
+
+
+def test_filter_by_risk_level(scanner, frame):
+    assert list(scanner.filter_results_frame(frame).index) == [1, 2, 0, 3]
+    assert list(scanner.filter_results_frame(frame, ['HIGH', 'ERROR']).index) == [1, 3]
+    assert scanner.filter_results_frame(frame, []).empty
+
+
+def test_filter_by_whole_category(scanner, frame):
+    assert list(scanner.filter_results_frame(frame, categories=['sql']).index) == [2]
+    assert list(scanner.filter_results_frame(frame, categories=['sql_injection']).index) == [1]
+    assert list(scanner.filter_results_frame(frame, categories=['webshell', 'sql']).index) == [1, 2]
+
+
+def test_filter_by_url_text(scanner, frame):
+    assert list(scanner.filter_results_frame(frame, url_text='SHELL').index) == [1]
+    # ข้อความเทียบตรงตัว ไม่ใช่ regex
+    assert scanner.filter_results_frame(frame, url_text='.*').empty
+    assert list(scanner.filter_results_frame(frame, ['LOW', 'CLEAN'], url_text='b.example').index) == [2]
+
+
+def test_pagination(scanner):
+    frame = scanner.results_frame([result(f'https://a.example/{n}.php', n) for n in range(60)])
+    assert scanner.page_count(frame, 25) == 3
+    assert scanner.page_count(frame, 60) == 1
+    assert scanner.page_count(frame.iloc[:0], 25) == 1
+    pages = [scanner.page_rows(frame, page, 25) for page in range(1, 4)]
+    assert [len(page) for page in pages] == [25, 25, 10]
+    assert list(pages[0]['Risk Score'])[:2] == [59, 58]
+    assert sum((list(page.index) for page in pages), []) == list(frame.index)
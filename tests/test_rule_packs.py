@@ -0,0 +1,142 @@
+"""RuleSet: artifact ของ rule pack ถูกใช้ซ้ำจนกว่าเนื้อหาไฟล์หรือ logic การวิเคราะห์จะเปลี่ยน"""
+import json
+
+import pytest
+
+PACK = {'patterns': {'custom': ['evil_marker_one']}}
+
+
+@pytest.fixture
+def pack_dir(tmp_path, monkeypatch, scanner):
+    # artifact อยู่ใต้ .php_scanner_cache ของ working directory และ RULES ที่ถูกสลับต้องคืนค่าเดิม
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(scanner, 'RULES', scanner.RULES)
+    return tmp_path
+
+
+def write_pack(path, pack):
+    path.write_text(json.dumps(pack), encoding='utf-8')
+    return str(path)
+
+
+def artifacts(directory):
+    return sorted((directory / '.php_scanner_cache' / 'rules').glob('*.json'))
+
+
+def rule_ids(scanner, content, rules):
+    return {finding['rule'] for finding in scanner.scan_content(content, 'a.php', rules=rules)}
+
+
+def test_artifact_is_written_and_reused(scanner, pack_dir, monkeypatch):
+    path = write_pack(pack_dir / 'pack.json', PACK)
+    first = scanner.load_rule_set([path])
+    assert len(artifacts(pack_dir)) == 1
+    assert 'custom/0' in rule_ids(scanner, '<?php evil_marker_one;', first)
+
+    def rebuild(*args, **kwargs):
+        raise AssertionError('artifact should come from the cache')
+
+    monkeypatch.setattr(scanner, 'build_rule_artifact', rebuild)
+    second = scanner.load_rule_set([path])
+    assert second.version == first.version
+    assert 'custom/0' in rule_ids(scanner, '<?php evil_marker_one;', second)
+
+
+def test_editing_pack_invalidates_artifact(scanner, pack_dir):
+    path = write_pack(pack_dir / 'pack.json', PACK)
+    first = scanner.load_rule_set([path])
+    write_pack(pack_dir / 'pack.json', {'patterns': {'custom': ['evil_marker_two']}})
+    second = scanner.load_rule_set([path])
+
+    assert second.version != first.version
+    assert len(artifacts(pack_dir)) == 2
+    assert rule_ids(scanner, '<?php evil_marker_one;', second) == set()
+    assert 'custom/0' in rule_ids(scanner, '<?php evil_marker_two;', second)
+
+
+def test_scanner_version_invalidates_artifact(scanner, pack_dir, monkeypatch):
+    path = write_pack(pack_dir / 'pack.json', PACK)
+    scanner.load_rule_set([path])
+    monkeypatch.setattr(scanner, 'SCANNER_VERSION', scanner.SCANNER_VERSION + 1)
+    scanner.load_rule_set([path])
+    assert len(artifacts(pack_dir)) == 2
+
+
+
+@pytest.mark.parametrize('name', ['SEARCH_WINDOW_OVERLAP', 'RULE_TIME_BUDGET', 'RULE_TIME_PER_MB',
+                                  'SYMBOL_MIN_ENTROPY'])
+def test_scan_constants_change_ruleset_version(scanner, pack_dir, monkeypatch, name):
+    version = scanner.load_rule_set().version
+    monkeypatch.setattr(scanner, name, getattr(scanner, name) * 2)
+    assert scanner.load_rule_set().version != version
+
+def test_moved_pack_reuses_artifact_with_current_path(scanner, pack_dir):
+    first = scanner.load_rule_set([write_pack(pack_dir / 'pack.json', PACK)])
+    moved = write_pack(pack_dir / 'moved.json', PACK)
+    second = scanner.load_rule_set([moved])
+
+    assert len(artifacts(pack_dir)) == 1
+    assert second.version == first.version
+    assert [path for path, _ in second.sources] == [moved]
+
+
+def test_corrupt_artifact_is_rebuilt(scanner, pack_dir):
+    path = write_pack(pack_dir / 'pack.json', PACK)
+    version = scanner.load_rule_set([path]).version
+    artifacts(pack_dir)[0].write_text('{not json', encoding='utf-8')
+
+    rules = scanner.load_rule_set([path])
+    assert rules.version == version
+    json.loads(artifacts(pack_dir)[0].read_text(encoding='utf-8'))
+
+
+def test_activate_reloads_only_when_content_changes(scanner, pack_dir):
+    path = write_pack(pack_dir / 'pack.json', PACK)
+    active = scanner.activate_rule_packs([path])
+    assert scanner.activate_rule_packs([path]) is active
+
+    write_pack(pack_dir / 'pack.json', {'patterns': {'custom': ['evil_marker_two']}})
+    reloaded = scanner.activate_rule_packs([path])
+    assert reloaded is not active
+    assert scanner.RULES is reloaded
+    assert scanner.activate_rule_packs([]).sources == []
+
+
+def test_invalid_pack_is_rejected(scanner, pack_dir):
+    path = write_pack(pack_dir / 'bad.json', {'patterns': {'custom': ['(unclosed']}})
+    with pytest.raises(scanner.RulePackError, match='invalid regex'):
+        scanner.load_rule_set([path])
+    assert artifacts(pack_dir) == []
+
+
+@pytest.mark.parametrize('pack', [
+    {'severities': {'obfuscation': 'critical'}},
+    {'severities': {'backdoor': 'medium'}},
+    {'rules': [{'name': 'x', 'strings': ['evil_marker_one'], 'category': 'obfuscation', 'severity': 'critical'}]},
+])
+def test_pack_cannot_change_builtin_severity(scanner, pack_dir, pack):
+    path = write_pack(pack_dir / 'pack.json', pack)
+    with pytest.raises(scanner.RulePackError, match='built-in category'):
+        scanner.load_rule_set([path])
+
+
+def test_pack_severity_for_new_category(scanner, pack_dir):
+    path = write_pack(pack_dir / 'pack.json', {
+        'severities': {'custom': 'critical'},
+        'patterns': {'custom': ['evil_marker_one']},
+        # rule ใน category built-in ที่ระบุ severity เดิมยังใช้ได้
+        'rules': [{'name': 'x', 'strings': ['evil_marker_two'], 'category': 'backdoor', 'severity': 'high'}],
+    })
+    rules = scanner.load_rule_set([path])
+    findings = scanner.scan_content('<?php evil_marker_one;\nevil_marker_two;', 'a.php', rules=rules)
+    severities = {finding['rule']: finding['severity'] for finding in findings}
+    assert severities['custom/0'] == 'critical'
+    assert severities['backdoor/x'] == 'high'
+    assert rules.severity('obfuscation') == 'medium'
+
+
+def test_conflicting_pack_severities(scanner, pack_dir):
+    first = write_pack(pack_dir / 'a.json', {'severities': {'custom': 'critical'}})
+    second = write_pack(pack_dir / 'b.json', {'severities': {'custom': 'medium'}})
+    with pytest.raises(scanner.RulePackError, match='conflicts with'):
+        scanner.load_rule_set([first, second])
@@ -0,0 +1,88 @@
+"""ScanCache: ใช้ผลสแกนเดิมซ้ำตาม hash ของเนื้อหาและ ruleset"""
+import json
+import types
+
+import pytest
+
+from conftest import finding_keys
+
+SOURCE = '<?php\neval(base64_decode($_POST["c"]));\n$q = "select * from users where id=" . $_GET["id"];\n'
+
+
+@pytest.fixture
+def cache(scanner, tmp_path):
+    return scanner.ScanCache(tmp_path / 'scan.sqlite')
+
+
+def test_hit_returns_same_findings_and_recomputes_filename_findings(scanner, cache):
+    first, cached = scanner.scan_file_cached(SOURCE, 'index.php', cache=cache)
+    assert not cached and (cache.hits, cache.misses) == (0, 1)
+
+    # เนื้อหาเดิมในไฟล์ชื่ออื่น: finding จากเนื้อหามาจาก cache ส่วนชื่อไฟล์ตรวจใหม่
+    second, cached = scanner.scan_file_cached(SOURCE, 'c99.php', cache=cache)
+    assert cached and cache.hits == 1
+    content = [finding for finding in second if finding['type'] != 'suspicious_filename']
+    assert finding_keys(content) == finding_keys(first)
+    assert [finding['type'] for finding in second].count('suspicious_filename') == 1
+
+    third, cached = scanner.scan_file_cached(SOURCE, 'index.php', cache=cache)
+    assert cached and finding_keys(third) == finding_keys(first)
+
+
+def test_cached_findings_round_trip(scanner, cache):
+    findings = scanner.scan_content(SOURCE, 'index.php')
+    cache.put('h', 'r', findings)
+    restored = cache.get('h', 'r')
+    assert all(isinstance(finding, scanner.Finding) for finding in restored)
+    assert [finding.to_dict() for finding in restored] == [finding.to_dict() for finding in findings]
+    assert [f.to_dict() for f in scanner.findings_from_dicts(json.loads(
+        json.dumps(findings, default=scanner.json_default)))] == [f.to_dict() for f in findings]
+    assert cache.get('h', 'other') is None
+
+
+def test_ruleset_key_separates_scan_modes(scanner, pack_rules):
+    keys = {
+        scanner.ruleset_key(),
+        scanner.ruleset_key(cross_line=True),
+        scanner.ruleset_key(binary=True),
+        scanner.ruleset_key(rules=pack_rules),
+        scanner.ruleset_key(index=types.SimpleNamespace(version='abc123')),
+    }
+    assert len(keys) == 5
+
+
+@pytest.fixture
+def pack_rules(scanner, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    pack = tmp_path / 'pack.json'
+    pack.write_text(json.dumps({'patterns': {'custom': ['evil_marker']}}), encoding='utf-8')
+    return scanner.load_rule_set([str(pack)])
+
+
+@pytest.mark.parametrize('change', ['cross_line', 'binary', 'rules', 'index'])
+def test_miss_when_ruleset_changes(scanner, cache, pack_rules, monkeypatch, change):
+    content = SOURCE.encode('utf-8') if change == 'binary' else SOURCE
+    scanner.scan_file_cached(SOURCE, 'index.php', cache=cache)
+    if change == 'rules':
+        monkeypatch.setattr(scanner, 'RULES', pack_rules)
+    elif change == 'index':
+        # index ของตัวอย่าง webshell ชุดอื่น (version ต่างจาก index ว่าง)
+        index = types.SimpleNamespace(version='abc123', findings=lambda *args, **kwargs: [])
+        monkeypatch.setattr(scanner, 'WEBSHELL_INDEX', index)
+
+    _, cached = scanner.scan_file_cached(content, 'index.php', cache=cache,
+                                         cross_line=change == 'cross_line')
+    assert not cached
+    assert (cache.hits, cache.misses) == (0, 2)
+
+
+def test_results_with_rule_timeout_are_not_stored(scanner, cache, monkeypatch):
+    # deadline อยู่ในอดีต ทุก rule จึงหยุดทันทีและรายงาน timeout
+    monkeypatch.setattr(scanner, 'RULE_TIME_BUDGET', -1.0)
+    monkeypatch.setattr(scanner, 'RULE_TIME_PER_MB', 0.0)
+    findings, _ = scanner.scan_file_cached(SOURCE, 'index.php', cache=cache)
+    assert scanner.has_rule_timeout(findings)
+
+    monkeypatch.undo()
+    _, cached = scanner.scan_file_cached(SOURCE, 'index.php', cache=cache)
+    assert not cached
@@ -0,0 +1,117 @@
+import time
+
+import pytest
+
+from conftest import finding_keys
+
+
+def script_block(padding, body_length):
+    return f"<?php\n{'x' * padding}<script>{'a' * body_length}</script>\n"
+
+
+def test_windows_cover_range_without_duplicate_ownership(scanner):
+    windows = list(scanner.iter_search_windows(10, 10000))
+    assert windows[0][0] == 10
+    assert windows[-1][1] == windows[-1][2] == 10000
+    for (_, _, owned_end), (next_pos, _, _) in zip(windows, windows[1:]):
+        assert owned_end == next_pos
+
+
+def test_unwindowed_search_is_single_range(scanner):
+    assert list(scanner.iter_search_windows(5, 50000, windowed=False)) == [(5, 50000, 50000)]
+
+
+def test_long_match_across_window_boundary(scanner, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    # rule ที่ไม่เสี่ยง backtracking ค้นทั้งช่วง match ยาวกว่า overlap ที่คร่อมรอยต่อจึงไม่หลุด
+    pack = tmp_path / 'long.json'
+    pack.write_text('{"patterns": {"long_block": ["<blob>[a-z]{1000}</blob>"]}}', encoding='utf-8')
+    rules = scanner.load_rule_set([str(pack)])
+    boundary = scanner.SEARCH_WINDOW_SIZE - scanner.SEARCH_WINDOW_OVERLAP
+    for padding in range(boundary - 700, boundary, 50):
+        content = f"<?php\n{'x' * padding}<blob>{'a' * 1000}</blob>\n"
+        rule_ids = {finding['rule'] for finding in scanner.scan_content(content, 'a.php', rules=rules)}
+        assert any(rule.startswith('long_block') for rule in rule_ids), padding
+
+
+@pytest.mark.parametrize('padding', [3400, 3450, 3500, 3582])
+def test_prone_rule_with_re2_finds_long_script(scanner, padding):
+    if scanner.re2 is None:
+        pytest.skip('google-re2 not installed: prone rules are searched in windows')
+    content = script_block(padding, 1000)
+    rules = {finding['rule'] for finding in scanner.scan_content(content, 'a.php')}
+    assert 'xss/0' in rules
+
+
+def test_long_inline_script_str_and_bytes(scanner):
+    if scanner.re2 is None:
+        pytest.skip('google-re2 not installed: prone rules are searched in windows')
+    content = script_block(0, 5000)
+    findings = scanner.scan_content(content, 'a.php')
+    assert 'xss/0' in {finding['rule'] for finding in findings}
+    assert finding_keys(findings) == finding_keys(scanner.scan_content(content.encode(), 'a.php'))
+
+
+def test_windowing_only_for_prone_rules_without_re2(scanner):
+    plain = scanner.re.compile('abc')
+    assert not scanner.needs_search_windows(plain, False)
+    assert scanner.needs_search_windows(plain, True)
+    linear = scanner.compile_linear('a.*b', 0, False)
+    if linear is not None:
+        assert not scanner.needs_search_windows(linear, True)
+
+
+@pytest.fixture
+def rules_without_re2(scanner, monkeypatch):
+    """RuleSet ที่ compile โดยไม่มี google-re2 (ค่าเริ่มต้นของการติดตั้งทั่วไป)"""
+    monkeypatch.setattr(scanner, 're2', None)
+    rules = scanner.load_rule_set()
+    assert scanner.needs_search_windows(rules.patterns['xss'][0].regex(), rules.patterns['xss'][0].prone)
+    return rules
+
+
+@pytest.mark.parametrize('padding', range(3000, 3700, 25))
+def test_prone_rule_without_re2_finds_long_script(scanner, rules_without_re2, padding):
+    content = script_block(padding, 1000)
+    for data in (content, content.encode('utf-8')):
+        rules = {finding['rule'] for finding in scanner.scan_content(data, 'a.php', rules=rules_without_re2)}
+        assert 'xss/0' in rules
+
+
+def test_prone_rule_without_re2_after_other_lines(scanner, rules_without_re2):
+    content = '<?php\n' + ('y' * 100 + '\n') * 40 + script_block(3300, 1000)[len('<?php\n'):]
+    findings = scanner.scan_content(content, 'a.php', rules=rules_without_re2)
+    assert [finding['line'] for finding in findings if finding['rule'] == 'xss/0'] == [42]
+
+
+def test_windows_extend_to_line_end(scanner):
+    content = 'a' * 4400 + '\n' + 'b' * 100 + '\n'
+    index = scanner.line_index_for(content)
+    windows = list(scanner.iter_search_windows(0, len(content), index=index))
+    assert windows[0] == (0, 4400, scanner.SEARCH_WINDOW_SIZE - scanner.SEARCH_WINDOW_OVERLAP)
+    assert windows[-1][1] == windows[-1][2] == len(content)
+
+
+def test_only_very_long_lines_are_segmented(scanner):
+    length = scanner.SEARCH_WINDOW_SIZE + scanner.SEARCH_WINDOW_OVERLAP + 1000
+    content = 'a' * length + '\n'
+    index = scanner.line_index_for(content)
+    first = next(scanner.iter_search_windows(0, len(content), index=index))
+    assert first[1] == scanner.SEARCH_WINDOW_SIZE
+
+
+def test_windows_never_exceed_size_plus_overlap(scanner):
+    content = ('a' * 1000 + '\n') * 3 + 'b' * 20000 + '\n'
+    index = scanner.line_index_for(content)
+    for pos, endpos, _ in scanner.iter_search_windows(0, len(content), index=index):
+        assert endpos - pos <= scanner.SEARCH_WINDOW_SIZE + scanner.SEARCH_WINDOW_OVERLAP
+
+
+def test_hostile_long_line_stops_within_budget(scanner, rules_without_re2):
+    # บรรทัดเดียวที่ทำให้ rule sql_injection backtrack หนัก: ต้องหยุดตาม budget ไม่ใช่รอ finditer ทั้งบรรทัด
+    content = "<?php\n$q = 'where " + 'select from ' * 1700 + "';\n"
+    started = time.perf_counter()
+    findings = scanner.scan_content(content, 'a.php', rules=rules_without_re2)
+    elapsed = time.perf_counter() - started
+    assert any(finding['rule'].startswith('timeout/sql_injection') for finding in findings)
+    assert elapsed < scanner.RULE_TIME_BUDGET + 4
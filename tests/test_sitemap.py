@@ -0,0 +1,109 @@
+"""SitemapParser และ try_sitemap: gzip, sitemap index และข้อมูลที่มาทีละน้อย"""
+import gzip
+from xml.etree import ElementTree
+
+import pytest
+
+from conftest import FakeSession
+
+NS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+
+
+def sitemap_index(urls):
+    items = ''.join(f'<sitemap><loc>{url}</loc></sitemap>' for url in urls)
+    return f'<?xml version="1.0" encoding="UTF-8"?><sitemapindex xmlns="{NS}">{items}</sitemapindex>'.encode()
+
+
+def urlset(urls):
+    items = ''.join(f'<url><loc> {url} </loc><lastmod>2024-01-01</lastmod></url>' for url in urls)
+    return f'<?xml version="1.0" encoding="UTF-8"?><urlset xmlns="{NS}">{items}</urlset>'.encode()
+
+
+def parse(scanner, data, chunk_size):
+    parser = scanner.SitemapParser()
+    entries = []
+    for start in range(0, len(data), chunk_size):
+        entries.extend(parser.feed(data[start:start + chunk_size]))
+    entries.extend(parser.close())
+    return parser, entries
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 7, 65536])
+def test_gzipped_index_fed_in_small_chunks(scanner, chunk_size):
+    children = [f'https://example.com/sitemap-{n}.xml.gz' for n in range(50)]
+    parser, entries = parse(scanner, gzip.compress(sitemap_index(children)), chunk_size)
+    assert parser.is_index
+    assert entries == [('sitemap', url) for url in children]
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_urlset_strips_loc_whitespace(scanner, compress):
+    urls = ['https://example.com/a.php', 'https://example.com/b/']
+    data = urlset(urls)
+    parser, entries = parse(scanner, gzip.compress(data) if compress else data, 1)
+    assert not parser.is_index
+    assert entries == [('url', url) for url in urls]
+
+
+def test_single_byte_document(scanner):
+    # สั้นกว่า magic ของ gzip: ต้องรอ close ก่อนจึงส่งต่อให้ XML parser
+    parser = scanner.SitemapParser()
+    assert parser.feed(b'<') == []
+    with pytest.raises(ElementTree.ParseError):
+        parser.close()
+
+
+def test_decompressed_size_limit(scanner, monkeypatch):
+    monkeypatch.setattr(scanner, 'SITEMAP_MAX_BYTES', 1000)
+    data = gzip.compress(urlset([f'https://example.com/{n}.php' for n in range(100)]))
+    parser = scanner.SitemapParser()
+    with pytest.raises(ValueError, match='sitemap larger than'):
+        parser.feed(data)
+
+
+def test_parse_robots_sitemaps(scanner):
+    text = ('User-agent: *\nDisallow: /admin\n'
+            'Sitemap: https://example.com/sitemap.xml\n'
+            'sitemap:https://example.com/news.xml.gz # news\n'
+            'Sitemap: https://example.com/sitemap.xml\n'
+            '# Sitemap: https://example.com/commented.xml\n'
+            'Sitemap:\n')
+    assert scanner.parse_robots_sitemaps(text) == [
+        'https://example.com/sitemap.xml', 'https://example.com/news.xml.gz']
+
+
+def test_try_sitemap_follows_robots_and_nested_gzip_index(scanner):
+    base = 'https://example.com'
+    pages = {
+        f'{base}/robots.txt': b'Sitemap: https://example.com/index.xml.gz\nSitemap: https://other.org/x.xml\n',
+        f'{base}/index.xml.gz': gzip.compress(sitemap_index([f'{base}/posts.xml.gz', f'{base}/nested.xml',
+                                                             'https://other.org/evil.xml'])),
+        f'{base}/nested.xml': sitemap_index([f'{base}/pages.xml', f'{base}/index.xml.gz']),
+        f'{base}/posts.xml.gz': gzip.compress(urlset([f'{base}/a.php', f'{base}/readme.txt',
+                                                      'https://other.org/b.php'])),
+        f'{base}/pages.xml': urlset([f'{base}/c.php/', f'{base}/a.php#top']),
+    }
+    crawler = scanner.WebsiteCrawler(base)
+    crawler.session = FakeSession(pages)
+
+    assert sorted(crawler.try_sitemap(max_workers=2)) == [f'{base}/a.php', f'{base}/c.php']
+    requested = crawler.session.requested
+    assert 'https://other.org/x.xml' not in requested
+    assert 'https://other.org/evil.xml' not in requested
+    assert requested.count(f'{base}/index.xml.gz') == 1
+    assert not any(url.endswith(path) for url in requested for path in scanner.SITEMAP_FALLBACK_PATHS)
+
+
+def test_try_sitemap_falls_back_to_standard_paths(scanner):
+    base = 'https://example.com'
+    crawler = scanner.WebsiteCrawler(base)
+    crawler.session = FakeSession({f'{base}/wp-sitemap.xml': urlset([f'{base}/x.php'])})
+    assert crawler.try_sitemap() == [f'{base}/x.php']
+
+
+def test_broken_sitemap_keeps_urls_read_before_the_error(scanner):
+    base = 'https://example.com'
+    body = urlset([f'{base}/a.php', f'{base}/b.php'])[:-len('</urlset>')] + b'<url><loc>x</url>'
+    crawler = scanner.WebsiteCrawler(base)
+    crawler.session = FakeSession({f'{base}/broken.xml': body})
+    assert crawler.fetch_sitemap(f'{base}/broken.xml') == [[f'{base}/a.php', f'{base}/b.php'], []]
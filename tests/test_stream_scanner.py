@@ -0,0 +1,109 @@
+"""StreamScanner: ผลและ hash ของไฟล์ที่อ่านแบบ stream ต้องตรงกับการสแกนจาก disk"""
+import pytest
+
+
+class FakeResponse:
+    """response ที่ iter_content คืน body ทีละ chunk_size byte"""
+    def __init__(self, body, encoding='utf-8', chunk_size=None):
+        self.body = body
+        self.encoding = encoding
+        self.chunk_size = chunk_size
+
+    def iter_content(self, chunk_size):
+        size = self.chunk_size or chunk_size
+        for start in range(0, len(self.body), size):
+            yield self.body[start:start + size]
+
+
+BODIES = [
+    '<?php eval(base64_decode($_POST["é"])); // 日本語\n'.encode('utf-8'),
+    # byte ที่ไม่ใช่ UTF-8 ถูกแทนด้วย U+FFFD ตอน decode แต่ hash ต้องคิดจาก byte เดิม
+    b'<?php $a = "\xff\xfe"; system($_GET["c"]);\n',
+    '<?php echo "café";\n'.encode('latin-1'),
+]
+
+
+@pytest.mark.parametrize('body', BODIES)
+@pytest.mark.parametrize('chunk_size', [1, 3, 4096])
+def test_stream_hash_matches_file_hash(scanner, body, chunk_size):
+    stream = scanner.StreamScanner('a.php')
+    assert scanner.read_stream_into(FakeResponse(body, chunk_size=chunk_size), stream) == (True, False)
+    stream.finish()
+    assert stream.hasher.hexdigest() == scanner.calculate_file_hash(body)
+    assert stream.hasher.hexdigest() == scanner.scan_local_file('a.php', data=body)['hash']
+
+
+def test_stream_hash_ignores_declared_encoding(scanner):
+    body = '<?php echo "café";\n'.encode('utf-8')
+    hashes = set()
+    for encoding in ('utf-8', 'latin-1', None):
+        stream = scanner.StreamScanner('a.php')
+        scanner.read_stream_into(FakeResponse(body, encoding=encoding, chunk_size=2), stream)
+        stream.finish()
+        hashes.add(stream.hasher.hexdigest())
+    assert hashes == {scanner.calculate_file_hash(body)}
+
+
+def test_stream_findings_match_file_scan(scanner):
+    body = BODIES[0]
+    stream = scanner.StreamScanner('a.php')
+    scanner.read_stream_into(FakeResponse(body, chunk_size=5), stream)
+    local = scanner.scan_local_file('a.php', data=body)
+    assert sorted(f['rule'] for f in stream.finish()) == sorted(f['rule'] for f in local['findings'])
+
+
+def test_feed_without_raw_bytes_encodes_text(scanner):
+    stream = scanner.StreamScanner('a.php')
+    stream.feed('<?php echo "é";')
+    stream.finish()
+    assert stream.hasher.hexdigest() == scanner.calculate_file_hash('<?php echo "é";'.encode('utf-8'))
+
+
+def test_non_php_response_is_not_truncated(scanner):
+    body = b'<html>' + b'<p>plain page</p>\n' * 2000
+    stream = scanner.StreamScanner('page.html', window_size=8192)
+    complete, truncated = scanner.read_stream_into(FakeResponse(body, chunk_size=4096), stream)
+    assert stream.is_php is False
+    assert (complete, truncated) == (False, False)
+
+
+def test_size_cap_marks_truncated(scanner):
+    body = b'<?php\n' + b'$a = 1;\n' * 2000
+    stream = scanner.StreamScanner('a.php', window_size=8192)
+    assert scanner.read_stream_into(FakeResponse(body, chunk_size=4096), stream, max_bytes=6000) == (False, True)
+
+
+def test_saturated_score_marks_truncated(scanner):
+    body = b'<?php\n' + b'eval(base64_decode($_POST["x"])); system($_GET["c"]);\n' * 2000
+    stream = scanner.StreamScanner('a.php', window_size=8192)
+    complete, truncated = scanner.read_stream_into(FakeResponse(body, chunk_size=4096), stream)
+    assert stream.saturated
+    assert (complete, truncated) == (False, True)
+
+
+def stream_findings(scanner, body, window_size):
+    stream = scanner.StreamScanner('page.php', window_size=window_size, overlap=512)
+    scanner.read_stream_into(FakeResponse(body, chunk_size=1000), stream)
+    return stream.finish()
+
+
+HTML_BEFORE_TAG = (b'<html><body><p>run system("ls") here</p>\n' + b'<p>filler text</p>\n' * 400
+                   + b'<?php echo 1; ?>\n<p>eval($x)</p>\n')
+NO_OPEN_TAG = b'// snippet\n' + b'$a = 1;\n' * 1000 + b'system($_GET["c"]);\n'
+# "<?" ท้าย window แรกเป็นต้นของ <?xml ไม่ใช่ open tag ทั้งไฟล์จึงเป็น code
+XML_AT_BOUNDARY = b'system("ls");\n' + b'x' * 4080 + b'<?xml version="1.0"?>\n<a>b</a>\n' + b'y\n' * 3000
+
+
+@pytest.mark.parametrize('body', [HTML_BEFORE_TAG, NO_OPEN_TAG, XML_AT_BOUNDARY])
+@pytest.mark.parametrize('window_size', [4096, 8192, 1024 * 1024])
+def test_stream_open_tag_decided_for_whole_file(scanner, body, window_size):
+    from conftest import finding_keys
+    expected = scanner.scan_file(body.decode('utf-8'), 'page.php')
+    assert finding_keys(stream_findings(scanner, body, window_size)) == finding_keys(expected)
+
+
+def test_html_before_first_tag_is_not_code(scanner):
+    rules = {finding['rule'] for finding in stream_findings(scanner, HTML_BEFORE_TAG, 4096)}
+    assert 'function/system' not in rules and 'function/eval' not in rules
+    rules = {finding['rule'] for finding in stream_findings(scanner, NO_OPEN_TAG, 4096)}
+    assert 'function/system' in rules
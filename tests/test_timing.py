@@ -0,0 +1,126 @@
+"""PhaseTimer, ScanProfiler และตารางเวลา (performance) ในสรุปผลและรายงาน JSON"""
+import json
+import threading
+import time
+
+from conftest import FakeSession
+
+
+def test_phase_timer_accumulates_and_merges(scanner, monkeypatch):
+    ticks = iter([10.0, 10.5, 20.0, 20.25])
+    monkeypatch.setattr(scanner.time, 'perf_counter', lambda: next(ticks))
+    timer = scanner.PhaseTimer()
+    with timer.phase('request'):
+        pass
+    with timer.phase('request'):
+        pass
+    timer.add_phase('transfer', 1.0)
+    timer.add_rule('xss/0', 0.5, 2)
+    timer.add_rule('xss/0', 0.25, 1)
+    assert timer.phases == {'request': 0.75, 'transfer': 1.0}
+    assert timer.rules == {'xss/0': [0.75, 3]}
+    assert timer.total == 1.75
+
+    other = scanner.PhaseTimer()
+    other.add_phase('transfer', 0.5)
+    other.add_phase('entropy', 0.1)
+    other.add_rule('xss/0', 0.25, 1)
+    other.add_rule('function/*', 0.1)
+    timer.merge(other)
+    assert timer.as_dict() == {
+        'phases': {'request': 0.75, 'transfer': 1.5, 'entropy': 0.1},
+        'rules': {'xss/0': [1.0, 4], 'function/*': [0.1, 0]},
+    }
+
+
+def test_scan_records_phases_and_rules(scanner):
+    timer = scanner.PhaseTimer()
+    scanner.scan_content('<?php eval($_GET["c"]);\n' * 20, 'a.php', timer=timer)
+    assert timer.rules['function/*'][1] == 20
+    assert timer.total > 0
+
+
+def timings(phases, rules=None):
+    return {'phases': phases, 'rules': rules or {}}
+
+
+def test_performance_tables(scanner, monkeypatch):
+    monkeypatch.setattr(scanner, 'SLOWEST_LIMIT', 2)
+    stats = scanner.SummaryStats()
+    for url, phases, rules in [
+        ('https://a.example/1.php', {'request': 1.0, 'transfer': 0.5, 'patterns': 0.1}, {'xss/0': [0.1, 1]}),
+        ('https://a.example/2.php', {'request': 2.0, 'patterns': 0.2}, {'xss/0': [0.2, 0], 'sql/0': [0.5, 3]}),
+        ('https://b.example/3.php', {'request': 0.1}, {}),
+    ]:
+        stats.add({'url': url, 'findings': [], 'risk_level': 'CLEAN', 'hash': url,
+                   'timings': timings(phases, rules)})
+    stats.add_crawl_timings(timings({'request': 0.3}))
+
+    performance = stats.performance(limit=2)
+    assert performance['phases'] == {'request': 3.1, 'transfer': 0.5, 'patterns': 0.3, 'crawl_request': 0.3}
+    assert performance['slowest_rules'] == [
+        {'rule': 'sql/0', 'seconds': 0.5, 'matches': 3, 'files': 1, 'ms_per_file': 500.0},
+        {'rule': 'xss/0', 'seconds': 0.3, 'matches': 1, 'files': 2, 'ms_per_file': 150.0},
+    ]
+    # เวลาของ host นับเฉพาะ request + transfer
+    assert performance['slowest_hosts'] == [
+        {'host': 'a.example', 'seconds': 3.5, 'files': 2, 'avg_seconds': 1.75},
+        {'host': 'b.example', 'seconds': 0.1, 'files': 1, 'avg_seconds': 0.1},
+    ]
+    assert [item['url'] for item in performance['slowest_files']] == [
+        'https://a.example/2.php', 'https://a.example/1.php']
+
+
+def test_json_export_contains_performance(scanner):
+    results = [scanner.scan_local_file('https://a.example/x.php', data=b'<?php system($_GET["c"]);\n')]
+    report = json.loads(scanner.export_detailed_json(results))
+    assert set(report) == {'performance', 'clusters', 'results'}
+    assert report['performance']['slowest_files'][0]['url'] == 'https://a.example/x.php'
+    assert any(rule['rule'] == 'function/*' for rule in report['performance']['slowest_rules'])
+    assert report['results'][0]['timings']['phases']
+
+
+class ExclusiveProfile:
+    """แทน cProfile.Profile: เปิดพร้อมกันได้ทีละตัวเหมือน sys.monitoring ใน Python 3.12+"""
+    active = 0
+    lock = threading.Lock()
+
+    def enable(self):
+        with self.lock:
+            if ExclusiveProfile.active:
+                raise ValueError('Another profiling tool is already active')
+            ExclusiveProfile.active += 1
+
+    def disable(self):
+        with self.lock:
+            ExclusiveProfile.active -= 1
+
+
+def test_profiled_calls_do_not_overlap(scanner, monkeypatch):
+    monkeypatch.setattr(scanner.cProfile, 'Profile', ExclusiveProfile)
+    monkeypatch.setattr(scanner.pstats, 'Stats', lambda *profiles: profiles)
+    profiler = scanner.ScanProfiler()
+    errors = []
+
+    def worker():
+        try:
+            scanner.profiled_call(profiler, time.sleep, 0.01)
+        except ValueError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert len(profiler.stats()) == 8
+
+
+def test_profiled_concurrent_scan(scanner, monkeypatch):
+    pages = {f'https://a.example/{n}.php': b'<?php eval($_GET["c"]);\n' for n in range(6)}
+    monkeypatch.setattr(scanner, 'create_session', lambda pool_size=10: FakeSession(pages))
+    profiler = scanner.ScanProfiler()
+    results = dict(scanner.scan_urls_concurrently(list(pages), max_workers=3, profiler=profiler))
+    assert all(result['status'] == 'success' for result in results.values())
+    assert 'scan_url' in profiler.top(limit=50)
@@ -0,0 +1,55 @@
+"""Phase 2: ดึงและสแกนหลาย URL พร้อมกัน โดยเว้นระยะ request ต่อ host"""
+import threading
+import time
+
+from conftest import FakeSession
+
+
+def request_times(limiter, urls):
+    times = {}
+    lock = threading.Lock()
+
+    def worker(url):
+        limiter.wait(url)
+        with lock:
+            times.setdefault(url.split('/')[2], []).append(time.monotonic())
+
+    threads = [threading.Thread(target=worker, args=(url,)) for url in urls]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return times
+
+
+def test_rate_limiter_spaces_requests_to_same_host(scanner):
+    delay = 0.05
+    urls = [f'https://a.example/{n}.php' for n in range(4)] + ['https://b.example/x.php']
+    started = time.monotonic()
+    times = request_times(scanner.HostRateLimiter(delay), urls)
+
+    same_host = sorted(times['a.example'])
+    for earlier, later in zip(same_host, same_host[1:]):
+        assert later - earlier >= delay * 0.9
+    # host อื่นไม่ต้องรอคิวของ a.example
+    assert times['b.example'][0] - started < delay
+
+
+def test_rate_limiter_without_delay_does_not_wait(scanner):
+    started = time.monotonic()
+    request_times(scanner.HostRateLimiter(0), [f'https://a.example/{n}.php' for n in range(20)])
+    assert time.monotonic() - started < 0.5
+
+
+def test_scan_urls_concurrently_returns_every_index(scanner, monkeypatch):
+    pages = {f'https://a.example/{n}.php': (b'<?php eval($_GET["c"]);\n' if n % 2 else b'<?php echo 1;\n')
+             for n in range(10)}
+    monkeypatch.setattr(scanner, 'create_session', lambda pool_size=10: FakeSession(pages))
+    urls = list(pages) + ['https://a.example/missing.php']
+
+    results = dict(scanner.scan_urls_concurrently(urls, max_workers=4))
+    assert sorted(results) == list(range(len(urls)))
+    for i, url in enumerate(urls):
+        assert results[i]['url'] == url
+    assert [results[i]['score'] > 0 for i in range(10)] == [n % 2 == 1 for n in range(10)]
+    assert results[10]['status'] == 'failed'
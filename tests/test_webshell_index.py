@@ -0,0 +1,103 @@
+"""WebshellIndex: ไฟล์ที่แก้จากตัวอย่างเพียงเล็กน้อยต้องถูกระบุเป็นตระกูลของตัวอย่างนั้น"""
+import json
+import random
+
+import pytest
+
+WORDS = ['$cmd', '$_POST', 'base64_decode', 'echo', 'foreach', '$file', 'fopen', 'upload',
+         'chmod', '$dir', 'scandir', 'header', '$pass', 'md5', 'exec', 'print', 'isset',
+         'str_replace', 'unlink', 'mkdir', '$output', 'htmlspecialchars', 'session_start']
+
+
+def webshell(seed, lines=120):
+    """โค้ด PHP สุ่มแบบ deterministic: seed ต่างกันได้ตัวอย่างที่ไม่เหมือนกัน"""
+    rng = random.Random(seed)
+    body = [' '.join(rng.choice(WORDS) + f'_{rng.randrange(1000)}' for _ in range(6)) + ';'
+            for _ in range(lines)]
+    return '<?php\n' + '\n'.join(body) + '\n'
+
+
+def near_duplicate(source, seed=99):
+    """เปลี่ยนย่อหน้า ตัวพิมพ์ และแก้ราว 1 ใน 6 บรรทัด แบบที่ผู้โจมตีทำกับ webshell ที่ปล่อยซ้ำ"""
+    rng = random.Random(seed)
+    lines = source.split('\n')
+    changed = rng.sample(range(1, len(lines) - 1), 30)
+    for n in changed[:10]:
+        lines[n] = '    ' + lines[n].upper()
+    for n in changed[10:]:
+        lines[n] = f'$patched_{rng.randrange(10 ** 6)} = {rng.choice(WORDS)}_{n};'
+    lines.insert(10, '// patched by someone')
+    return '\r\n'.join(lines)
+
+
+@pytest.fixture
+def samples(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    root = tmp_path / 'samples'
+    for family, seeds in {'alpha': (1, 2), 'beta': (3,)}.items():
+        (root / family).mkdir(parents=True)
+        for seed in seeds:
+            (root / family / f'{family}{seed}.php').write_text(webshell(seed), encoding='utf-8')
+    (root / 'gamma.php').write_text(webshell(4), encoding='utf-8')
+    (root / 'tiny').mkdir()
+    (root / 'tiny' / 'short.php').write_text('<?php eval($x);', encoding='utf-8')
+    return root
+
+
+def test_index_families_skip_short_samples(scanner, samples):
+    index = scanner.load_webshell_index([str(samples)])
+    assert index.families == ['alpha', 'beta', 'gamma']
+    assert len(index.samples) == 4
+
+
+def test_near_duplicate_is_attributed(scanner, samples):
+    index = scanner.load_webshell_index([str(samples)])
+    findings = index.findings(near_duplicate(webshell(2)))
+    assert [finding['rule'] for finding in findings] == ['similarity/alpha']
+    assert findings[0]['severity'] == 'critical'
+    assert 'alpha2.php' in findings[0]['description']
+
+    score, sample = index.lookup(scanner.similarity_signature(near_duplicate(webshell(3))))[0]
+    assert sample['family'] == 'beta'
+    assert score >= scanner.SIMILARITY_THRESHOLD
+
+
+def test_unrelated_and_short_content_are_not_attributed(scanner, samples):
+    index = scanner.load_webshell_index([str(samples)])
+    assert index.findings(webshell(42)) == []
+    assert index.findings('<?php eval($x);') == []
+
+
+def test_streamed_sketch_equals_whole_file(scanner):
+    data = near_duplicate(webshell(5)).encode('utf-8')
+    sketch = scanner.SimilaritySketch()
+    for start in range(0, len(data), 7):
+        sketch.update(data[start:start + 7])
+    assert (sketch.signature() == scanner.similarity_signature(data)).all()
+
+
+def test_index_file_round_trip(scanner, samples, tmp_path):
+    index = scanner.load_webshell_index([str(samples)])
+    exported = tmp_path / 'index.json'
+    exported.write_text(json.dumps({'params': scanner.similarity_params(), 'samples': index.samples}),
+                        encoding='utf-8')
+    reloaded = scanner.load_webshell_index([str(exported)])
+    assert reloaded.version == index.version
+    assert reloaded.findings(near_duplicate(webshell(1)))[0]['rule'] == 'similarity/alpha'
+
+    exported.write_text(json.dumps({'params': [1, 2, 3, 4], 'samples': []}), encoding='utf-8')
+    with pytest.raises(scanner.WebshellIndexError, match='different similarity settings'):
+        scanner.load_webshell_index([str(exported)])
+
+
+def test_scans_report_family(scanner, samples, monkeypatch):
+    monkeypatch.setattr(scanner, 'WEBSHELL_INDEX', scanner.WEBSHELL_INDEX)
+    scanner.activate_webshell_index([str(samples)])
+    data = near_duplicate(webshell(3)).encode('utf-8')
+
+    local = scanner.scan_local_file('upload.php', data=data)
+    assert 'similarity/beta' in {finding['rule'] for finding in local['findings']}
+
+    stream = scanner.StreamScanner('upload.php')
+    stream.feed(data.decode('utf-8'), data)
+    assert 'similarity/beta' in {finding['rule'] for finding in stream.finish()}